@@ -0,0 +1,240 @@
+# Reproducible synthetic dataset for capacity tests: pet types (with their embedded pets) of any number
+# of stores and a transaction history, written straight to Mongo in the documents the services store.
+# The same --seed and parameters always produce the same data.
+#
+#   python benchmarks/dataset.py --types 500 --pets-per-type 200 --skew 1.1 --transactions 1000000
+#   python benchmarks/dataset.py --stores 1,2,3 --vocabulary 400 --born-from 2005-01-01 --drop
+#
+# Pets per pet type follow a Zipf distribution (--skew 0 = every type gets --pets-per-type pets), so a
+# few pet types carry large "_pets" documents. Attributes are drawn from a vocabulary of --vocabulary
+# words with Zipf popularity, so hasAttribute filters range from very common to rare words.
+# Transactions go through the ledger of pet-order and land in its time buckets (--ledger-partition).
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from itertools import accumulate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAMILIES = [
+    ("Canidae", "Canis"), ("Felidae", "Felis"), ("Felidae", "Panthera"), ("Equidae", "Equus"),
+    ("Leporidae", "Oryctolagus"), ("Psittacidae", "Ara"), ("Cyprinidae", "Carassius"), ("Muridae", "Mus"),
+]
+COMMON_ATTRIBUTES = [
+    "loyal", "calm", "friendly", "playful", "intelligent", "curious", "gentle", "energetic", "independent",
+    "affectionate", "alert", "social", "quiet", "protective", "stubborn", "shy", "vocal", "active",
+]
+NAME_STEMS = ["max", "bella", "luna", "charlie", "lucy", "cooper", "daisy", "milo", "coco", "rocky",
+              "lola", "bailey", "ruby", "teddy", "nala", "oscar", "rosie", "leo", "zoe", "buddy"]
+MAX_PETS_PER_DOCUMENT = 50000     # keeps a pet type document well below Mongo's 16 MB limit
+INSERT_BATCH_PETS = 100000        # pets per insert_many
+
+
+# Attribute vocabulary of `size` words: common temperament words, then numbered traits
+def vocabulary(size):
+    words = COMMON_ATTRIBUTES[:size]
+    return words + [f"trait{i}" for i in range(size - len(words))]
+
+
+# Zipf weights 1 / rank^skew of n ranks
+def zipf_weights(n, skew):
+    return [1.0 / (rank ** skew) for rank in range(1, n + 1)]
+
+
+# Pets of each of `types` pet types: `pets_per_type` on average, Zipf-skewed, in random type order
+def pet_counts(rng, types, pets_per_type, skew, max_pets=MAX_PETS_PER_DOCUMENT):
+    weights = zipf_weights(types, skew)
+    total = sum(weights)
+    counts = [min(max_pets, round(types * pets_per_type * w / total)) for w in weights]
+    rng.shuffle(counts)
+    return counts
+
+
+def random_day(rng, start, end):
+    return start + timedelta(days=rng.randrange((end - start).days + 1))
+
+
+# One pet type document in the format of pet-store (see create_pet_type / create_pet in pet_store/app.py)
+def pet_type_doc(rng, type_id, pet_count, vocab, attribute_cum_weights, born_from, born_to,
+                 na_rate=0.2, picture_rate=0.0, attributes=(2, 6)):
+    family, genus = FAMILIES[rng.randrange(len(FAMILIES))]
+    # Distinct words, popular ones more likely
+    count = min(rng.randint(*attributes), len(vocab))
+    words = []
+    while len(words) < count:
+        word = rng.choices(vocab, cum_weights=attribute_cum_weights)[0]
+        if word not in words:
+            words.append(word)
+    words = [w.capitalize() if i == 0 else w for i, w in enumerate(words)]
+
+    pets = {}
+    index = []
+    for p in range(pet_count):
+        # Names are stored lowercase, as create_pet does
+        name = f"{NAME_STEMS[p % len(NAME_STEMS)]}{p // len(NAME_STEMS)}"
+        if rng.random() < na_rate:
+            birthdate = "NA"
+        else:
+            born = random_day(rng, born_from, born_to)
+            birthdate = born.strftime("%d-%m-%Y")
+            index.append({"d": born.isoformat(), "n": name})
+        picture = f"image{type_id}-{p}.jpg" if rng.random() < picture_rate else "NA"
+        pets[name] = {"name": name, "birthdate": birthdate, "picture": picture}
+    index.sort(key=lambda e: (e["d"], e["n"]))
+
+    return {
+        "id": str(type_id),
+        "type": f"{genus} {type_id}",
+        "family": family,
+        "genus": genus,
+        "attributes": words,
+        "lifespan": None if rng.random() < 0.1 else rng.randint(5, 30),
+        "pets": sorted(pets),
+        "_pets": pets,
+        "_birthdates": index,
+        "_attributes": sorted({w.lower() for w in words}),
+        "_rev": 0,
+    }
+
+
+# Pet type documents of one store, generated lazily
+def pet_type_docs(rng, types, pets_per_type, skew=1.0, vocabulary_size=100, born_from=date(2005, 1, 1),
+                  born_to=date(2024, 12, 31), na_rate=0.2, picture_rate=0.0):
+    vocab = vocabulary(vocabulary_size)
+    attribute_cum_weights = list(accumulate(zipf_weights(len(vocab), 1.0)))
+    for type_id, count in enumerate(pet_counts(rng, types, pets_per_type, skew), start=1):
+        yield pet_type_doc(rng, type_id, count, vocab, attribute_cum_weights, born_from, born_to,
+                           na_rate, picture_rate)
+
+
+# Purchases spread uniformly over [since, until). `types` lists (store id, pet type name, pets) and the
+# pet types are bought in proportion to their size.
+def transaction_docs(rng, count, types, since, until, purchasers=1000):
+    span = (until - since).total_seconds()
+    choices = [(store_id, type_name) for store_id, type_name, _ in types]
+    cum_weights = list(accumulate(pets + 1 for _, _, pets in types))
+    for purchase_id in range(1, count + 1):
+        store_id, type_name = rng.choices(choices, cum_weights=cum_weights)[0]
+        yield {
+            "purchaser": f"buyer{rng.randrange(purchasers)}",
+            "pet-type": type_name,
+            "store": int(store_id) if store_id.isdigit() else store_id,
+            "pet-name": f"sold{purchase_id}",
+            "purchase-id": str(purchase_id),
+            "_ts": since + timedelta(seconds=rng.random() * span),
+        }
+
+
+def insert_pet_types(collection, docs):
+    batch = []
+    pets = 0
+    written = 0
+    for doc in docs:
+        batch.append(doc)
+        pets += len(doc["pets"])
+        if pets >= INSERT_BATCH_PETS:
+            collection.insert_many(batch, ordered=False)
+            written += len(batch)
+            batch, pets = [], 0
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        written += len(batch)
+    return written
+
+
+# Writes the transactions through pet-order's ledger, so they land in its time buckets
+def insert_transactions(db, docs, partition="month", batch_size=10000):
+    sys.path.insert(0, os.path.join(ROOT, "pet_order"))
+    from ledger import PartitionedLedger
+
+    ledger = PartitionedLedger(db, "transactions", partition=partition)
+    batch = []
+    written = 0
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            ledger.insert_many(batch, ordered=False)
+            written += len(batch)
+            batch = []
+    if batch:
+        ledger.insert_many(batch, ordered=False)
+        written += len(batch)
+    return written
+
+
+# Generates and writes the whole dataset into `db`, returns a summary
+def generate(db, store_ids=("1", "2"), types=100, pets_per_type=100, skew=1.0, vocabulary_size=100,
+             born_from=date(2005, 1, 1), born_to=date(2024, 12, 31), na_rate=0.2, picture_rate=0.0,
+             transactions=0, history_days=365, ledger_partition="month", seed=0, drop=False):
+    summary = {"seed": seed, "stores": {}, "transactions": 0}
+    sizes = []      # (store id, pet type name, pets) - all the transactions need
+    for store_id in store_ids:
+        collection = db[f"pet_store{store_id}"]
+        if drop:
+            collection.drop()
+        rng = random.Random(f"{seed}-store-{store_id}")
+        store_sizes = []
+
+        def track(docs):
+            for doc in docs:
+                store_sizes.append(len(doc["pets"]))
+                sizes.append((store_id, doc["type"], len(doc["pets"])))
+                yield doc
+
+        insert_pet_types(collection, track(pet_type_docs(
+            rng, types, pets_per_type, skew, vocabulary_size, born_from, born_to, na_rate, picture_rate)))
+        summary["stores"][store_id] = {"types": len(store_sizes), "pets": sum(store_sizes),
+                                       "largest_type": max(store_sizes, default=0)}
+
+    if transactions:
+        if drop:
+            for name in db.list_collection_names():
+                if name == "transactions" or name.startswith("transactions_"):
+                    db[name].drop()
+        until = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        since = until - timedelta(days=history_days)
+        rng = random.Random(f"{seed}-transactions")
+        summary["transactions"] = insert_transactions(
+            db, transaction_docs(rng, transactions, sizes, since, until), ledger_partition)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a reproducible synthetic pet-store dataset to Mongo")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default=os.environ.get("DB_NAME", "petshop"))
+    parser.add_argument("--stores", default="1,2", help="comma separated store ids")
+    parser.add_argument("--types", type=int, default=100, help="pet types per store")
+    parser.add_argument("--pets-per-type", type=int, default=100, help="average pets per pet type")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf skew of the pets per type, 0 = uniform")
+    parser.add_argument("--vocabulary", type=int, default=100, help="distinct attribute words")
+    parser.add_argument("--born-from", type=date.fromisoformat, default=date(2005, 1, 1))
+    parser.add_argument("--born-to", type=date.fromisoformat, default=date(2024, 12, 31))
+    parser.add_argument("--na-rate", type=float, default=0.2, help="share of pets without a birthdate")
+    parser.add_argument("--transactions", type=int, default=0, help="purchases in the ledger")
+    parser.add_argument("--history-days", type=int, default=365, help="days the purchases are spread over")
+    parser.add_argument("--ledger-partition", choices=["month", "day", "none"], default="month")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drop", action="store_true", help="drop the store collections and the ledger first")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+
+    db = MongoClient(args.mongo_url)[args.db_name]
+    t0 = time.perf_counter()
+    summary = generate(
+        db, [s.strip() for s in args.stores.split(",") if s.strip()], args.types, args.pets_per_type, args.skew,
+        args.vocabulary, args.born_from, args.born_to, args.na_rate, transactions=args.transactions,
+        history_days=args.history_days, ledger_partition=args.ledger_partition, seed=args.seed, drop=args.drop)
+    for store_id, store in summary["stores"].items():
+        print(f"store {store_id}: {store['types']} pet types, {store['pets']} pets "
+              f"(largest pet type {store['largest_type']})")
+    print(f"{summary['transactions']} transactions, {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
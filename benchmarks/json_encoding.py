@@ -0,0 +1,89 @@
+# Requests/sec of large list responses with Flask's default JSON provider ("before")
+# and with FastJSONProvider ("after"). Runs in-process with the Flask test client, no Mongo needed.
+#
+#   python benchmarks/json_encoding.py [--items 5000] [--seconds 3]
+
+import argparse
+import importlib.util
+import os
+import time
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_provider():
+    path = os.path.join(ROOT, "pet_store", "json_provider.py")
+    spec = importlib.util.spec_from_file_location("json_provider", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def pet_types(n):
+    return [{
+        "id": str(i),
+        "type": f"Type {i}",
+        "family": "Canidae",
+        "genus": "Canis",
+        "attributes": ["Loyal", "outgoing", "and", "friendly"],
+        "lifespan": 12,
+        "pets": [f"pet{i}-{j}" for j in range(5)],
+    } for i in range(n)]
+
+
+def transactions(n):
+    return [{
+        "purchaser": f"Customer_{i % 97}",
+        "pet-type": "Golden Retriever",
+        "store": 1 + i % 2,
+        "pet-name": f"pet{i}",
+        "purchase-id": str(i),
+    } for i in range(n)]
+
+
+def make_app(provider_class, payloads):
+    app = Flask("bench")
+    app.json = provider_class(app)
+
+    @app.route("/<name>")
+    def payload(name):
+        return jsonify(payloads[name]), 200
+
+    return app
+
+
+# Returns requests/sec of GET /<name> over `seconds`
+def requests_per_sec(app, name, seconds):
+    client = app.test_client()
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        client.get(f"/{name}").get_data()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON encoding benchmark")
+    parser.add_argument("--items", type=int, default=5000, help="array length of each response")
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of each measurement")
+    args = parser.parse_args()
+
+    module = load_provider()
+    payloads = {"pet-types": pet_types(args.items), "transactions": transactions(args.items)}
+    before = make_app(DefaultJSONProvider, payloads)
+    after = make_app(module.FastJSONProvider, payloads)
+
+    print(f"encoder: {'orjson' if module.orjson else 'stdlib'}, items per response: {args.items}")
+    for name in payloads:
+        rps_before = requests_per_sec(before, name, args.seconds)
+        rps_after = requests_per_sec(after, name, args.seconds)
+        print(f"/{name}: before {rps_before:.1f} req/s, after {rps_after:.1f} req/s "
+              f"({rps_after / rps_before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
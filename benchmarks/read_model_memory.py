@@ -0,0 +1,91 @@
+# Memory of the pet-store read model per 100k pets, compared with the same pet types held as the
+# documents pymongo returns, plus the time of the read model lookups behind the GET endpoints.
+# Runs in-process, no Mongo needed.
+#
+#   python benchmarks/read_model_memory.py [--pets 100000] [--types 100] [--skew 0]
+
+import argparse
+import gc
+import importlib.util
+import os
+import random
+import time
+import tracemalloc
+
+import dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_read_model():
+    path = os.path.join(ROOT, "pet_store", "read_model.py")
+    spec = importlib.util.spec_from_file_location("read_model", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Pet type documents in the stored format, `pets` pets spread over `types` pet types, always the same ones
+def pet_type_docs(pets, types, skew):
+    return list(dataset.pet_type_docs(random.Random(0), types, pets // types, skew))
+
+
+# Bytes allocated (and still alive) by build()
+def allocated(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size, result
+
+
+def build_model(read_model, docs):
+    model = read_model.ReadModel(collection=None)
+    model.load_documents(docs)
+    return model
+
+
+def micros_per_call(fn, seconds=1.0):
+    calls = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        fn()
+        calls += 1
+    return (time.perf_counter() - t0) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and lookup time of the pet-store read model")
+    parser.add_argument("--pets", type=int, default=100000)
+    parser.add_argument("--types", type=int, default=100)
+    parser.add_argument("--skew", type=float, default=0.0, help="Zipf skew of the pets per pet type")
+    args = parser.parse_args()
+
+    read_model = load_read_model()
+    scale = 100000 / args.pets
+
+    # The model is loaded from a fresh set of documents, freed again once it is built
+    docs_size, docs = allocated(lambda: pet_type_docs(args.pets, args.types, args.skew))
+    model_size, model = allocated(lambda: build_model(read_model, pet_type_docs(args.pets, args.types, args.skew)))
+
+    print(f"{args.pets} pets in {args.types} pet types")
+    print(f"documents   {docs_size * scale / 2**20:8.1f} MiB per 100k pets")
+    print(f"read model  {model_size * scale / 2**20:8.1f} MiB per 100k pets "
+          f"({model_size / docs_size:.0%} of the documents)")
+
+    spec = {"family": "canidae", "all": ["loyal"]}
+    record = model.get("1")
+    some_pet = next(iter(record.pets))
+    print(f"GET /pet-types/<id>                  {micros_per_call(lambda: model.get('1').to_dict()):8.2f} us")
+    print(f"GET /pet-types?family=&hasAttribute= {micros_per_call(lambda: model.find(spec)):8.2f} us")
+    print(f"GET /pet-types/<id>/pets/<name>      "
+          f"{micros_per_call(lambda: model.get('1').pets[some_pet].to_dict()):8.2f} us")
+    print(f"GET /pet-types/<id>/pets?birthdateGT= "
+          f"{micros_per_call(lambda: model.get('1').pets_born_between('2020-01-01', None)):8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
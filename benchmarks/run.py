@@ -0,0 +1,294 @@
+# Hermetic benchmark suite: starts two pet-stores and pet-order against a local Mongo,
+# with the Animals API and picture hosts replaced by the stubs in benchmarks/stubs.py.
+# No API Ninjas key and no internet access needed.
+#
+#   python benchmarks/run.py --save-baseline         # run, print, write bench_results.json and the baseline
+#   python benchmarks/run.py --tolerance 0.2         # run and compare against the baseline
+#   python benchmarks/run.py --no-baseline           # run without comparing
+#
+# The baseline (benchmarks/baseline.json by default, --baseline to pick another file) holds latencies of
+# one machine, so it is not committed: record it with --save-baseline on the machine that compares, from
+# the commit to compare against. Without a baseline the run stops before starting anything, unless
+# --no-baseline is given.
+#
+# Micro benchmarks call one endpoint at a time; the macro benchmark replays query.txt with
+# concurrent virtual users through query_runner.run_load. --dataset-* preloads both stores and the
+# ledger with synthetic data (benchmarks/dataset.py) to measure at production sizes. With a baseline, the run exits 1
+# when a benchmark's p50 latency or throughput is worse than the baseline by more than --tolerance.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+from pymongo import MongoClient
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import dataset
+import query_runner
+from stubs import Faults, ImageHandler, NinjaHandler, start_stub
+
+OWNER_HEADERS = {"OwnerPC": "LovesPetsL2M3n4"}
+JSON_HEADERS = {"Content-Type": "application/json"}
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+
+# -------------------------
+# Services
+# -------------------------
+
+# Starts one Flask service with `flask run` (no debug reloader), returns the process
+def start_service(name, directory, module, port, env, log_dir):
+    log = open(os.path.join(log_dir, f"{name}.log"), "w")
+    cmd = [sys.executable, "-m", "flask", "--app", module, "run", "--host", "127.0.0.1", "--port", str(port)]
+    return subprocess.Popen(cmd, cwd=os.path.join(ROOT, directory), env={**os.environ, **env},
+                            stdout=log, stderr=subprocess.STDOUT)
+
+
+# Polls url until it answers, returns the seconds it took
+def wait_ready(url, timeout=60):
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        try:
+            if requests.get(url, timeout=2).status_code < 500:
+                return time.perf_counter() - t0
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError(f"Service not ready: {url}")
+
+
+def start_stack(args, ninja_url, log_dir):
+    base_env = {"MONGO_URL": args.mongo_url, "DB_NAME": args.db_name}
+    store_env = {**base_env, "NINJA_API_KEY": "bench", "NINJA_API_URL": f"{ninja_url}/v1/animals",
+                 "PICTURES_DIR": args.pictures_dir}
+    urls = {
+        "store1": f"http://127.0.0.1:{args.port}",
+        "store2": f"http://127.0.0.1:{args.port + 1}",
+        "order": f"http://127.0.0.1:{args.port + 2}",
+    }
+    procs = [
+        start_service("pet-store1", "pet_store", "app", args.port, {**store_env, "STORE_ID": "1"}, log_dir),
+        start_service("pet-store2", "pet_store", "app", args.port + 1, {**store_env, "STORE_ID": "2"}, log_dir),
+        start_service("pet-order", "pet_order", "pet_order", args.port + 2,
+                      {**base_env, "STORE1_URL": urls["store1"], "STORE2_URL": urls["store2"]}, log_dir),
+    ]
+    # Stores: time until the process serves HTTP (/livez) and until it is initialized (/readyz)
+    startup = {}
+    for name in ("store1", "store2"):
+        startup[f"pet-{name}-live"] = wait_ready(urls[name] + "/livez")
+        startup[f"pet-{name}"] = startup[f"pet-{name}-live"] + wait_ready(urls[name] + "/readyz")
+    startup["pet-order"] = wait_ready(urls["order"] + "/transactions")
+    return procs, urls, startup
+
+
+def stop_stack(procs):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# -------------------------
+# Measurement
+# -------------------------
+
+# Calls fn(i) for i in range(iterations); fn returns True on the expected response
+def measure(fn, iterations):
+    latencies = []
+    errors = 0
+    t0 = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        try:
+            ok = fn(i)
+        except requests.RequestException:
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        errors += 0 if ok else 1
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    pct = lambda p: round(query_runner._percentile(latencies, p) * 1000, 3)
+    return {
+        "count": iterations,
+        "errors": errors,
+        "throughput_rps": round(iterations / elapsed, 3) if elapsed else 0,
+        "latency_ms": {"p50": pct(50), "p95": pct(95), "p99": pct(99)},
+    }
+
+
+def micro_benchmarks(urls, image_url, n):
+    s = requests.Session()
+    store, order = urls["store1"], urls["order"]
+    results = {}
+    type_ids = []
+
+    def create_type(i):
+        r = s.post(f"{store}/pet-types", json={"type": f"benchtype{i}"}, headers=JSON_HEADERS)
+        if r.status_code == 201:
+            type_ids.append(r.json()["id"])
+        return r.status_code == 201
+
+    results["pet_type_create"] = measure(create_type, n)
+    tid = type_ids[0]
+    family = s.get(f"{store}/pet-types/{tid}").json()["family"]
+
+    results["pet_types_list"] = measure(lambda i: s.get(f"{store}/pet-types").ok, n)
+    results["pet_types_filter_family"] = measure(lambda i: s.get(f"{store}/pet-types", params={"family": family}).ok, n)
+    results["pet_types_filter_attribute"] = measure(
+        lambda i: s.get(f"{store}/pet-types", params={"hasAttribute": "calm"}).ok, n)
+
+    # 2n pets: n are deleted through the store, n are bought through pet-order
+    def create_pet(i):
+        pet = {"name": f"pet{i}", "birthdate": f"{1 + i % 28:02d}-{1 + i % 12:02d}-{2010 + i % 12}"}
+        return s.post(f"{store}/pet-types/{tid}/pets", json=pet, headers=JSON_HEADERS).status_code == 201
+
+    results["pet_create"] = measure(create_pet, 2 * n)
+    results["pet_get"] = measure(lambda i: s.get(f"{store}/pet-types/{tid}/pets/pet{i}").ok, n)
+    results["pets_filter_birthdate"] = measure(
+        lambda i: s.get(f"{store}/pet-types/{tid}/pets", params={"birthdateGT": "01-01-2015"}).ok, n)
+    results["pet_update"] = measure(lambda i: s.put(
+        f"{store}/pet-types/{tid}/pets/pet{i}", json={"name": f"pet{i}", "birthdate": "01-01-2020"},
+        headers=JSON_HEADERS).ok, n)
+    results["pet_delete"] = measure(lambda i: s.delete(f"{store}/pet-types/{tid}/pets/pet{i}").status_code == 204, n)
+
+    pictures = []
+
+    def create_pet_with_picture(i):
+        pet = {"name": f"pic{i}", "picture-url": f"{image_url}/pic{i}.{'png' if i % 2 else 'jpg'}"}
+        r = s.post(f"{store}/pet-types/{type_ids[1]}/pets", json=pet, headers=JSON_HEADERS)
+        if r.status_code == 201:
+            pictures.append(r.json()["picture"])
+        return r.status_code == 201
+
+    results["pet_create_with_picture"] = measure(create_pet_with_picture, n)
+    results["picture_serve"] = measure(lambda i: s.get(f"{store}/pictures/{pictures[i % len(pictures)]}").ok, n)
+
+    results["purchase"] = measure(lambda i: s.post(
+        f"{order}/purchases", json={"purchaser": f"bench{i}", "pet-type": "benchtype0", "store": 1},
+        headers=JSON_HEADERS).status_code == 201, n)
+    results["transactions"] = measure(lambda i: s.get(f"{order}/transactions", headers=OWNER_HEADERS).ok, n)
+    return results
+
+
+def macro_benchmark(urls, users, duration):
+    query_runner.BASE1, query_runner.BASE2, query_runner.ORDER = urls["store1"], urls["store2"], urls["order"]
+    query_runner.seed_data()
+    ops = query_runner.parse_script(os.path.join(ROOT, "query.txt"))
+    with tempfile.TemporaryDirectory() as tmp:
+        results = query_runner.run_load(ops, users=users, duration=duration,
+                                        results_file=os.path.join(tmp, "load_results.json"))
+    return {f"load_{op}": summary for op, summary in results["operations"].items()}
+
+
+# -------------------------
+# Baseline comparison
+# -------------------------
+
+# Returns a list of human readable regressions of `results` against `baseline`
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, base in baseline.get("benchmarks", {}).items():
+        cur = results["benchmarks"].get(name)
+        if cur is None:
+            continue
+        p50, base_p50 = cur["latency_ms"]["p50"], base["latency_ms"]["p50"]
+        if base_p50 and p50 > base_p50 * (1 + tolerance):
+            regressions.append(f"{name}: p50 {p50} ms vs baseline {base_p50} ms")
+        rps, base_rps = cur["throughput_rps"], base["throughput_rps"]
+        if base_rps and rps < base_rps * (1 - tolerance):
+            regressions.append(f"{name}: {rps} req/s vs baseline {base_rps} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hermetic pet-store / pet-order benchmarks")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="petshop_bench")
+    parser.add_argument("--port", type=int, default=6001, help="first of three service ports")
+    parser.add_argument("-n", "--iterations", type=int, default=200, help="calls per micro benchmark")
+    parser.add_argument("--users", type=int, default=8, help="virtual users of the macro benchmark")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of the macro benchmark, 0 to skip")
+    parser.add_argument("--ninja-latency-ms", type=float, default=0.0)
+    parser.add_argument("--image-latency-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="injected failure rate of both stubs")
+    parser.add_argument("--results", default="bench_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--no-baseline", action="store_true", help="do not compare against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    # Synthetic data loaded into both stores and the ledger before the services start (see dataset.py)
+    parser.add_argument("--dataset-types", type=int, default=0, help="pet types per store, 0 = start empty")
+    parser.add_argument("--dataset-pets-per-type", type=int, default=100)
+    parser.add_argument("--dataset-skew", type=float, default=1.0)
+    parser.add_argument("--dataset-transactions", type=int, default=0)
+    parser.add_argument("--dataset-seed", type=int, default=0)
+    args = parser.parse_args()
+    compare_baseline = not args.save_baseline and not args.no_baseline
+    if compare_baseline and not os.path.exists(args.baseline):
+        parser.error(f"no baseline at {args.baseline} - record one on this machine with --save-baseline, "
+                     "or run with --no-baseline")
+
+    mongo = MongoClient(args.mongo_url)
+    mongo.drop_database(args.db_name)
+    data = None
+    if args.dataset_types or args.dataset_transactions:
+        data = dataset.generate(mongo[args.db_name], ("1", "2"), args.dataset_types, args.dataset_pets_per_type,
+                                args.dataset_skew, transactions=args.dataset_transactions, seed=args.dataset_seed)
+    _, ninja_url = start_stub(NinjaHandler, faults=Faults(args.ninja_latency_ms, failure_rate=args.failure_rate))
+    _, image_url = start_stub(ImageHandler, faults=Faults(args.image_latency_ms, failure_rate=args.failure_rate))
+
+    log_dir = os.path.join(BENCH_DIR, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    pictures_dir = tempfile.TemporaryDirectory()
+    args.pictures_dir = pictures_dir.name
+    procs, urls, startup = start_stack(args, ninja_url, log_dir)
+    try:
+        benchmarks = micro_benchmarks(urls, image_url, args.iterations)
+        if args.duration > 0:
+            benchmarks.update(macro_benchmark(urls, args.users, args.duration))
+    finally:
+        stop_stack(procs)
+        mongo.drop_database(args.db_name)
+        pictures_dir.cleanup()
+
+    results = {
+        "startup_s": {name: round(sec, 3) for name, sec in startup.items()},
+        "benchmarks": benchmarks,
+    }
+    if data is not None:
+        results["dataset"] = data
+    with open(args.results, "w", encoding="utf-8") as out:
+        json.dump(results, out, indent=2)
+
+    for name, b in benchmarks.items():
+        lat = b["latency_ms"]
+        print(f"{name:28} {b['throughput_rps']:>10} req/s  p50 {lat['p50']:>8} ms  p95 {lat['p95']:>8} ms"
+              f"  p99 {lat['p99']:>8} ms  errors {b['errors']}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=2)
+        print(f"baseline saved to {args.baseline}")
+    elif compare_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# Local stand-ins for the external services pet-store depends on:
+#   - an Animals API stub answering like https://api.api-ninjas.com/v1/animals for any name
+#   - an image server returning small JPEG / PNG files
+# Both can inject latency and failures, set on the command line or at runtime with
+#   POST /_config {"latency_ms": 50, "jitter_ms": 10, "failure_rate": 0.1, "failure_status": 503}
+#
+#   python benchmarks/stubs.py [--ninja-port 8901] [--image-port 8902] [--latency-ms 0] [--failure-rate 0]
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FAMILIES = [("Canidae", "Canis"), ("Felidae", "Felis"), ("Bovidae", "Bos"), ("Equidae", "Equus"),
+            ("Leporidae", "Oryctolagus"), ("Psittacidae", "Ara"), ("Cyprinidae", "Carassius")]
+TEMPERAMENTS = ["Loyal, outgoing, and friendly", "Intelligent and curious", "Gentle, calm and affectionate",
+                "Playful; energetic; social", "Independent and quiet", "Alert, brave and protective"]
+
+# Smallest valid files - enough for the picture signature checks of pet-store
+PNG_BYTES = (b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89"
+             b"\x00\x00\x00\rIDATx\x9cc\xf8\x0f\x00\x00\x01\x01\x00\x05\x18\xd8N\x00\x00\x00\x00IEND\xaeB`\x82")
+JPEG_BYTES = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00" + b"\x00" * 64 + b"\xff\xd9"
+
+
+# Latency / failure injection shared by the handlers of one stub server
+class Faults:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, failure_status=503):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def update(self, values):
+        for key in ("latency_ms", "jitter_ms", "failure_rate", "failure_status"):
+            if key in values:
+                setattr(self, key, type(getattr(self, key))(values[key]))
+
+    def as_dict(self):
+        return {"latency_ms": self.latency_ms, "jitter_ms": self.jitter_ms, "failure_rate": self.failure_rate,
+                "failure_status": self.failure_status, "requests": self.requests, "failures": self.failures}
+
+    # Sleeps for the configured latency, returns the status to fail with or None
+    def apply(self):
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        with self.lock:
+            self.requests += 1
+            if self.failure_rate and random.random() < self.failure_rate:
+                self.failures += 1
+                return self.failure_status
+        return None
+
+
+# Deterministic Animals API entry for any name, so the same type always gets the same data
+def animal_entry(name):
+    digest = hashlib.sha1(name.lower().encode("utf-8")).digest()
+    family, genus = FAMILIES[digest[0] % len(FAMILIES)]
+    return {
+        "name": name,
+        "taxonomy": {"family": family, "genus": genus},
+        "characteristics": {
+            "temperament": TEMPERAMENTS[digest[1] % len(TEMPERAMENTS)],
+            "lifespan": f"{8 + digest[2] % 10} - {12 + digest[2] % 10} years",
+        },
+    }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    faults = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/_config":
+            return self._send(404)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.faults.update(json.loads(self.rfile.read(length) or b"{}"))
+        self._send(200, json.dumps(self.faults.as_dict()).encode())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/_config":
+            return self._send(200, json.dumps(self.faults.as_dict()).encode())
+        status = self.faults.apply()
+        if status is not None:
+            return self._send(status, b'{"error": "injected failure"}')
+        self.handle_get(url)
+
+
+class NinjaHandler(_StubHandler):
+    def handle_get(self, url):
+        if url.path != "/v1/animals":
+            return self._send(404)
+        if not self.headers.get("X-Api-Key"):
+            return self._send(401, b'{"error": "missing api key"}')
+        name = parse_qs(url.query).get("name", [""])[0]
+        # Names starting with "unknown" behave like animals the real API does not know
+        data = [] if not name or name.lower().startswith("unknown") else [animal_entry(name)]
+        self._send(200, json.dumps(data).encode())
+
+
+class ImageHandler(_StubHandler):
+    def handle_get(self, url):
+        if url.path.endswith(".png"):
+            return self._send(200, PNG_BYTES, "image/png")
+        if url.path.endswith(".jpg") or url.path.endswith(".jpeg"):
+            return self._send(200, JPEG_BYTES, "image/jpeg")
+        if url.path.endswith(".txt"):
+            return self._send(200, b"not an image", "text/plain")
+        self._send(404)
+
+
+# Starts a stub server in a daemon thread, returns (server, base_url)
+def start_stub(handler_class, port=0, faults=None):
+    handler = type(handler_class.__name__, (handler_class,), {"faults": faults or Faults()})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Animals API and image server stubs")
+    parser.add_argument("--ninja-port", type=int, default=8901)
+    parser.add_argument("--image-port", type=int, default=8902)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-status", type=int, default=503)
+    args = parser.parse_args()
+
+    fault_args = (args.latency_ms, args.jitter_ms, args.failure_rate, args.failure_status)
+    _, ninja_url = start_stub(NinjaHandler, args.ninja_port, Faults(*fault_args))
+    _, image_url = start_stub(ImageHandler, args.image_port, Faults(*fault_args))
+    print(f"Animals API stub: NINJA_API_URL={ninja_url}/v1/animals")
+    print(f"image server:     {image_url}/<name>.png | .jpg")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
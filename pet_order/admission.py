@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from collections import deque
+from statistics import median
+
+from flask import g, jsonify, request
+
+from metrics import ADMISSION_INFLIGHT, ADMISSION_LIMIT, ADMISSION_SHED
+
+# -------------------------
+# Admission control
+# -------------------------
+# Off by default. Caps the in-flight requests of the routes in ADMISSION_ROUTES (comma separated
+# "METHOD /route" entries) with a limit that adapts to the observed latency. Only successful (2xx) requests
+# are latency samples - rejects such as 400/415 return before doing the work. The limit is adapted once
+# per round of max(limit, ADMISSION_ROUND_SAMPLES) samples: when the median latency of the round exceeds
+# ADMISSION_TOLERANCE x the median of the latest ADMISSION_BASELINE_SAMPLES samples it shrinks by
+# ADMISSION_BACKOFF, otherwise it grows by 1 if the round used at least half of it. A failing request
+# (5xx or an exception) shrinks it at once, at most once per round.
+# A round judged overloaded adds only its median to the baseline, so sustained overload cannot drag the
+# baseline up within one window: it is pinned, and a dependency that stays slower for good is adopted
+# about round-size times slower than normal latency.
+# A request over the limit waits up to ADMISSION_QUEUE_TIMEOUT_MS for a slot, then is shed with 503; when
+# ADMISSION_MAX_QUEUE requests already wait it is shed at once with 429. Both carry Retry-After
+# (ADMISSION_RETRY_AFTER seconds).
+
+INITIAL_LIMIT = float(os.environ.get("ADMISSION_INITIAL_LIMIT", "20"))
+MIN_LIMIT = float(os.environ.get("ADMISSION_MIN_LIMIT", "2"))
+MAX_LIMIT = float(os.environ.get("ADMISSION_MAX_LIMIT", "200"))
+TOLERANCE = float(os.environ.get("ADMISSION_TOLERANCE", "2.0"))
+BACKOFF = float(os.environ.get("ADMISSION_BACKOFF", "0.9"))
+MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "50"))
+QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_MS", "100")) / 1000.0
+RETRY_AFTER = os.environ.get("ADMISSION_RETRY_AFTER", "1")
+BASELINE_SAMPLES = int(os.environ.get("ADMISSION_BASELINE_SAMPLES", "500"))
+ROUND_SAMPLES = int(os.environ.get("ADMISSION_ROUND_SAMPLES", "10"))
+
+
+class AdaptiveLimiter:
+    def __init__(self, name, initial=None, min_limit=None, max_limit=None, tolerance=None,
+                 max_queue=None, queue_timeout=None, baseline_samples=None, round_samples=None):
+        self.name = name
+        self.min_limit = MIN_LIMIT if min_limit is None else min_limit
+        self.max_limit = MAX_LIMIT if max_limit is None else max_limit
+        self.limit = INITIAL_LIMIT if initial is None else initial
+        self.tolerance = TOLERANCE if tolerance is None else tolerance
+        self.max_queue = MAX_QUEUE if max_queue is None else max_queue
+        self.queue_timeout = QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self.round_samples = ROUND_SAMPLES if round_samples is None else round_samples
+        self.inflight = 0
+        self.waiting = 0
+        # Latencies of the latest successful requests, and the medians of the latest adaptation
+        self.baseline = deque(maxlen=BASELINE_SAMPLES if baseline_samples is None else baseline_samples)
+        self.baseline_rtt = None
+        self.recent_rtt = None
+        self._round = []                # latencies of the current round
+        self._round_peak = 0            # most requests in flight during the current round
+        self._round_backed_off = False  # a failure already shrank the limit this round
+        self._cond = threading.Condition()
+        ADMISSION_LIMIT.labels(name).set(self.limit)
+
+    def _has_slot(self):
+        return self.inflight < max(1, int(self.limit))
+
+    def _admit(self):
+        self.inflight += 1
+        self._round_peak = max(self._round_peak, self.inflight)
+
+    # Admits the caller, waiting up to the queue timeout. Returns None when admitted,
+    # otherwise the reason it was shed ("queue_full" or "timeout")
+    def acquire(self):
+        with self._cond:
+            if self._has_slot():
+                self._admit()
+                return None
+            if self.waiting >= self.max_queue:
+                return "queue_full"
+            deadline = time.monotonic() + self.queue_timeout
+            self.waiting += 1
+            try:
+                while not self._has_slot():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return "timeout"
+                    self._cond.wait(remaining)
+                self._admit()
+                return None
+            finally:
+                self.waiting -= 1
+
+    # Frees the slot of an admitted request and adapts the limit to its latency (seconds) and
+    # HTTP status (None = the request raised)
+    def release(self, rtt, status):
+        with self._cond:
+            self.inflight -= 1
+            self._adapt(rtt, status)
+            ADMISSION_LIMIT.labels(self.name).set(self.limit)
+            self._cond.notify_all()
+
+    def _adapt(self, rtt, status):
+        if status is None or status >= 500:
+            # Failing downstream - back off now, but a burst of failures only once
+            if not self._round_backed_off:
+                self.limit = max(self.min_limit, self.limit * BACKOFF)
+                self._round_backed_off = True
+            return
+        if not 200 <= status < 300:
+            return
+        self._round.append(rtt)
+        if len(self._round) < max(self.round_samples, int(self.limit)):
+            return
+
+        self.recent_rtt = median(self._round)
+        overloaded = False
+        if len(self.baseline) >= self.round_samples and not self._round_backed_off:
+            self.baseline_rtt = median(self.baseline)
+            overloaded = self.recent_rtt > self.baseline_rtt * self.tolerance
+            if overloaded:
+                # Queueing somewhere downstream - back off
+                self.limit = max(self.min_limit, self.limit * BACKOFF)
+            elif self._round_peak >= self.limit / 2:
+                # Latency is fine and the limit is actually used - probe for more
+                self.limit = min(self.max_limit, self.limit + 1)
+        if overloaded:
+            self.baseline.append(self.recent_rtt)
+        else:
+            self.baseline.extend(self._round)
+        self._round = []
+        self._round_peak = self.inflight
+        self._round_backed_off = False
+
+
+def parse_routes(spec):
+    routes = set()
+    for entry in spec.split(","):
+        parts = entry.split()
+        if len(parts) == 2:
+            routes.add((parts[0].upper(), parts[1]))
+    return routes
+
+
+# Adds admission control to the routes in ADMISSION_ROUTES (unset = off)
+def init_admission(app):
+    limiters = {route: AdaptiveLimiter(f"{route[0]} {route[1]}")
+                for route in parse_routes(os.environ.get("ADMISSION_ROUTES", ""))}
+    if not limiters:
+        return limiters
+
+    @app.before_request
+    def _admit():
+        if request.url_rule is None:
+            return None
+        limiter = limiters.get((request.method, request.url_rule.rule))
+        if limiter is None:
+            return None
+        reason = limiter.acquire()
+        if reason is not None:
+            ADMISSION_SHED.labels(limiter.name, reason).inc()
+            resp = jsonify({"error": "server overloaded, retry later"})
+            resp.headers["Retry-After"] = RETRY_AFTER
+            return resp, 429 if reason == "queue_full" else 503
+        ADMISSION_INFLIGHT.labels(limiter.name).inc()
+        g.admission = (limiter, time.perf_counter())
+        return None
+
+    @app.after_request
+    def _record_status(response):
+        if "admission" in g:
+            g.admission_status = response.status_code
+        return response
+
+    # Runs even when the view raised, so a slot is never leaked
+    @app.teardown_request
+    def _release(exc):
+        admitted = g.pop("admission", None)
+        if admitted is not None:
+            limiter, start = admitted
+            ADMISSION_INFLIGHT.labels(limiter.name).dec()
+            status = g.pop("admission_status", None)
+            limiter.release(time.perf_counter() - start, status if exc is None else None)
+
+    return limiters
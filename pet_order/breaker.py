@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+
+from metrics import CIRCUIT_REJECTED, CIRCUIT_STATE, CIRCUIT_TRANSITIONS
+
+# -------------------------
+# Circuit breakers
+# -------------------------
+# One breaker per dependency. After CIRCUIT_FAILURE_THRESHOLD consecutive failures (connection errors,
+# timeouts, 5xx) the breaker opens and calls fail immediately instead of waiting for the timeout.
+# After CIRCUIT_RESET_SECONDS it turns half-open and lets CIRCUIT_HALF_OPEN_CALLS trial calls through:
+# a successful trial closes it again, a failed one re-opens it for another CIRCUIT_RESET_SECONDS.
+# The state of every breaker is exported as circuit_breaker_state{dependency} (0 closed, 1 half-open, 2 open).
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "10"))
+HALF_OPEN_CALLS = int(os.environ.get("CIRCUIT_HALF_OPEN_CALLS", "1"))
+
+
+# Raised instead of calling a dependency whose breaker is open - args[0] is 503, like the other status errors
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=None, reset_seconds=None, half_open_calls=None):
+        self.name = name
+        self.failure_threshold = FAILURE_THRESHOLD if failure_threshold is None else failure_threshold
+        self.reset_seconds = RESET_SECONDS if reset_seconds is None else reset_seconds
+        self.half_open_calls = HALF_OPEN_CALLS if half_open_calls is None else half_open_calls
+        self.state = CLOSED
+        self.failures = 0           # consecutive failures while closed
+        self.opened_at = 0.0
+        self.trials = 0             # trial calls in flight while half-open
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(name).set(STATE_VALUES[CLOSED])
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            CIRCUIT_STATE.labels(self.name).set(STATE_VALUES[state])
+            CIRCUIT_TRANSITIONS.labels(self.name, state).inc()
+
+    # True when a call may go out now; a half-open breaker only admits its trial calls
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    CIRCUIT_REJECTED.labels(self.name).inc()
+                    return False
+                self._set_state(HALF_OPEN)
+                self.trials = 0
+            if self.state == HALF_OPEN:
+                if self.trials >= self.half_open_calls:
+                    CIRCUIT_REJECTED.labels(self.name).inc()
+                    return False
+                self.trials += 1
+            return True
+
+    # Raises CircuitOpenError unless a call may go out now
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(503, self.name)
+
+    # Reports the outcome of a call admitted by allow() / check()
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self._set_state(CLOSED)
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
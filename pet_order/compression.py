@@ -0,0 +1,116 @@
+import os
+import zlib
+
+from flask import request
+
+# brotli and zstandard are optional - without them only gzip and deflate are offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# -------------------------
+# Response compression
+# -------------------------
+# JSON responses of at least COMPRESSION_MIN_BYTES (streamed ones always) are compressed with the best
+# encoding the client accepts (Accept-Encoding, q-values honoured), in the server preference order of
+# COMPRESSION_ENCODINGS. COMPRESSION_LEVEL sets the gzip/deflate level, COMPRESSION_LEVEL_BR and
+# COMPRESSION_LEVEL_ZSTD the brotli quality and zstd level. COMPRESSION=0 turns it off.
+
+ENABLED = os.environ.get("COMPRESSION", "1") == "1"
+MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+MIMETYPES = {"application/json"}
+LEVELS = {
+    "gzip": int(os.environ.get("COMPRESSION_LEVEL", "6")),
+    "deflate": int(os.environ.get("COMPRESSION_LEVEL", "6")),
+    "br": int(os.environ.get("COMPRESSION_LEVEL_BR", "4")),
+    "zstd": int(os.environ.get("COMPRESSION_LEVEL_ZSTD", "3")),
+}
+
+
+# Incremental compressor with compress(chunk) / flush(), one per response
+def compressor(encoding):
+    level = LEVELS[encoding]
+    if encoding == "gzip":
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if encoding == "deflate":
+        # HTTP "deflate" is the zlib format
+        return zlib.compressobj(level, zlib.DEFLATED, 15)
+    if encoding == "br":
+        return _BrotliCompressor(level)
+    return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+class _BrotliCompressor:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def compress(data, encoding):
+    c = compressor(encoding)
+    return c.compress(data) + c.flush()
+
+
+def iter_compressed(chunks, encoding):
+    c = compressor(encoding)
+    for chunk in chunks:
+        out = c.compress(chunk)
+        if out:
+            yield out
+    yield c.flush()
+
+
+def available_encodings():
+    names = [e.strip() for e in os.environ.get("COMPRESSION_ENCODINGS", "zstd,br,gzip,deflate").split(",")]
+    return [e for e in names if e in LEVELS and
+            (e != "br" or brotli is not None) and (e != "zstd" or zstandard is not None)]
+
+
+ENCODINGS = available_encodings()
+
+
+# Encoding to use for the current request's response, None = identity
+def negotiate():
+    if not ENABLED or not ENCODINGS:
+        return None
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+# True when a body of `size` bytes (None = streamed) and this mimetype is worth compressing
+def wanted(mimetype, size):
+    return mimetype in MIMETYPES and (size is None or size >= MIN_BYTES)
+
+
+# Compresses eligible responses of the app. Responses that already carry a Content-Encoding
+# (e.g. cached compressed bodies) are left alone.
+def init_compression(app):
+    @app.after_request
+    def _compress(response):
+        if not ENABLED or response.status_code != 200 or response.direct_passthrough or request.method == "HEAD":
+            return response
+        if "Content-Encoding" in response.headers:
+            return response
+        size = None if response.is_streamed else response.calculate_content_length()
+        if not wanted(response.mimetype, size):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = iter_compressed(response.response, encoding)
+        else:
+            response.set_data(compress(response.get_data(), encoding))
+        response.headers["Content-Encoding"] = encoding
+        return response
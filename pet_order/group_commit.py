@@ -0,0 +1,136 @@
+import atexit
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+from prometheus_client import Histogram
+
+log = logging.getLogger("group_commit")
+
+# -------------------------
+# Group commit of ledger writes
+# -------------------------
+# LEDGER_MODE selects how purchases are written to the transactions collection:
+#   sync   (default) - one insert_one per purchase
+#   group  - purchases are buffered and written with one insert_many per batch; a purchase is answered
+#            once the batch holding its transaction is written, so durability is the same as sync
+#   async  - write-behind: the purchase is answered as soon as it is buffered. Faster, but a crash
+#            loses the transactions not flushed yet (at most one batch / LEDGER_FLUSH_MS of purchases)
+# A batch is written when it reaches LEDGER_BATCH_SIZE documents (it never holds more) or LEDGER_FLUSH_MS after
+# its first one.
+# Pending batches are flushed on shutdown (normal exit and SIGTERM).
+
+LEDGER_BATCH_SIZE = Histogram(
+    "ledger_batch_size",
+    "Transactions written per group-commit batch",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+
+class _Batch:
+    __slots__ = ("docs", "done", "error")
+
+    def __init__(self):
+        self.docs = []
+        self.done = threading.Event()
+        self.error = None
+
+
+class GroupCommitWriter:
+    def __init__(self, collection, batch_size=100, flush_ms=5.0, wait=True):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self.wait = wait
+        self._pending = _Batch()
+        self._full = deque()        # batches that reached batch_size, oldest first
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="ledger-flusher", daemon=True)
+        self._thread.start()
+
+    # Buffers one document; in group mode returns once its batch is written (raising its error)
+    def insert(self, doc):
+        with self._cond:
+            if self._closed:
+                batch = None
+            else:
+                batch = self._pending
+                batch.docs.append(doc)
+                if len(batch.docs) >= self.batch_size:
+                    # Full - handed to the flusher, the next document starts a new batch
+                    self._full.append(batch)
+                    self._pending = _Batch()
+                    self._cond.notify()
+                elif len(batch.docs) == 1:
+                    self._cond.notify()
+        if batch is None:
+            # Shutting down - write through
+            self.collection.insert_one(doc)
+            return
+        if self.wait:
+            batch.done.wait()
+            if batch.error is not None:
+                raise batch.error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._full and not self._pending.docs and not self._closed:
+                    self._cond.wait()
+                if not self._full:
+                    if not self._pending.docs:
+                        return
+                    # Give the batch up to flush_interval to fill
+                    deadline = time.monotonic() + self.flush_interval
+                    while not self._full and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                if self._full:
+                    batch = self._full.popleft()
+                else:
+                    batch, self._pending = self._pending, _Batch()
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            self.collection.insert_many(batch.docs, ordered=False)
+            LEDGER_BATCH_SIZE.observe(len(batch.docs))
+        except Exception as e:
+            batch.error = e
+            log.error("ledger batch of %d transactions failed: %s", len(batch.docs), e)
+        finally:
+            batch.done.set()
+
+    # Writes everything still buffered and stops the flusher
+    def close(self, timeout=10.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+
+# Returns a GroupCommitWriter for LEDGER_MODE=group/async (flushed on shutdown), None for sync
+def writer_from_env(collection):
+    mode = os.environ.get("LEDGER_MODE", "sync").lower()
+    if mode not in ("group", "async"):
+        return None
+    writer = GroupCommitWriter(
+        collection,
+        batch_size=int(os.environ.get("LEDGER_BATCH_SIZE", "100")),
+        flush_ms=float(os.environ.get("LEDGER_FLUSH_MS", "5")),
+        wait=mode == "group",
+    )
+    atexit.register(writer.close)
+    # SIGTERM (docker stop) would otherwise end the process without running atexit
+    try:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    except ValueError:
+        pass    # not the main thread
+    return writer
@@ -0,0 +1,92 @@
+import math
+import os
+import re
+
+from flask.json.provider import DefaultJSONProvider
+
+# orjson is optional - without it every response goes through the stdlib encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson writes some floats differently from the stdlib: exponent forms (1e16 vs 1e+16, 1e-7 vs 1e-07) and
+# floats just under 1e-4 (0.00001 vs 1e-05). Output matching this (also inside a string) is re-encoded
+FLOAT_MISMATCH = re.compile(rb"[0-9]e|0\.0000")
+
+
+# True when obj holds a NaN or infinite float - orjson writes them as null, the stdlib as NaN/Infinity
+def has_non_finite(obj):
+    stack = [obj]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+# JSON provider that encodes with orjson when it is installed and falls back to the stdlib otherwise.
+# Output is byte-for-byte what Flask's DefaultJSONProvider produces (sorted keys, ASCII escapes,
+# compact or indent=2 in debug mode), and large arrays are streamed to the client in chunks.
+class FastJSONProvider(DefaultJSONProvider):
+    # Arrays with more items than this are encoded incrementally
+    stream_threshold = int(os.environ.get("JSON_STREAM_THRESHOLD", "1000"))
+    # Number of array items encoded per streamed chunk
+    stream_chunk = int(os.environ.get("JSON_STREAM_CHUNK", "256"))
+
+    # True when responses are indented (compact=False, or compact=None in debug mode)
+    def _pretty(self):
+        return (self.compact is None and self._app.debug) or self.compact is False
+
+    # Encodes one value to UTF-8 bytes, without the trailing newline of a response
+    def encode(self, obj, pretty=False):
+        if orjson is not None:
+            option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if pretty:
+                option |= orjson.OPT_INDENT_2
+            try:
+                data = orjson.dumps(obj, default=self.default, option=option)
+            except TypeError:
+                # e.g. non-string keys or integers wider than 64 bits
+                data = None
+            # orjson never escapes non-ASCII and formats some floats its own way - the stdlib encodes those
+            if data is not None and (not self.ensure_ascii or data.isascii()) \
+                    and not FLOAT_MISMATCH.search(data) and not (b"null" in data and has_non_finite(obj)):
+                return data
+
+        if pretty:
+            return self.dumps(obj, indent=2).encode("utf-8")
+        return self.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    # Yields a large array in chunks of stream_chunk items
+    def iter_array(self, items, pretty=False):
+        if not items:
+            yield b"[]\n"
+            return
+        if pretty:
+            open_, sep, close = b"[\n", b",\n", b"\n]\n"
+        else:
+            open_, sep, close = b"[", b",", b"]\n"
+        yield open_
+        for start in range(0, len(items), self.stream_chunk):
+            parts = [self.encode(item, pretty) for item in items[start:start + self.stream_chunk]]
+            if pretty:
+                # Nest every item one level deeper, like json.dumps(indent=2) does
+                parts = [b"  " + part.replace(b"\n", b"\n  ") for part in parts]
+            chunk = sep.join(parts)
+            yield sep + chunk if start else chunk
+        yield close
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self._pretty()
+        if isinstance(obj, list) and len(obj) > self.stream_threshold:
+            return self._app.response_class(self.iter_array(obj, pretty), mimetype=self.mimetype)
+        return self._app.response_class(self.encode(obj, pretty) + b"\n", mimetype=self.mimetype)
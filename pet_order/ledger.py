@@ -0,0 +1,332 @@
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from db import InstrumentedCollection
+
+log = logging.getLogger("ledger")
+
+# -------------------------
+# Time-partitioned transaction ledger
+# -------------------------
+# Every transaction carries an internal purchase timestamp "_ts" (UTC) and is written into the bucket
+# collection of its period, e.g. transactions_202610 (LEDGER_PARTITION=month, default), transactions_20261019
+# (day), or the single base collection (none). A background job (every LEDGER_ARCHIVE_INTERVAL_SECONDS)
+# keeps the LEDGER_HOT_BUCKETS most recent buckets in Mongo and moves older ones to gzip NDJSON files in
+# LEDGER_ARCHIVE_DIR (<bucket>.ndjson.gz), dropping the collection afterwards.
+# find() reads across the base collection (documents written before partitioning, no "_ts"), the archived
+# and the hot buckets, skipping every bucket outside the requested time range.
+# Several pet-order processes may share the ledger: the hot buckets are listed from Mongo again once the
+# listing is LEDGER_DISCOVERY_TTL_SECONDS old, and a bucket with an archive file is always read from it too -
+# another process may have archived and dropped it since (duplicates of the file's documents are skipped).
+# Every bucket is indexed on "_ts" and on (field, "_ts") for each filter field passed as `indexed_fields`.
+
+PERIODS = {
+    "month": ("%Y%m", re.compile(r"^\d{6}$")),
+    "day": ("%Y%m%d", re.compile(r"^\d{8}$")),
+}
+ARCHIVE_SUFFIX = ".ndjson.gz"
+
+
+def utc(ts):
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+
+# Parses "YYYY-MM-DD" or an ISO 8601 date-time (UTC unless it has an offset), None if invalid
+def parse_time(value):
+    try:
+        return utc(datetime.fromisoformat(value))
+    except ValueError:
+        return None
+
+
+# One archive line per document - the same transaction always gives the same line
+def archive_line(doc):
+    if isinstance(doc.get("_ts"), datetime):
+        doc = {**doc, "_ts": utc(doc["_ts"]).isoformat()}
+    return json.dumps(doc)
+
+
+class PartitionedLedger:
+    def __init__(self, db, base_name, partition="month", archive_dir=None, hot_buckets=3,
+                 write_concern=None, read_preference=None, indexed_fields=(), discovery_ttl=5.0):
+        self.db = db
+        self.base_name = base_name
+        self.partition = partition if partition in PERIODS else None
+        self.archive_dir = archive_dir
+        self.hot_buckets = hot_buckets
+        self.write_concern = write_concern
+        self.read_preference = read_preference
+        self.indexed_fields = list(indexed_fields)
+        self.discovery_ttl = discovery_ttl
+        self._lock = threading.Lock()
+        self._collections = {}
+        # Nothing is read from Mongo until the ledger is used - the hot bucket keys ("202610") are listed lazily
+        self._hot = None
+        self._listed_at = 0.0
+        self._created = set()   # buckets this process created while a listing ran
+        self._indexed = set()   # buckets this process created the indexes of
+
+    # -------------------------
+    # Buckets
+    # -------------------------
+
+    def bucket_key(self, ts):
+        return utc(ts).strftime(PERIODS[self.partition][0])
+
+    def collection_name(self, key):
+        return f"{self.base_name}_{key}"
+
+    # [start, end) of a bucket
+    def bucket_range(self, key):
+        start = datetime.strptime(key, PERIODS[self.partition][0]).replace(tzinfo=timezone.utc)
+        if self.partition == "day":
+            return start, start + timedelta(days=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+
+    def archive_path(self, key):
+        return os.path.join(self.archive_dir, self.collection_name(key) + ARCHIVE_SUFFIX)
+
+    # Hot bucket keys, listed from Mongo unless the last listing is younger than discovery_ttl
+    def hot_keys(self, refresh=False):
+        with self._lock:
+            if not refresh and self._hot is not None and time.monotonic() - self._listed_at < self.discovery_ttl:
+                return set(self._hot)
+        return self._list_collections()[1]
+
+    # Lists the collections of the database: (names, hot bucket keys)
+    def _list_collections(self):
+        with self._lock:
+            self._created = set()
+        names = self.db.list_collection_names()
+        prefix = self.base_name + "_"
+        keys = {name[len(prefix):] for name in names
+                if name.startswith(prefix) and PERIODS[self.partition][1].match(name[len(prefix):])}
+        with self._lock:
+            keys |= self._created
+            self._hot = keys
+            self._listed_at = time.monotonic()
+            # Dropped by another process - a later write recreates the bucket, with its indexes
+            self._indexed &= keys
+        return names, set(keys)
+
+    def archived(self):
+        if not self.archive_dir or not os.path.isdir(self.archive_dir):
+            return set()
+        prefix = self.base_name + "_"
+        keys = set()
+        for name in os.listdir(self.archive_dir):
+            if name.startswith(prefix) and name.endswith(ARCHIVE_SUFFIX):
+                key = name[len(prefix):-len(ARCHIVE_SUFFIX)]
+                if PERIODS[self.partition][1].match(key):
+                    keys.add(key)
+        return keys
+
+    # Collections holding transactions: the base collection (when it exists) and the hot buckets
+    def collection_names(self):
+        if not self.partition:
+            return [self.base_name]
+        existing, hot = self._list_collections()
+        names = [self.collection_name(key) for key in sorted(hot)]
+        if self.base_name in existing:
+            names.insert(0, self.base_name)
+        return names
+
+    def _create_indexes(self, col):
+        col.create_index("_ts")
+        for field in self.indexed_fields:
+            col.create_index([(field, 1), ("_ts", 1)])
+
+    # Creates the indexes on every collection holding transactions (buckets written before they existed)
+    def ensure_indexes(self):
+        for name in self.collection_names():
+            self._create_indexes(self._collection(name, True))
+
+    # Warns about filter shapes that the indexes of a collection holding transactions do not support
+    def check_indexes(self, shapes):
+        missing = []
+        for name in self.collection_names():
+            missing.extend(self._collection(name, False).check_indexes(shapes))
+        return missing
+
+    # Instrumented bucket collection with the write concern (critical) or the list read preference
+    def _collection(self, name, critical):
+        col = self._collections.get((name, critical))
+        if col is None:
+            col = InstrumentedCollection(self.db[name])
+            if critical:
+                col = col.with_options(write_concern=self.write_concern)
+            else:
+                col = col.with_options(read_preference=self.read_preference)
+            self._collections[(name, critical)] = col
+        return col
+
+    # -------------------------
+    # Writes
+    # -------------------------
+
+    def _bucket_for_write(self, ts):
+        if not self.partition:
+            return self._collection(self.base_name, True)
+        key = self.bucket_key(ts)
+        col = self._collection(self.collection_name(key), True)
+        if key not in self._indexed:
+            with self._lock:
+                if key not in self._indexed:
+                    # New bucket - range and filter queries within it use its indexes
+                    self._create_indexes(col)
+                    self._indexed.add(key)
+                    self._created.add(key)
+                    if self._hot is not None:
+                        self._hot.add(key)
+        return col
+
+    # Stamps the document with the purchase time (unless it has one) and writes it to its bucket
+    def insert_one(self, doc):
+        doc.setdefault("_ts", datetime.now(timezone.utc))
+        return self._bucket_for_write(doc["_ts"]).insert_one(doc)
+
+    def insert_many(self, docs, ordered=True):
+        by_bucket = {}
+        for doc in docs:
+            doc.setdefault("_ts", datetime.now(timezone.utc))
+            key = self.bucket_key(doc["_ts"]) if self.partition else None
+            by_bucket.setdefault(key, []).append(doc)
+        for bucket_docs in by_bucket.values():
+            self._bucket_for_write(bucket_docs[0]["_ts"]).insert_many(bucket_docs, ordered=ordered)
+
+    # -------------------------
+    # Reads
+    # -------------------------
+
+    # Documents matching `query` (field equality) purchased in [since, until), oldest bucket first,
+    # without "_id" and "_ts"
+    def find(self, query, since=None, until=None):
+        time_filter = {}
+        if since is not None:
+            time_filter["$gte"] = since
+        if until is not None:
+            time_filter["$lt"] = until
+        mongo_query = {**query, "_ts": time_filter} if time_filter else query
+        projection = {"_id": 0, "_ts": 0}
+
+        docs = []
+        # Documents written before partitioning have no timestamp - only unbounded queries see them
+        if not self.partition or not time_filter:
+            docs.extend(self._collection(self.base_name, False).find(mongo_query, projection))
+        if not self.partition:
+            return docs
+
+        hot = self.hot_keys()
+        archived = self.archived()
+        for key in sorted(hot | archived):
+            start, end = self.bucket_range(key)
+            if (since is not None and end <= since) or (until is not None and start >= until):
+                continue
+            if key not in archived:
+                docs.extend(self._collection(self.collection_name(key), False).find(mongo_query, projection))
+                continue
+            lines = self._read_archive(key, query, since, until)
+            if key in hot:
+                # Being archived, or written to after an earlier archival - only what the file lacks
+                seen = set(lines)
+                for doc in self._collection(self.collection_name(key), False).find(mongo_query, {"_id": 0}):
+                    line = archive_line(doc)
+                    if line not in seen:
+                        lines.append(line)
+            for line in lines:
+                doc = json.loads(line)
+                del doc["_ts"]
+                docs.append(doc)
+        return docs
+
+    # Archive lines of `key` matching the query and range
+    def _read_archive(self, key, query, since, until):
+        lines = []
+        for line in self._archive_lines(key):
+            doc = json.loads(line)
+            ts = datetime.fromisoformat(doc["_ts"])
+            if (since is not None and ts < since) or (until is not None and ts >= until):
+                continue
+            if all(doc.get(field) == value for field, value in query.items()):
+                lines.append(line)
+        return lines
+
+    def _archive_lines(self, key):
+        try:
+            with gzip.open(self.archive_path(key), "rt", encoding="utf-8") as f:
+                for line in f:
+                    yield line.rstrip("\n")
+        except FileNotFoundError:
+            pass    # archived and deleted meanwhile
+
+    # -------------------------
+    # Archival
+    # -------------------------
+
+    # Moves every bucket older than the hot window to its archive file, returns the archived keys
+    def archive_old(self, now=None):
+        if not self.partition or not self.archive_dir:
+            return []
+        current = self.bucket_key(now or datetime.now(timezone.utc))
+        hot = self.hot_keys(refresh=True)
+        keep = set(sorted(hot | {current})[-self.hot_buckets:]) if self.hot_buckets > 0 else set()
+        old = sorted(key for key in hot if key not in keep and key < current)
+        archived = []
+        for key in old:
+            self._archive_bucket(key)
+            archived.append(key)
+        return archived
+
+    def _archive_bucket(self, key):
+        name = self.collection_name(key)
+        path = self.archive_path(key)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        # A temp file of its own - never one another archiver is writing
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=self.archive_dir)
+        count = 0
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                # Archived before (by another process, or written to since) - the new file extends the old one
+                seen = set()
+                for line in self._archive_lines(key):
+                    seen.add(line)
+                    f.write(line + "\n")
+                # Straight from the cursor - the bucket is never held in memory
+                for doc in self.db[name].find({}, {"_id": 0}).sort("_ts", 1):
+                    line = archive_line(doc)
+                    if line not in seen:
+                        f.write(line + "\n")
+                        count += 1
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._lock:
+            if self._hot is not None:
+                self._hot.discard(key)
+            self._indexed.discard(key)
+        self.db[name].drop()
+        log.warning("archived %d transactions of %s to %s", count, name, path)
+
+    def start_archiver(self, interval):
+        if not self.partition or not self.archive_dir or interval <= 0:
+            return None
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.archive_old()
+                except Exception as e:
+                    log.warning("ledger archival failed: %s", e)
+
+        stop = threading.Event()
+        threading.Thread(target=run, name="ledger-archiver", daemon=True).start()
+        return stop
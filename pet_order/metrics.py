@@ -0,0 +1,199 @@
+import time
+from contextlib import contextmanager
+
+from flask import Response, request, g
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+
+# -------------------------
+# Prometheus metrics
+# -------------------------
+# Metrics of the modules both services share (this file is identical in both). Metrics of one
+# service only are defined next to the code that records them.
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latency of incoming HTTP requests",
+    ["method", "route", "status"],
+)
+
+OUTBOUND_LATENCY = Histogram(
+    "outbound_request_duration_seconds",
+    "Latency of outbound calls per dependency",
+    ["dependency", "outcome"],
+)
+
+MONGO_LATENCY = Histogram(
+    "mongo_operation_duration_seconds",
+    "Latency of MongoDB commands",
+    ["command", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "mongo_pool_checked_out_connections",
+    "Connections currently checked out of the MongoDB pool",
+    ["address"],
+)
+
+MONGO_POOL_MAX_SIZE = Gauge(
+    "mongo_pool_max_size",
+    "maxPoolSize of the MongoDB pool (saturation = checked out / max size)",
+    ["address"],
+)
+
+MONGO_POOL_CHECKOUT_WAIT = Histogram(
+    "mongo_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of the MongoDB pool",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+MONGO_POOL_CHECKOUT_FAILED = Counter(
+    "mongo_pool_checkout_failed_total",
+    "Failed MongoDB connection check-outs by reason (e.g. timeout = pool exhausted)",
+    ["reason"],
+)
+
+CIRCUIT_STATE = Gauge(
+    "circuit_breaker_state",
+    "State of the circuit breaker of a dependency (0 closed, 1 half-open, 2 open)",
+    ["dependency"],
+)
+
+CIRCUIT_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total",
+    "Circuit breaker state changes by dependency and new state",
+    ["dependency", "state"],
+)
+
+CIRCUIT_REJECTED = Counter(
+    "circuit_breaker_rejected_total",
+    "Calls failed fast by an open (or busy half-open) circuit breaker",
+    ["dependency"],
+)
+
+ADMISSION_LIMIT = Gauge(
+    "admission_concurrency_limit",
+    "Current adaptive concurrency limit per admission-controlled route",
+    ["route"],
+)
+
+ADMISSION_INFLIGHT = Gauge(
+    "admission_inflight_requests",
+    "Admitted requests currently in flight per admission-controlled route",
+    ["route"],
+)
+
+ADMISSION_SHED = Counter(
+    "admission_shed_total",
+    "Requests shed by admission control by route and reason (queue_full = 429, timeout = 503)",
+    ["route", "reason"],
+)
+
+SINGLEFLIGHT_CALLS = Counter(
+    "singleflight_calls_total",
+    "Coalesced lookups by lookup and role (leader = made the call, shared = got its result, timeout = gave up)",
+    ["lookup", "role"],
+)
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit / miss)",
+    ["cache", "result"],
+)
+
+
+# Outcome of one outbound call - set .outcome to the status code once there is a response
+class OutboundCall:
+    __slots__ = ("outcome",)
+
+    def __init__(self):
+        self.outcome = "error"
+
+
+# Times the body of the `with` block as one call to `dependency`
+@contextmanager
+def outbound_timer(dependency):
+    call = OutboundCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        OUTBOUND_LATENCY.labels(dependency, str(call.outcome)).observe(time.perf_counter() - start)
+
+
+# Records a cache lookup result
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+# Times every MongoDB command of the client it is registered on (MongoClient(event_listeners=[...]))
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_LATENCY.labels(event.command_name, "ok").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_LATENCY.labels(event.command_name, "error").observe(event.duration_micros / 1e6)
+
+
+# Tracks MongoDB pool usage (MongoClient(event_listeners=[...]))
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    def pool_created(self, event):
+        address = "%s:%s" % event.address
+        MONGO_POOL_MAX_SIZE.labels(address).set(event.options.get("maxPoolSize", 100))
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CHECKED_OUT.labels("%s:%s" % event.address).inc()
+        if getattr(event, "duration", None) is not None:
+            MONGO_POOL_CHECKOUT_WAIT.observe(event.duration)
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.labels("%s:%s" % event.address).dec()
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILED.labels(str(event.reason)).inc()
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+# Adds per-route request latency and the /metrics endpoint to a Flask app
+def init_metrics(app):
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            # The route template keeps the label set small (/pet-types/<pet_type_id>, not every id)
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            REQUEST_LATENCY.labels(request.method, route, str(response.status_code)).observe(
+                time.perf_counter() - start)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
@@ -1,27 +1,92 @@
 from flask import Flask, request, jsonify
 import os
-import random
 import requests
-from pymongo import MongoClient
+
+from admission import init_admission
+from breaker import CircuitBreaker
+from compression import init_compression
+from db import critical_write_concern, list_read_preference, mongo_client
+from group_commit import writer_from_env
+from json_provider import FastJSONProvider
+from ledger import PartitionedLedger, parse_time
+from metrics import MongoCommandMetrics, MongoPoolMetrics, init_metrics, outbound_timer
+from profiling import init_profiling
+from singleflight import SingleFlight
+from tracing import MongoCommandTracer, current_span, init_tracing, inject, start_span
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+init_metrics(app)
+init_tracing(app, "pet-order")
+init_profiling(app, "pet-order")
+# Off unless ADMISSION_ROUTES names routes - docker-compose sets "POST /purchases": purchases fan out to
+# the stores, capping them adaptively sheds the excess (ADMISSION_* variables)
+init_admission(app)
+# Large JSON responses are compressed for clients that accept it (COMPRESSION_* variables)
+init_compression(app)
 global_purchase_id = 0
 
 # --------- Config from env ---------
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://mongo:27017")
 DB_NAME = os.environ.get("DB_NAME", "petshop")
 TRANSACTIONS_COLLECTION = "transactions"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LEDGER_ARCHIVE_DIR = os.environ.get("LEDGER_ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
 
 STORE1_URL = os.environ.get("STORE1_URL", "http://pet-store1:5001")
 STORE2_URL = os.environ.get("STORE2_URL", "http://pet-store2:5001")
 
+# One breaker per store - a purchase skips a store that keeps failing instead of waiting for its timeout
+STORE_BREAKERS = {STORE1_URL: CircuitBreaker("store1"), STORE2_URL: CircuitBreaker("store2")}
+# Concurrent purchases of the same pet type share one type lookup per store
+TYPE_LOOKUPS = SingleFlight("store_type_id")
+# Shared session to the stores: pooled keep-alive connections, and compressed responses requested
+# (requests decodes gzip/deflate, and br/zstd when brotli/zstandard are installed)
+STORE_SESSION = requests.Session()
+STORE_SESSION.headers["Accept-Encoding"] = os.environ.get(
+    "STORE_ACCEPT_ENCODING", requests.utils.DEFAULT_ACCEPT_ENCODING)
+
 OWNER_HEADER_KEY = "OwnerPC"
 OWNER_HEADER_VAL = "LovesPetsL2M3n4"
 
+# Group commit buffers purchases in memory (LEDGER_MODE, see group_commit.py). Under the debug reloader PID 1
+# is a watcher whose SIGTERM (docker stop) kills the serving child before it flushes, so they run without it
+USE_RELOADER = os.environ.get("LEDGER_MODE", "sync").lower() not in ("group", "async")
+
+# The debug reloader runs this module twice: in a watcher process that never serves requests and in the
+# serving child it starts (WERKZEUG_RUN_MAIN=true). Background jobs only run in the serving process.
+def serving_process():
+    return __name__ != "__main__" or not USE_RELOADER or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+
+
 # --------- Mongo connection ---------
-client = MongoClient(MONGO_URL)
+# Pool sizes, timeouts, read preference and write concern are tuned by MONGO_* variables (see db.py)
+client = mongo_client(MONGO_URL, event_listeners=[MongoCommandMetrics(), MongoCommandTracer(), MongoPoolMetrics()])
 db = client[DB_NAME]
-transactions = db[TRANSACTIONS_COLLECTION]
+
+# Fields GET /transactions filters on - indexed together with "_ts" in every bucket, checked at startup
+TRANSACTION_QUERY_SHAPES = [["purchaser"], ["pet-type"], ["store"], ["pet-name"], ["purchase-id"]]
+
+# Transactions go to time buckets (LEDGER_PARTITION, see ledger.py), old buckets are archived to files.
+# GET /transactions may read from secondaries, purchases are written with the critical write concern.
+# Buckets are discovered on first use - nothing touches Mongo or the archive dir at import
+ledger = PartitionedLedger(
+    db, TRANSACTIONS_COLLECTION,
+    partition=os.environ.get("LEDGER_PARTITION", "month"),
+    archive_dir=LEDGER_ARCHIVE_DIR,
+    hot_buckets=int(os.environ.get("LEDGER_HOT_BUCKETS", "3")),
+    write_concern=critical_write_concern(),
+    read_preference=list_read_preference(),
+    indexed_fields=[fields[0] for fields in TRANSACTION_QUERY_SHAPES],
+    discovery_ttl=float(os.environ.get("LEDGER_DISCOVERY_TTL_SECONDS", "5")),
+)
+ledger_writer = None
+if serving_process():
+    ledger.ensure_indexes()
+    ledger.check_indexes(TRANSACTION_QUERY_SHAPES)
+    ledger.start_archiver(float(os.environ.get("LEDGER_ARCHIVE_INTERVAL_SECONDS", "3600")))
+    # Optional group commit of purchases (LEDGER_MODE, see group_commit.py), None = one insert_one per purchase
+    ledger_writer = writer_from_env(ledger)
 
 
 # ------------------ helpers ------------------
@@ -42,20 +107,44 @@ def get_stores():
     ]
 
 
+def store_request(method, base_url, path, **kwargs):
+    """
+    Sends a request to a store: timed per store URL, traced as a child span
+    of the current request and carrying its trace context.
+    Raises CircuitOpenError without sending anything while the store's breaker is open
+    """
+    breaker = STORE_BREAKERS[base_url]
+    breaker.check()
+    try:
+        with outbound_timer(base_url) as call, \
+                start_span(f"{method} store", **{"http.url": base_url + path}) as span:
+            resp = STORE_SESSION.request(method, base_url + path, headers=inject(), timeout=5, **kwargs)
+            call.outcome = resp.status_code
+            span.set_attribute("http.status_code", resp.status_code)
+    except Exception:
+        breaker.record(False)
+        raise
+    breaker.record(resp.status_code < 500)
+    return resp
+
+
 def find_type_id(base_url, pet_type):
     """
     Calls GET /pet-types?type=<pet_type> on the appropriate store
     and returns the id of the type if found, otherwise None
     """
+    # The store matches the type case-insensitively, so the lookup is keyed by the lowercase name
     try:
-        resp = requests.get(
-            f"{base_url}/pet-types",
-            params={"type": pet_type},
-            timeout=5,
-        )
+        return TYPE_LOOKUPS.do((base_url, pet_type.lower()), lambda: lookup_type_id(base_url, pet_type))
     except Exception:
         return None
 
+
+def lookup_type_id(base_url, pet_type):
+    """
+    Does the find_type_id call, raises when the store cannot be reached
+    """
+    resp = store_request("GET", base_url, "/pet-types", params={"type": pet_type})
     if resp.status_code != 200:
         return None
 
@@ -67,21 +156,20 @@ def find_type_id(base_url, pet_type):
     return data[0].get("id")
 
 
-def list_pets_for_type(base_url, type_id):
+def random_pet(base_url, pet_type):
     """
-    Returns list of pets for this store and this type_id
+    Asks the store for a random pet of pet_type (resolved by name on the store side)
+    and returns (type_id, pet) if there is one, otherwise None
     """
     try:
-        resp = requests.get(
-            f"{base_url}/pet-types/{type_id}/pets",
-            timeout=5,
-        )
+        resp = store_request("GET", base_url, "/random-pet", params={"type": pet_type})
     except Exception:
-        return []
+        return None
 
     if resp.status_code != 200:
-        return []
-    return resp.json()
+        return None
+    data = resp.json()
+    return data["pet-type-id"], data["pet"]
 
 
 def get_pet_by_name(base_url, type_id, pet_name):
@@ -89,10 +177,7 @@ def get_pet_by_name(base_url, type_id, pet_name):
     Returns specific pet named pet_name if exists, otherwise None
     """
     try:
-        resp = requests.get(
-            f"{base_url}/pet-types/{type_id}/pets/{pet_name}",
-            timeout=5,
-        )
+        resp = store_request("GET", base_url, f"/pet-types/{type_id}/pets/{pet_name}")
     except Exception:
         return None
 
@@ -106,10 +191,7 @@ def delete_pet(base_url, type_id, pet_name):
     Deletes specific pet in store. Returns True if successful.
     """
     try:
-        resp = requests.delete(
-            f"{base_url}/pet-types/{type_id}/pets/{pet_name}",
-            timeout=5,
-        )
+        resp = store_request("DELETE", base_url, f"/pet-types/{type_id}/pets/{pet_name}")
     except Exception:
         return False
 
@@ -158,21 +240,20 @@ def create_purchase():
 
     # Iterate over stores according to the rules
     for sid, base_url in candidate_stores:
-        type_id = find_type_id(base_url, pet_type)
-        if not type_id:
-            continue
-
         if pet_name:
+            type_id = find_type_id(base_url, pet_type)
+            if not type_id:
+                continue
             # Need pet with this name
             pet_obj = get_pet_by_name(base_url, type_id, pet_name)
             if pet_obj:
                 chosen = (sid, base_url, type_id, pet_obj)
                 break
         else:
-            # Choose randomly from all pets of this type in the store
-            pets = list_pets_for_type(base_url, type_id)
-            if pets:
-                pet_obj = random.choice(pets)
+            # The store resolves the type and picks the random pet itself - one small response
+            picked = random_pet(base_url, pet_type)
+            if picked:
+                type_id, pet_obj = picked
                 chosen = (sid, base_url, type_id, pet_obj)
                 break
 
@@ -182,6 +263,9 @@ def create_purchase():
 
     chosen_store, base_url, type_id, pet_obj = chosen
     chosen_name = pet_obj.get("name")
+    span = current_span()
+    span.set_attribute("purchase.pet_type", pet_type)
+    span.set_attribute("purchase.store", chosen_store)
 
     # Delete the pet from the store
     if not chosen_name or not delete_pet(base_url, type_id, chosen_name):
@@ -203,7 +287,10 @@ def create_purchase():
     }
 
     # Save to Mongo as transaction
-    transactions.insert_one(purchase_doc.copy())
+    if ledger_writer is not None:
+        ledger_writer.insert(purchase_doc.copy())
+    else:
+        ledger.insert_one(purchase_doc.copy())
 
     return jsonify(purchase_doc), 201
 
@@ -229,8 +316,19 @@ def get_transactions():
                     return error_400("invalid store filter")
             query[field] = value
 
-    # Retrieve from DB
-    docs = list(transactions.find(query, {"_id": 0}))  # Don't return Mongo's _id
+    # Optional purchase time range [since, until) - YYYY-MM-DD or ISO date-time, UTC by default
+    since = until = None
+    if "since" in request.args:
+        since = parse_time(request.args["since"])
+        if since is None:
+            return error_400("invalid since")
+    if "until" in request.args:
+        until = parse_time(request.args["until"])
+        if until is None:
+            return error_400("invalid until")
+
+    # Retrieve from the hot buckets and the archive - without Mongo's _id and the internal timestamp
+    docs = ledger.find(query, since, until)
 
     return jsonify(docs), 200
 
@@ -239,4 +337,4 @@ def kill_container():
     os._exit(1)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5003, debug=True)
+    app.run(host="0.0.0.0", port=5003, debug=True, use_reloader=USE_RELOADER)
@@ -0,0 +1,220 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+from pymongo import monitoring
+
+# -------------------------
+# Distributed tracing
+# -------------------------
+# Spans are propagated between services with the W3C "traceparent" header
+# (00-<trace id>-<parent span id>-01) and handed to a pluggable exporter.
+# TRACE_EXPORTER selects it: "none" (default, tracing off), "console" (stderr) or "file" (TRACE_FILE, NDJSON).
+
+TRACEPARENT_HEADER = "traceparent"
+
+_current_span = ContextVar("current_span", default=None)
+_exporter = None
+_service_name = "unknown"
+
+
+def _new_id(bits):
+    return "%0*x" % (bits // 4, random.getrandbits(bits))
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "status", "start_ns", "end_ns")
+
+    def __init__(self, name, trace_id=None, parent_id=None, attributes=None):
+        self.trace_id = trace_id or _new_id(128)
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if _exporter is not None:
+                _exporter.export(self.to_dict())
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self):
+        return {
+            "service": _service_name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_unix_nano": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+# Stand-in used while tracing is off, so call sites never have to check
+class _NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+# -------------------------
+# Exporters - any object with export(span_dict) can be installed with set_exporter()
+# -------------------------
+
+class ConsoleExporter:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+
+    def export(self, span):
+        self.stream.write(json.dumps(span) + "\n")
+
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+def set_exporter(exporter):
+    global _exporter
+    _exporter = exporter
+
+
+def exporter_from_env():
+    kind = os.environ.get("TRACE_EXPORTER", "none").lower()
+    if kind == "console":
+        return ConsoleExporter()
+    if kind == "file":
+        return FileExporter(os.environ.get("TRACE_FILE", "spans.ndjson"))
+    return None
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+# Starts a child of the current span (or a new trace) and makes it current for the `with` block
+@contextmanager
+def start_span(name, **attributes):
+    if _exporter is None:
+        yield NOOP_SPAN
+        return
+    parent = _current_span.get()
+    span = Span(name, parent.trace_id if parent else None, parent.span_id if parent else None, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = "error"
+        span.set_attribute("error", repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+# Returns headers (a new dict) carrying the trace context of the current span
+def inject(headers=None):
+    headers = dict(headers or {})
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.traceparent()
+    return headers
+
+
+# Parses a traceparent header, returns (trace_id, parent_span_id) or (None, None)
+def extract(headers):
+    parts = (headers.get(TRACEPARENT_HEADER) or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+# Child span per MongoDB command of the request that issued it (MongoClient(event_listeners=[...]))
+class MongoCommandTracer(monitoring.CommandListener):
+    def __init__(self):
+        self._spans = {}
+
+    def started(self, event):
+        parent = _current_span.get()
+        if _exporter is None or parent is None:
+            return
+        span = Span(f"mongo {event.command_name}", parent.trace_id, parent.span_id,
+                    {"db.name": event.database_name, "db.operation": event.command_name})
+        self._spans[(event.request_id, event.connection_id)] = span
+
+    def succeeded(self, event):
+        span = self._spans.pop((event.request_id, event.connection_id), None)
+        if span is not None:
+            span.end()
+
+    def failed(self, event):
+        span = self._spans.pop((event.request_id, event.connection_id), None)
+        if span is not None:
+            span.status = "error"
+            span.set_attribute("error", str(event.failure))
+            span.end()
+
+
+# Opens a server span per request, continuing the caller's trace when a traceparent header is present
+def init_tracing(app, service_name):
+    global _service_name
+    _service_name = service_name
+    set_exporter(exporter_from_env())
+
+    @app.before_request
+    def _start_request_span():
+        if _exporter is None:
+            return
+        trace_id, parent_id = extract(request.headers)
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        span = Span(f"{request.method} {route}", trace_id, parent_id,
+                    {"http.method": request.method, "http.target": request.full_path.rstrip("?")})
+        g.trace_span = span
+        g.trace_token = _current_span.set(span)
+
+    @app.after_request
+    def _record_status(response):
+        span = g.get("trace_span")
+        if span is not None:
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.status = "error"
+        return response
+
+    @app.teardown_request
+    def _end_request_span(exc):
+        span = g.pop("trace_span", None)
+        if span is not None:
+            if exc is not None:
+                span.status = "error"
+            _current_span.reset(g.pop("trace_token"))
+            span.end()
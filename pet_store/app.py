@@ -1,20 +1,53 @@
 import os
 import re
+import tempfile
+import threading
+import time
+from bisect import insort
 from datetime import datetime
-from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+from functools import wraps
+from urllib.parse import urlparse
 
 import requests
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, request, jsonify, send_file
+from pymongo import ReadPreference, ReturnDocument
+
+from admission import init_admission
+from breaker import CircuitBreaker
+from compression import compress, init_compression, negotiate, wanted
+from db import InstrumentedCollection, critical_write_concern, list_read_preference, mongo_client
+from json_provider import FastJSONProvider
+from metrics import MongoCommandMetrics, MongoPoolMetrics, cache_lookup, init_metrics, outbound_timer
+from picture_reconciler import PictureReconciler
+from profiling import init_profiling
+from read_model import LOWERCASE_FIELDS, ReadModel, lowercase_fields, pet_type_query
+from response_cache import LIST_TAG, ResponseCache
+from singleflight import SingleFlight
+from store_routing import StorePrefixMiddleware, requested_store_id
+from tracing import MongoCommandTracer, init_tracing, start_span
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+# /stores/<id>/... selects the store of a request (see store_routing.py)
+app.wsgi_app = StorePrefixMiddleware(app.wsgi_app)
+init_metrics(app)
+init_tracing(app, "pet-store")
+init_profiling(app, "pet-store")
+# Off unless ADMISSION_ROUTES names routes, e.g. "POST /pet-types,POST /pet-types/<pet_type_id>/pets"
+init_admission(app)
+# Large JSON responses are compressed for clients that accept it (COMPRESSION_* variables)
+init_compression(app)
 
 # Create pictures directory within the project
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PICTURES_DIR = os.path.join(BASE_DIR, "pictures")
-os.makedirs(PICTURES_DIR, exist_ok=True)
+PICTURES_DIR = os.environ.get("PICTURES_DIR", os.path.join(BASE_DIR, "pictures"))
 
 NINJA_API_KEY = os.environ.get("NINJA_API_KEY")
+NINJA_API_URL = os.environ.get("NINJA_API_URL", "https://api.api-ninjas.com/v1/animals")
+# While api-ninjas keeps failing, pet type creation fails fast instead of waiting for the timeout
+NINJA_BREAKER = CircuitBreaker("ninjas")
+# Concurrent creations of the same type name share one api-ninjas lookup
+NINJA_LOOKUPS = SingleFlight("ninjas")
 
 # pet_types = {} 
 # id = 0
@@ -25,19 +58,135 @@ NINJA_API_KEY = os.environ.get("NINJA_API_KEY")
 
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME = os.environ.get("DB_NAME", "petshop")
+# Store of the requests that name none. STORE_IDS lists further stores served by this process, e.g. "1,2,3"
 STORE_ID = os.environ.get("STORE_ID", "1")
+STORE_IDS = list(dict.fromkeys([STORE_ID] + [s.strip() for s in os.environ.get("STORE_IDS", "").split(",") if s.strip()]))
 
-client = MongoClient(MONGO_URL)
+# Pool sizes, timeouts, read preference and write concern are tuned by MONGO_* variables (see db.py).
+# One client (and pool) is shared by all the stores of the process.
+client = mongo_client(MONGO_URL, event_listeners=[MongoCommandMetrics(), MongoCommandTracer(), MongoPoolMetrics()])
 db = client[DB_NAME]
 
-# 2 Collection for pet types - one per store
-PET_TYPES_COL = db[f"pet_store{STORE_ID}"]
+# Fields the endpoints look pet types up by - checked against the indexes at startup. type/family/genus
+# are matched case-insensitively through their lowercase copies (_type, ... see read_model.py)
+QUERY_SHAPES = [["id"], ["_attributes"], ["_type"], ["_family"], ["_genus"], ["lifespan"]]
+
+# Optional in-memory read model serving the GET endpoints (READ_MODEL=1, see read_model.py).
+# Changes of other processes found by its poll drop their cached responses too.
+READ_MODEL_ENABLED = os.environ.get("READ_MODEL", "0") == "1"
+READ_MODEL_POLL_SECONDS = float(os.environ.get("READ_MODEL_POLL_SECONDS", "2"))
+READ_MODEL_POLLS = READ_MODEL_ENABLED and READ_MODEL_POLL_SECONDS > 0
+
+# Cache of encoded GET responses, invalidated by the write handlers of this process. Writes of other
+# processes (the other replicas of a store) only reach it through the read model's poll, so without one
+# the entries expire after RESPONSE_CACHE_TTL seconds - 5 by default, and a TTL of 0 (never) is refused.
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "0" if READ_MODEL_POLLS else "5"))
+if RESPONSE_CACHE_ENABLED and RESPONSE_CACHE_TTL <= 0 and not READ_MODEL_POLLS:
+    app.logger.warning("response cache disabled: RESPONSE_CACHE_TTL=0 needs the READ_MODEL poll, "
+                       "other processes' writes would never reach it")
+    RESPONSE_CACHE_ENABLED = False
+
+
+# Read preference of the list endpoints. A cached list is only dropped by the writes of this process, so
+# with no TTL a list read from a lagging secondary right after a write would be served stale until the next
+# write. A secondary MONGO_LIST_READ_PREFERENCE therefore needs RESPONSE_CACHE_TTL > 0 (lists are then at
+# most that many seconds stale) or RESPONSE_CACHE=0 - otherwise the lists are read from the primary.
+def store_list_read_preference():
+    preference = list_read_preference()
+    if RESPONSE_CACHE_ENABLED and RESPONSE_CACHE_TTL <= 0 and preference != ReadPreference.PRIMARY:
+        app.logger.warning("MONGO_LIST_READ_PREFERENCE=%s ignored: the response cache has no TTL "
+                           "(set RESPONSE_CACHE_TTL), reading the lists from the primary", preference.mongos_mode)
+        return ReadPreference.PRIMARY
+    return preference
+
+
+LIST_READ_PREFERENCE = store_list_read_preference()
+
+# Background deletion of orphaned picture files (see picture_reconciler.py). With PICTURE_DEFERRED_DELETE=1
+# the handlers leave the pictures they unreference to it instead of deleting them inline.
+PICTURE_GC_INTERVAL_SECONDS = float(os.environ.get("PICTURE_GC_INTERVAL_SECONDS", "3600"))
+PICTURE_GC_GRACE_SECONDS = float(os.environ.get("PICTURE_GC_GRACE_SECONDS", "3600"))
+PICTURE_GC_DRY_RUN = os.environ.get("PICTURE_GC_DRY_RUN", "0") == "1"
+PICTURE_DEFERRED_DELETE = os.environ.get("PICTURE_DEFERRED_DELETE", "0") == "1"
 
-# Retrieve existing pet types ID from the DB
-last = PET_TYPES_COL.find_one(sort=[("id", -1)])
-id = int(last["id"]) if last and "id" in last else 0
 
-image_number = 0
+# -------------------------
+# Stores
+# -------------------------
+# Everything that belongs to one store: its collection of pet types, ID counters, picture directory,
+# response cache, read model and picture reconciler. Requests are served by the store picked by
+# select_store(); the stores of a process share nothing but the Mongo client.
+
+class Store:
+    def __init__(self, store_id):
+        self.id = store_id
+        # Collection for pet types - one per store
+        self.pet_types = InstrumentedCollection(db[f"pet_store{store_id}"])
+        # GET /pet-types may read from secondaries (see LIST_READ_PREFERENCE), create_pet writes with the
+        # critical write concern
+        self.pet_types_list = self.pet_types.with_options(read_preference=LIST_READ_PREFERENCE)
+        self.pet_types_critical = self.pet_types.with_options(write_concern=critical_write_concern())
+        # STORE_ID keeps PICTURES_DIR to itself, every other store gets a subdirectory
+        self.pictures_dir = PICTURES_DIR if store_id == STORE_ID else os.path.join(PICTURES_DIR, f"store{store_id}")
+        # Pet types ID counter - seeded from the DB by initialize()
+        self.last_id = 0
+        self.image_number = 0
+        self._lock = threading.Lock()
+        self.response_cache = ResponseCache(max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL)
+        self.read_model = None
+        if READ_MODEL_ENABLED:
+            self.read_model = ReadModel(self.pet_types, on_change=self.response_cache.invalidate)
+        self.picture_reconciler = PictureReconciler(
+            self.pet_types, self.pictures_dir, grace_seconds=PICTURE_GC_GRACE_SECONDS, dry_run=PICTURE_GC_DRY_RUN)
+
+    # Unique identifier as a number
+    def next_id(self):
+        with self._lock:
+            self.last_id += 1
+            return self.last_id
+
+    def next_image_number(self):
+        with self._lock:
+            self.image_number += 1
+            return self.image_number
+
+    # Creates indexes, migrates old documents and seeds the ID counter
+    def initialize(self):
+        os.makedirs(self.pictures_dir, exist_ok=True)
+        # Every pet type endpoint looks its document up by id
+        self.pet_types.create_index("id")
+        # Multikey index - hasAttribute lookups only touch the matching pet types
+        self.pet_types.create_index("_attributes")
+        # The other GET /pet-types filters; _type also serves the duplicate check and /random-pet
+        for key in LOWERCASE_FIELDS.values():
+            self.pet_types.create_index(key)
+        self.pet_types.create_index("lifespan")
+        self.pet_types.check_indexes(QUERY_SHAPES)
+        backfill_internal_fields(self.pet_types)
+        normalize_pet_order(self.pet_types)
+
+        # Retrieve existing pet types ID from the DB - ids are strings, so "9" sorts after "10" in Mongo
+        ids = self.pet_types.find({}, {"_id": 0, "id": 1})
+        self.last_id = max((int(doc["id"]) for doc in ids if str(doc.get("id", "")).isdigit()), default=0)
+
+        if self.read_model is not None:
+            self.read_model.load()
+
+    # Background jobs, started once the store is initialized
+    def start_background(self):
+        if self.read_model is not None:
+            self.read_model.start_polling(READ_MODEL_POLL_SECONDS)
+        self.picture_reconciler.start(PICTURE_GC_INTERVAL_SECONDS)
+
+
+STORES = {store_id: Store(store_id) for store_id in STORE_IDS}
+
+
+# Store of the current request
+def current_store():
+    return g.store
 
 # -------------------------
 # Helper functions for errors
@@ -68,6 +217,15 @@ def error_500(status_code=None):
 def parse_date(date_str):
     return datetime.strptime(date_str, "%d-%m-%Y")
 
+# Converts a DD-MM-YYYY birthdate to a sortable YYYY-MM-DD key, None for "NA" or invalid dates
+def birthdate_key(date_str):
+    if not isinstance(date_str, str) or date_str == "NA":
+        return None
+    try:
+        return parse_date(date_str).strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
 # Converts lifespan text to number – always takes the smallest number.
 def parse_lifespan(text):
     if not text:
@@ -94,11 +252,20 @@ def fetch_animal_data(type_name):
         # use generic Exception to signal internal error
         raise Exception(500)
 
-    url = "https://api.api-ninjas.com/v1/animals"
+    url = NINJA_API_URL
     headers = {"X-Api-Key": NINJA_API_KEY}
     params = {"name": type_name}
 
-    resp = requests.get(url, headers=headers, params=params, timeout=5)
+    NINJA_BREAKER.check()
+    try:
+        with outbound_timer("ninjas") as call, start_span("GET ninjas", **{"animal.name": type_name}) as span:
+            resp = requests.get(url, headers=headers, params=params, timeout=5)
+            call.outcome = resp.status_code
+            span.set_attribute("http.status_code", resp.status_code)
+    except Exception:
+        NINJA_BREAKER.record(False)
+        raise
+    NINJA_BREAKER.record(resp.status_code < 500)
 
     # If code is not 200 – external server error
     if resp.status_code != 200:
@@ -143,12 +310,6 @@ def fetch_animal_data(type_name):
 # Helper functions for pet-types
 # -------------------------
 
-# Unique identifier as a number
-def generate_id():
-    global id
-    id += 1
-    return id
-
 # Creates dict to send to client without internal fields.
 def serialize_pet_type(pet):
     result = {
@@ -158,50 +319,331 @@ def serialize_pet_type(pet):
         "genus": pet["genus"],
         "attributes": pet["attributes"],
         "lifespan": pet["lifespan"],
-        "pets": sorted(pet["pets"]),
+        "pets": pet["pets"],  # kept sorted at write time
     }
 
     return result
 
 
+# Sort key of a birthdate index entry ({"d": YYYY-MM-DD, "n": pet name key})
+def index_entry_key(entry):
+    return (entry["d"], entry["n"])
+
+# Builds the sorted birthdate index of a pet type from its "_pets" map
+def build_birthdate_index(pets_map):
+    index = []
+    for key, pet_obj in pets_map.items():
+        d = birthdate_key(pet_obj.get("birthdate"))
+        if d:
+            index.append({"d": d, "n": key})
+    index.sort(key=index_entry_key)
+    return index
+
+# Lower-cased, de-duplicated attribute tokens backing the hasAttribute index
+def attribute_tokens(attributes):
+    return sorted({a.lower() for a in attributes if a})
+
+# Splits a hasAttribute / hasAnyAttribute value ("calm,loyal") into attribute tokens
+def parse_attribute_query(value):
+    return attribute_tokens(extract_attributes(value))
+
+# Backfills the internal index fields on pet types stored before they existed
+def backfill_internal_fields(collection):
+    internal = ["_birthdates", "_attributes", *LOWERCASE_FIELDS.values()]
+    missing = {"$or": [{key: {"$exists": False}} for key in internal]}
+    fields = {"id": 1, "_pets": 1, "attributes": 1, **dict.fromkeys(LOWERCASE_FIELDS, 1)}
+    for pt in collection.find(missing, fields):
+        collection.update_one(
+            {"id": pt["id"]},
+            {"$set": {
+                "_birthdates": build_birthdate_index(pt.get("_pets") or {}),
+                "_attributes": attribute_tokens(pt.get("attributes") or []),
+                **lowercase_fields(pt),
+            }, "$inc": {"_rev": 1}}
+        )
+
+# Sorts the "pets" name list of pet types stored before it was kept sorted at write time
+def normalize_pet_order(collection):
+    for pt in collection.find({}, {"id": 1, "pets": 1}):
+        names = pt.get("pets", [])
+        if any(a > b for a, b in zip(names, names[1:])):
+            collection.update_one({"id": pt["id"]}, {"$set": {"pets": sorted(names)}, "$inc": {"_rev": 1}})
+
+
+
 # Retrieves pet type by ID or returns 404 error
 def get_pet_type_or_404(pet_type_id):
-    pet = PET_TYPES_COL.find_one({"id": pet_type_id})
+    pet = current_store().pet_types.find_one({"id": pet_type_id})
     if pet is None:
         return None, error_404()
     return pet, None
 
+# Pets of a pet type born strictly between the bounds (YYYY-MM-DD keys, None = unbounded), by birthdate -
+# None if there is no such pet type. Mongo filters the birthdate index and returns only the matching pets
+def pets_born_between(collection, pet_type_id, gt_key, lt_key):
+    bounds = []
+    if gt_key:
+        bounds.append({"$gt": ["$$e.d", gt_key]})
+    if lt_key:
+        bounds.append({"$lt": ["$$e.d", lt_key]})
+    in_range = {"$filter": {"input": "$_birthdates", "as": "e", "cond": {"$and": bounds}}}
+    pipeline = [
+        {"$match": {"id": pet_type_id}},
+        {"$project": {"_id": 0, "index": in_range, "_pets": 1}},
+        {"$project": {"names": "$index.n", "pets": {"$filter": {
+            "input": {"$objectToArray": "$_pets"}, "as": "p", "cond": {"$in": ["$$p.k", "$index.n"]}}}}},
+    ]
+    found = collection.aggregate(pipeline)
+    if not found:
+        return None
+    pets = {p["k"]: p["v"] for p in found[0]["pets"]}
+    return [pets[name] for name in found[0]["names"] if name in pets]
+
+# Called after every write to a pet type: updates the read model, then drops its cached responses.
+# In that order a GET racing the write either caches before the invalidation (and is dropped by it) or
+# reads the updated record - never the old record under the new cache generation.
+# Writes also increment the pet type's "_rev", so the read models of other processes notice them.
+# A write of one pet passes the revision it produced and the pet (see ReadModel.apply_pet) - the record
+# is updated in memory instead of reloaded.
+def pet_type_changed(pet_type_id, rev=None, old_key=None, pet=None, birth_key=None):
+    store = current_store()
+    if store.read_model is not None:
+        if rev is None:
+            store.read_model.refresh(pet_type_id)
+        else:
+            store.read_model.apply_pet(pet_type_id, rev, old_key, pet, birth_key)
+    store.response_cache.invalidate(pet_type_id)
+
+# Applies `update` (which increments "_rev") to a pet type read at revision `read_rev`. Returns the revision
+# it produced when no other write came in between - the stored pet type is then exactly the one read plus
+# this update - otherwise None
+def update_pet_type(collection, pet_type_id, read_rev, update):
+    doc = collection.find_one_and_update({"id": pet_type_id}, update, projection={"_id": 0, "_rev": 1},
+                                         return_document=ReturnDocument.AFTER)
+    rev = doc.get("_rev") if doc is not None else None
+    return rev if rev == read_rev + 1 else None
+
+# Parses the filters of GET /pet-types into a spec: {"all"/"any": attribute tokens,
+# "id"/"type"/"family"/"genus": value (case-insensitive), "lifespan": int}. None if a value is invalid
+def parse_pet_type_filters(args):
+    spec = {}
+    # hasAttribute=a,b - pet type has all listed attributes (AND)
+    if "hasAttribute" in args:
+        spec["all"] = parse_attribute_query(args.get("hasAttribute", ""))
+    # hasAnyAttribute=a,b - pet type has at least one listed attribute (OR)
+    if "hasAnyAttribute" in args:
+        spec["any"] = parse_attribute_query(args.get("hasAnyAttribute", ""))
+    for field in ("id", "type", "family", "genus"):
+        if field in args:
+            spec[field] = args[field]
+    if "lifespan" in args:
+        try:
+            spec["lifespan"] = int(args["lifespan"])
+        except ValueError:
+            return None
+    return spec
+
 # -------------------------
 # Helper functions for pictures
 # -------------------------
 
+# Pictures larger than PICTURE_MAX_BYTES are refused - up front when the Content-Length says so,
+# otherwise as soon as the running byte count passes the limit
+PICTURE_MAX_BYTES = int(os.environ.get("PICTURE_MAX_BYTES", str(10 * 1024 * 1024)))
+# The file type comes from the first bytes of the body, not from the Content-Type header
+PICTURE_SIGNATURES = ((b"\xff\xd8\xff", ".jpg"), (b"\x89PNG\r\n\x1a\n", ".png"))
+SIGNATURE_BYTES = max(len(signature) for signature, _ in PICTURE_SIGNATURES)
+# Downloads in progress, renamed to their final name once complete
+PICTURE_TMP_PREFIX = ".download-"
+
+
+# Extension of a picture from its first bytes, None if it is not a JPEG/PNG image
+def picture_extension(head):
+    for signature, ext in PICTURE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+
 # Downloads image from URL to local file and returns filename.
+# The body is streamed into a temp file in the store's picture directory and renamed once it has been validated, so a
+# rejected or broken download never leaves a partial picture behind.
 def download_picture(url):
-    global image_number
-    resp = requests.get(url, stream=True, timeout=10)
-    if resp.status_code != 200:
-        # Error downloading image
-        raise Exception(resp.status_code)
-
-    content_type = resp.headers.get("Content-Type", "").lower()
-    if "image/jpeg" == content_type or "image/jpg" == content_type:
-        ext = ".jpg"
-    elif "png" in content_type:
-        ext = ".png"
-    else:
-        # Not a jpg/png image 
-        raise Exception(400)
-
-    image_number += 1  
-    filename = "image" + str(image_number) + ext
-    full_path = os.path.join(PICTURES_DIR, filename)
-    with open(full_path, "wb") as f:
-        for chunk in resp.iter_content(8192):
-            if chunk:
-                f.write(chunk)
+    pictures_dir = current_store().pictures_dir
+    # The host comes from the client - it goes on the span only, the metric label stays fixed
+    host = urlparse(url).hostname or "unknown"
+    with outbound_timer("picture") as call, start_span("GET picture", **{"http.host": host}) as span, \
+            requests.get(url, stream=True, timeout=10) as resp:
+        call.outcome = resp.status_code
+        span.set_attribute("http.status_code", resp.status_code)
+        if resp.status_code != 200:
+            # Error downloading image
+            raise Exception(resp.status_code)
+
+        length = resp.headers.get("Content-Length", "")
+        if length.isdigit() and int(length) > PICTURE_MAX_BYTES:
+            raise Exception(413)
+
+        fd, tmp_path = tempfile.mkstemp(prefix=PICTURE_TMP_PREFIX, dir=pictures_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                ext = None
+                head = b""
+                size = 0
+                for chunk in resp.iter_content(8192):
+                    size += len(chunk)
+                    if size > PICTURE_MAX_BYTES:
+                        raise Exception(413)
+                    if ext is None:
+                        # Sniffed as soon as enough bytes are in - usually the first chunk
+                        head += chunk
+                        if len(head) < SIGNATURE_BYTES:
+                            continue
+                        ext = picture_extension(head)
+                        if ext is None:
+                            raise Exception(400)
+                        chunk = head
+                    f.write(chunk)
+                if ext is None:
+                    # Shorter than any signature
+                    raise Exception(400)
+
+            filename = "image" + str(current_store().next_image_number()) + ext
+            os.replace(tmp_path, os.path.join(pictures_dir, filename))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
     return filename
 
 
+# Deletes a picture file no pet refers to anymore - called once the pet is written without it
+def remove_picture(filename):
+    if PICTURE_DEFERRED_DELETE or not filename or filename == "NA":
+        return
+    try:
+        os.remove(os.path.join(current_store().pictures_dir, filename))
+    except FileNotFoundError:
+        pass
+
+
+# -------------------------
+# Startup
+# -------------------------
+# All DB work happens in initialize(), run by a background thread with exponential backoff
+# (INIT_BACKOFF_SECONDS .. INIT_BACKOFF_MAX_SECONDS) instead of at import time. Until it has
+# finished, /readyz answers 503 and so do the API routes; /livez only reports that the process is up.
+
+INIT_BACKOFF_SECONDS = float(os.environ.get("INIT_BACKOFF_SECONDS", "0.5"))
+INIT_BACKOFF_MAX_SECONDS = float(os.environ.get("INIT_BACKOFF_MAX_SECONDS", "10"))
+# Routes served before initialization has finished
+UNGATED_ROUTES = {"/livez", "/readyz", "/metrics", "/kill"}
+
+startup = {"ready": False, "attempts": 0, "last_error": None, "started": time.monotonic(), "seconds": None}
+_init_lock = threading.Lock()
+
+# Initializes every store of the process
+def initialize():
+    for store in STORES.values():
+        store.initialize()
+
+# Runs initialize() until it succeeds, backing off between attempts
+def initialize_with_backoff():
+    delay = INIT_BACKOFF_SECONDS
+    while True:
+        with _init_lock:
+            if startup["ready"]:
+                return
+            startup["attempts"] += 1
+            try:
+                initialize()
+                startup["ready"] = True
+                startup["last_error"] = None
+                startup["seconds"] = round(time.monotonic() - startup["started"], 3)
+                app.logger.info("pet-store ready after %s s (%d attempts)", startup["seconds"], startup["attempts"])
+                for store in STORES.values():
+                    store.start_background()
+                return
+            except Exception as e:
+                # Mongo or disk not there yet, but also bad data in a migration - keep retrying, visibly
+                startup["last_error"] = f"{type(e).__name__}: {e}"
+                app.logger.exception("initialization attempt %d failed", startup["attempts"])
+        time.sleep(delay)
+        delay = min(delay * 2, INIT_BACKOFF_MAX_SECONDS)
+
+# The debug reloader runs this module twice: in a watcher process that never serves requests and in the
+# serving child it starts (WERKZEUG_RUN_MAIN=true). Initialization and background jobs only run in the latter.
+def serving_process():
+    return __name__ != "__main__" or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+
+def start_initialization():
+    if not serving_process():
+        return
+    threading.Thread(target=initialize_with_backoff, name="pet-store-init", daemon=True).start()
+
+# API routes answer 503 until the store is initialized
+@app.before_request
+def require_ready():
+    if startup["ready"]:
+        return None
+    if request.url_rule is not None and request.url_rule.rule in UNGATED_ROUTES:
+        return None
+    resp = jsonify({"server error": "service is starting"})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
+# Picks the store of the request - unknown stores are 404
+@app.before_request
+def select_store():
+    store_id = requested_store_id(request)
+    g.store = STORES.get(store_id or STORE_ID)
+    if g.store is None:
+        return error_404()
+    return None
+
+
+# -------------------------
+# Response cache
+# -------------------------
+
+# Serves a GET route from the response cache. The encoded body is stored with its ETag,
+# so hits skip Mongo and JSON encoding, and conditional GETs get 304 Not Modified.
+# Compressed variants are kept with the entry, so each body is compressed once per encoding.
+def cached_response(view):
+    @wraps(view)
+    def wrapper(**kwargs):
+        if not RESPONSE_CACHE_ENABLED:
+            return view(**kwargs)
+
+        response_cache = current_store().response_cache
+        key = response_cache.make_key(request.path, request.args)
+        entry = response_cache.get(key)
+        cache_lookup("response", entry is not None)
+        if entry is None:
+            generation = response_cache.generation
+            resp = app.make_response(view(**kwargs))
+            if resp.status_code != 200:
+                return resp
+            tag = kwargs.get("pet_type_id", LIST_TAG)
+            entry = response_cache.put(key, tag, resp.get_data(), resp.mimetype, generation)
+
+        # Compressed bodies are cached with the entry and get their own ETag
+        compressible = wanted(entry.mimetype, len(entry.body))
+        encoding = negotiate() if compressible else None
+        etag = entry.etag if encoding is None else f"{entry.etag}-{encoding}"
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        elif encoding is None:
+            resp = Response(entry.body, status=200, mimetype=entry.mimetype)
+        else:
+            resp = Response(entry.variant(encoding, compress), status=200, mimetype=entry.mimetype)
+            resp.headers["Content-Encoding"] = encoding
+        if compressible:
+            resp.vary.add("Accept-Encoding")
+        resp.set_etag(etag)
+        return resp
+    return wrapper
+
+
 # -------------------------
 # /pet-types – collection of pet types
 # -------------------------
@@ -225,14 +667,12 @@ def create_pet_type():
     # Check if pet-type with same type already exists (case-insensitive)
 # Check if pet-type with same type already exists (case-insensitive)
     lower_type = type_name.lower()
-    existing = PET_TYPES_COL.find_one(
-        {"type": {"$regex": f"^{re.escape(type_name)}$", "$options": "i"}}
-    )
+    existing = current_store().pet_types.find_one({"_type": lower_type})
     if existing is not None:
         return error_400()
 
     try:
-        ninja_data = fetch_animal_data(type_name)
+        ninja_data = NINJA_LOOKUPS.do(lower_type, lambda: fetch_animal_data(type_name))
     except Exception as e:
         # If Ninja doesn't find animal – 400. Otherwise 500.
         status = e.args[0] if e.args else None
@@ -242,7 +682,7 @@ def create_pet_type():
         # "type" not recognized by Ninja – 400
         return error_400()
 
-    pet_id = str(generate_id())
+    pet_id = str(current_store().next_id())
     pet = {
         "id": pet_id,
         "type": type_name,
@@ -252,47 +692,41 @@ def create_pet_type():
         "lifespan": ninja_data["lifespan"],  # Can be None
         "pets": [],           # list of names
         "_pets": {},          # internal: name -> pet object
+        "_birthdates": [],    # internal: pets sorted by birthdate, {"d": YYYY-MM-DD, "n": name}
+        "_attributes": attribute_tokens(ninja_data["attributes"]),  # internal: hasAttribute index
+        "_rev": 0,            # internal: incremented by every write, polled by read models
     }
+    pet.update(lowercase_fields(pet))   # internal: _type/_family/_genus, case-insensitive filters
 
-    PET_TYPES_COL.insert_one(pet)
+    current_store().pet_types.insert_one(pet)
+    pet_type_changed(pet_id)
     return jsonify(serialize_pet_type(pet)), 201
 
 
 
 # Retrieves all pet types with optional filtering
 @app.route("/pet-types", methods=["GET"])
+@cached_response
 def get_pet_types():
-    all_docs = list(PET_TYPES_COL.find({}))
-    results = [serialize_pet_type(pet) for pet in all_docs]
+    read_model = current_store().read_model
     args = request.args
     if not args:
+        if read_model is not None:
+            return jsonify(read_model.find({})), 200
+        results = [serialize_pet_type(pet) for pet in current_store().pet_types_list.find({})]
         return jsonify(results), 200
 
-    filtered = []
-    # hasAttribute
-    if "hasAttribute" in args:
-        attr = args.get("hasAttribute", "").lower()
-        for pet in results:
-            if any(a.lower() == attr for a in pet["attributes"]):
-                filtered.append(pet)
-        # return jsonify(filtered), 200
-
-    # field filter
-    allowed_fields = {"id", "type", "family", "genus", "lifespan"}
-    if any(field in args for field in allowed_fields):
-        filtered = filtered or results 
-        for field in allowed_fields:
-            if field in args:
-                value = args[field]
-                if field == "lifespan":
-                    try:
-                        value_int = int(value)
-                    except ValueError:
-                        return error_400()
-                    filtered = [pet for pet in filtered if pet["lifespan"] == value_int]
-                else:
-                    filtered = [pet for pet in filtered if isinstance(pet.get(field), str) and pet[field].lower() == value.lower()]
+    spec = parse_pet_type_filters(args)
+    if spec is None:
+        return error_400()
+
+    # No supported filter in the query string
+    if not spec:
+        return jsonify([]), 200
 
+    if read_model is not None:
+        return jsonify(read_model.find(spec)), 200
+    filtered = [serialize_pet_type(pet) for pet in current_store().pet_types_list.find(pet_type_query(spec))]
     return jsonify(filtered), 200
 
 
@@ -302,7 +736,13 @@ def get_pet_types():
 
 # Retrieves a specific pet type by ID
 @app.route("/pet-types/<pet_type_id>", methods=["GET"])
+@cached_response
 def get_pet_type(pet_type_id):
+    read_model = current_store().read_model
+    if read_model is not None:
+        record = read_model.get(pet_type_id)
+        return (jsonify(record.to_dict()), 200) if record else error_404()
+
     pet, err = get_pet_type_or_404(pet_type_id)
     if err:
         return err
@@ -312,13 +752,15 @@ def get_pet_type(pet_type_id):
 # Deletes a pet type by ID
 @app.route("/pet-types/<pet_type_id>", methods=["DELETE"])
 def delete_pet_type(pet_type_id):
-    pet = PET_TYPES_COL.find_one({"id": pet_type_id})
+    pet_types = current_store().pet_types
+    pet = pet_types.find_one({"id": pet_type_id})
     if pet is None:
         return error_404()
     if pet["pets"]:
         return error_400()
 
-    PET_TYPES_COL.delete_one({"id": pet_type_id})
+    pet_types.delete_one({"id": pet_type_id})
+    pet_type_changed(pet_type_id)
     return "", 204
 
 
@@ -353,10 +795,10 @@ def create_pet(pet_type_id):
         return error_400()
 
     birthdate = data.get("birthdate", "NA")
+    birth_key = None
     if birthdate != "NA":
-        try:
-            parse_date(birthdate)
-        except Exception:
+        birth_key = birthdate_key(birthdate)
+        if birth_key is None:
             return error_400()
 
     picture_url = data.get("picture-url", None)
@@ -376,62 +818,54 @@ def create_pet(pet_type_id):
     }
 
     pt["_pets"][name] = pet
-    pt["pets"].append(name)
+    insort(pt["pets"], name)
+
+    # Names are kept sorted, so serialization never has to sort
+    push = {"pets": {"$each": [name], "$sort": 1}}
+    if birth_key:
+        # Keep the birthdate index sorted inside the document
+        push["_birthdates"] = {"$each": [{"d": birth_key, "n": name}], "$sort": {"d": 1, "n": 1}}
 
-    PET_TYPES_COL.update_one(
-        {"id": pet_type_id},
-        {
-            "$set": {f"_pets.{name}": pet},
-            "$push": {"pets": name}
-        }
-    )
+    rev = update_pet_type(current_store().pet_types_critical, pet_type_id, pt.get("_rev", 0), {
+        "$set": {f"_pets.{name}": pet},
+        "$push": push,
+        "$inc": {"_rev": 1},
+    })
+    pet_type_changed(pet_type_id, rev, pet=pet, birth_key=birth_key)
 
     return jsonify(pet), 201
 
 
 # Retrieves all pets for a specific pet type with optional date filtering
 @app.route("/pet-types/<pet_type_id>/pets", methods=["GET"])
+@cached_response
 def get_pets_for_type(pet_type_id):
-    pet, err = get_pet_type_or_404(pet_type_id)
-    if err:
-        return err
-
-    pets = list(pet["_pets"].values())
-
+    read_model = current_store().read_model
     gt = request.args.get("birthdateGT")
     lt = request.args.get("birthdateLT")
-
-    # Checks if pet's birthdate matches the filter criteria
-    def date_ok(pet_obj):
-        if pet_obj["birthdate"] == "NA":
-            return False
-        try:
-            d = parse_date(pet_obj["birthdate"])
-        except Exception:
-            return False
-        if gt:
-            try:
-                d_gt = parse_date(gt)
-            except Exception:
-                raise ValueError
-            if not d > d_gt:
-                return False
-        if lt:
-            try:
-                d_lt = parse_date(lt)
-            except Exception:
-                raise ValueError
-            if not d < d_lt:
-                return False
-        return True
-
-    if gt or lt:
-        try:
-            pets = [p for p in pets if date_ok(p)]
-        except ValueError:
-            return error_400()
-
-    return jsonify(pets), 200
+    if not gt and not lt:
+        if read_model is not None:
+            pet = read_model.get(pet_type_id)
+            return (jsonify([p.to_dict() for p in pet.pets.values()]), 200) if pet else error_404()
+        pet, err = get_pet_type_or_404(pet_type_id)
+        return err or (jsonify(list(pet["_pets"].values())), 200)
+
+    # Parse the bounds once, then answer the range from the sorted birthdate index
+    gt_key = birthdate_key(gt) if gt else None
+    lt_key = birthdate_key(lt) if lt else None
+    if (gt and gt_key is None) or (lt and lt_key is None):
+        # An unknown pet type is still a 404
+        if read_model is not None:
+            exists = read_model.get(pet_type_id) is not None
+        else:
+            exists = current_store().pet_types.find_one({"id": pet_type_id}, {"_id": 1}) is not None
+        return error_400() if exists else error_404()
+
+    if read_model is not None:
+        pet = read_model.get(pet_type_id)
+        return (jsonify(pet.pets_born_between(gt_key, lt_key)), 200) if pet else error_404()
+    pets = pets_born_between(current_store().pet_types, pet_type_id, gt_key, lt_key)
+    return (jsonify(pets), 200) if pets is not None else error_404()
 
 # ------------------------------------------------------------------------------------------------------------------
 
@@ -439,6 +873,12 @@ def get_pets_for_type(pet_type_id):
 # Retrieves a specific pet by name
 @app.route("/pet-types/<pet_type_id>/pets/<name>", methods=["GET"])
 def get_pet(pet_type_id, name):
+    read_model = current_store().read_model
+    if read_model is not None:
+        record = read_model.get(pet_type_id)
+        pet = record.pets.get(name.lower()) if record else None
+        return (jsonify(pet.to_dict()), 200) if pet else error_404()
+
     pet, err = get_pet_type_or_404(pet_type_id)
     if err:
         return err
@@ -460,20 +900,20 @@ def delete_pet(pet_type_id, name):
     if not pet:
         return error_404()
 
-    # Delete picture file if exists
-    picture = pet.get("picture")
-    if picture and picture != "NA":
-        full_path = os.path.join(PICTURES_DIR, picture)
-        if os.path.exists(full_path):
-            os.remove(full_path)
-
     del pt["_pets"][name.lower()]
     pt["pets"] = [n for n in pt["pets"] if n.lower() != name.lower()]
 
-    PET_TYPES_COL.update_one({"id": pet_type_id}, {"$set": {
-    "_pets": pt["_pets"],
-    "pets": pt["pets"],
-}})
+    rev = update_pet_type(current_store().pet_types, pet_type_id, pt.get("_rev", 0), {
+        "$set": {
+            "_pets": pt["_pets"],
+            "pets": pt["pets"],
+        },
+        "$pull": {"_birthdates": {"n": name.lower()}},
+        "$inc": {"_rev": 1},
+    })
+    pet_type_changed(pet_type_id, rev, old_key=name.lower())
+    # Delete picture file if exists
+    remove_picture(pet.get("picture"))
 
     return "", 204
 
@@ -505,10 +945,10 @@ def update_pet(pet_type_id, name):
         return error_404()
 
     birthdate = data.get("birthdate", "NA")
+    birth_key = None
     if birthdate != "NA":
-        try:
-            parse_date(birthdate)
-        except Exception:
+        birth_key = birthdate_key(birthdate)
+        if birth_key is None:
             return error_400()
 
     old_picture = pet.get("picture", "NA")
@@ -522,32 +962,67 @@ def update_pet(pet_type_id, name):
     else:
         picture_filename = "NA"
 
-    if picture_filename != "NA" and old_picture and old_picture != "NA":
-        full_path = os.path.join(PICTURES_DIR, old_picture)
-        if os.path.exists(full_path):
-            os.remove(full_path)
-
     # Update map according to new name (keys in dictionary + list of names)
     if new_key != old_key:
         if new_key in pt["_pets"]:
             return error_400()  # Pet with this name already exists
         del pt["_pets"][old_key]
         pt["_pets"][new_key] = pet
-        pt["pets"] = [
-            new_name if n.lower() == old_key else n
-            for n in pt["pets"]
-        ]
+        pt["pets"] = [n for n in pt["pets"] if n.lower() != old_key]
+        insort(pt["pets"], new_name)
 
     # Here we save the name as it came from the client (with uppercase letter)
     pet["name"] = new_name
     pet["birthdate"] = birthdate
     pet["picture"] = picture_filename
 
-    PET_TYPES_COL.update_one({"id": pet_type_id}, {"$set": pt})
+    # Re-position the pet in the birthdate index (name and/or birthdate may have changed)
+    index = pt.get("_birthdates")
+    if index is None:
+        index = build_birthdate_index(pt["_pets"])
+    else:
+        index = [e for e in index if e["n"] != old_key]
+        if birth_key:
+            insort(index, {"d": birth_key, "n": new_key}, key=index_entry_key)
+    pt["_birthdates"] = index
+
+    read_rev = pt.pop("_rev", 0)
+    rev = update_pet_type(current_store().pet_types, pet_type_id, read_rev, {"$set": pt, "$inc": {"_rev": 1}})
+    pet_type_changed(pet_type_id, rev, old_key=old_key, pet=pet, birth_key=birth_key)
+    # The replaced picture is deleted only once the pet no longer refers to it
+    if picture_filename not in ("NA", old_picture):
+        remove_picture(old_picture)
 
     return jsonify(pet), 200
 
 
+# -------------------------
+# /random-pet
+# -------------------------
+
+# Picks a random pet of the type named by ?type= (case-insensitive), sampled inside Mongo so only
+# one pet crosses the wire: {"pet-type-id": <id>, "pet": <pet>}. 404 when no such type has pets.
+@app.route("/random-pet", methods=["GET"])
+def get_random_pet():
+    type_name = request.args.get("type")
+    if not type_name:
+        return error_400()
+
+    pipeline = [
+        {"$match": {"_type": type_name.lower(), "pets.0": {"$exists": True}}},
+        {"$limit": 1},
+        {"$project": {"_id": 0, "id": 1, "pet": {"$let": {
+            "vars": {"all": {"$objectToArray": "$_pets"}},
+            "in": {"$arrayElemAt": ["$$all", {"$floor": {"$multiply": [{"$rand": {}}, {"$size": "$$all"}]}}]},
+        }}}},
+    ]
+    # Read from the primary - a lagging secondary could hand out a pet that was already sold
+    picked = current_store().pet_types.aggregate(pipeline)
+    if not picked or not picked[0].get("pet"):
+        return error_404()
+    return jsonify({"pet-type-id": picked[0]["id"], "pet": picked[0]["pet"]["v"]}), 200
+
+
 # -------------------------
 # /pictures/{file-name}
 # -------------------------
@@ -555,8 +1030,9 @@ def update_pet(pet_type_id, name):
 # Returns the picture file itself. the Content-Type of the response should be image/jpeg or image/png.
 @app.route("/pictures/<file_name>", methods=["GET"])
 def get_picture(file_name):
-    full_path = os.path.join(PICTURES_DIR, file_name)
-    if not os.path.exists(full_path):
+    full_path = os.path.join(current_store().pictures_dir, file_name)
+    # Not the picture directories of the other stores
+    if not os.path.isfile(full_path):
         return error_404()
 
     if file_name.lower().endswith(".jpeg")or file_name.lower().endswith(".jpg"):
@@ -566,10 +1042,28 @@ def get_picture(file_name):
 
     return send_file(full_path, mimetype=mimetype), 200
 
+# -------------------------
+# Health
+# -------------------------
+
+# Liveness - the process is up and serving HTTP
+@app.route("/livez", methods=["GET"])
+def livez():
+    return jsonify({"status": "alive"}), 200
+
+# Readiness - indexes, migrations and the ID counter are done, traffic can be routed here
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    if startup["ready"]:
+        return jsonify({"status": "ready", "startup_seconds": startup["seconds"]}), 200
+    return jsonify({"status": "starting", "attempts": startup["attempts"], "last_error": startup["last_error"]}), 503
+
 @app.route("/kill", methods=["GET"])
 def kill_container():
     os._exit(1)
 
+start_initialization()
+
 if __name__ == "__main__":
     # Server must run on port 5001 
     print("running server on host 0.0.0.0 and port 5001")
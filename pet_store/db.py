@@ -0,0 +1,190 @@
+import logging
+import os
+import time
+
+from pymongo import MongoClient, ReadPreference
+from pymongo.write_concern import WriteConcern
+
+log = logging.getLogger("db")
+
+# -------------------------
+# Instrumented data access
+# -------------------------
+# Every MongoDB operation of the service goes through InstrumentedCollection. Operations slower than
+# MONGO_SLOW_MS are logged with the shape of their filter (values replaced by their type), and with
+# MONGO_EXPLAIN_SLOW=1 the winning plan of slow reads is logged too.
+
+SLOW_MS = float(os.environ.get("MONGO_SLOW_MS", "100"))
+EXPLAIN_SLOW = os.environ.get("MONGO_EXPLAIN_SLOW", "0") == "1"
+
+
+# -------------------------
+# Client configuration
+# -------------------------
+# MongoClient options read from the environment (unset = pymongo default). Pool sizes are per process,
+# so with several workers the deployment opens up to workers * MONGO_MAX_POOL_SIZE connections.
+CLIENT_OPTIONS = {
+    "maxPoolSize": "MONGO_MAX_POOL_SIZE",
+    "minPoolSize": "MONGO_MIN_POOL_SIZE",
+    "maxIdleTimeMS": "MONGO_MAX_IDLE_TIME_MS",
+    "waitQueueTimeoutMS": "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+    "serverSelectionTimeoutMS": "MONGO_SERVER_SELECTION_TIMEOUT_MS",
+    "connectTimeoutMS": "MONGO_CONNECT_TIMEOUT_MS",
+    "socketTimeoutMS": "MONGO_SOCKET_TIMEOUT_MS",
+}
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primarypreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondarypreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+def mongo_client(url, event_listeners=()):
+    options = {opt: int(os.environ[env]) for opt, env in CLIENT_OPTIONS.items() if os.environ.get(env)}
+    return MongoClient(url, event_listeners=list(event_listeners), **options)
+
+
+# Read preference of the list endpoints (MONGO_LIST_READ_PREFERENCE, e.g. "secondaryPreferred").
+# Secondary reads may lag the primary by the replication delay - a cache of their results must expire,
+# or it keeps a stale list until the next local write (pet-store reads from the primary then, see app.py).
+# An unknown name is logged and the lists are read from the primary.
+def list_read_preference():
+    name = os.environ.get("MONGO_LIST_READ_PREFERENCE", "primary")
+    preference = READ_PREFERENCES.get(name.strip().lower())
+    if preference is None:
+        log.warning("MONGO_LIST_READ_PREFERENCE=%r is not one of %s, reading the lists from the primary",
+                    name, ", ".join(READ_PREFERENCES))
+        return ReadPreference.PRIMARY
+    return preference
+
+
+# Write concern of the critical writes (MONGO_WRITE_W, MONGO_WRITE_J, MONGO_WRITE_TIMEOUT_MS), None = client default
+def critical_write_concern():
+    w = os.environ.get("MONGO_WRITE_W")
+    j = os.environ.get("MONGO_WRITE_J")
+    wtimeout = os.environ.get("MONGO_WRITE_TIMEOUT_MS")
+    if w is None and j is None and wtimeout is None:
+        return None
+    if w is not None and w.isdigit():
+        w = int(w)
+    return WriteConcern(
+        w=w,
+        j=None if j is None else j.lower() in ("1", "true"),
+        wtimeout=None if wtimeout is None else int(wtimeout),
+    )
+
+
+# Filter with every value replaced by its type name, e.g. {"id": "str", "$and": [{"lifespan": "int"}]}
+def filter_shape(value):
+    if isinstance(value, dict):
+        return {k: filter_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(v, dict) for v in value):
+            return [filter_shape(v) for v in value]
+        return "list"
+    return type(value).__name__
+
+
+# Short description of a query plan: the chain of stages and the index used, e.g. "FETCH <- IXSCAN(id_1)"
+def plan_summary(explain):
+    plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    plan = plan.get("queryPlan", plan)
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage")
+    return " <- ".join(stages)
+
+
+class InstrumentedCollection:
+    """
+    Thin wrapper of a pymongo Collection that times every operation.
+    find() and aggregate() return lists, so the timing covers fetching the results.
+    """
+
+    def __init__(self, collection, slow_ms=None, explain_slow=None):
+        self.collection = collection
+        self.slow_ms = SLOW_MS if slow_ms is None else slow_ms
+        self.explain_slow = EXPLAIN_SLOW if explain_slow is None else explain_slow
+
+    # Anything not wrapped below goes straight to the collection
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    # Same collection with another read preference / write concern, still instrumented
+    def with_options(self, **options):
+        options = {k: v for k, v in options.items() if v is not None}
+        return InstrumentedCollection(self.collection.with_options(**options), self.slow_ms, self.explain_slow)
+
+    def _run(self, op, filter, fn, explain=None):
+        start = time.perf_counter()
+        result = fn()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms >= self.slow_ms:
+            log.warning("slow mongo %s on %s: %.1f ms, filter %s",
+                        op, self.collection.name, elapsed_ms, filter_shape(filter or {}))
+            if self.explain_slow and explain is not None:
+                try:
+                    log.warning("plan of slow mongo %s on %s: %s", op, self.collection.name, plan_summary(explain()))
+                except Exception as e:
+                    log.warning("explain of slow mongo %s on %s failed: %s", op, self.collection.name, e)
+        return result
+
+    def find(self, filter=None, projection=None, **kwargs):
+        return self._run("find", filter, lambda: list(self.collection.find(filter, projection, **kwargs)),
+                         lambda: self.collection.find(filter, projection, **kwargs).explain())
+
+    def find_one(self, filter=None, projection=None, **kwargs):
+        return self._run("find_one", filter, lambda: self.collection.find_one(filter, projection, **kwargs),
+                         lambda: self.collection.find(filter, projection, limit=1, **kwargs).explain())
+
+    def count_documents(self, filter, **kwargs):
+        return self._run("count_documents", filter, lambda: self.collection.count_documents(filter, **kwargs),
+                         lambda: self.collection.find(filter).explain())
+
+    def aggregate(self, pipeline, **kwargs):
+        match = pipeline[0].get("$match") if pipeline else None
+        return self._run("aggregate", match, lambda: list(self.collection.aggregate(pipeline, **kwargs)))
+
+    def insert_one(self, document, **kwargs):
+        return self._run("insert_one", None, lambda: self.collection.insert_one(document, **kwargs))
+
+    def insert_many(self, documents, **kwargs):
+        return self._run("insert_many", None, lambda: self.collection.insert_many(documents, **kwargs))
+
+    def update_one(self, filter, update, **kwargs):
+        return self._run("update_one", filter, lambda: self.collection.update_one(filter, update, **kwargs))
+
+    def find_one_and_update(self, filter, update, **kwargs):
+        return self._run("find_one_and_update", filter,
+                         lambda: self.collection.find_one_and_update(filter, update, **kwargs))
+
+    def update_many(self, filter, update, **kwargs):
+        return self._run("update_many", filter, lambda: self.collection.update_many(filter, update, **kwargs))
+
+    def delete_one(self, filter, **kwargs):
+        return self._run("delete_one", filter, lambda: self.collection.delete_one(filter, **kwargs))
+
+    def delete_many(self, filter, **kwargs):
+        return self._run("delete_many", filter, lambda: self.collection.delete_many(filter, **kwargs))
+
+    # Warns about query shapes (lists of fields used together in filters) that no index supports.
+    # An index supports a shape when the shape's fields are a prefix of the index keys.
+    def check_indexes(self, shapes):
+        try:
+            indexes = [[key for key, _ in info["key"]] for info in self.collection.index_information().values()]
+        except Exception as e:
+            log.warning("index check of %s failed: %s", self.collection.name, e)
+            return []
+        missing = []
+        for fields in shapes:
+            if not any(sorted(index[:len(fields)]) == sorted(fields) for index in indexes):
+                missing.append(fields)
+                log.warning("no index on %s supports queries on %s", self.collection.name, ", ".join(fields))
+        return missing
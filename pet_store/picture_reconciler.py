@@ -0,0 +1,113 @@
+import logging
+import os
+import threading
+import time
+
+from prometheus_client import Counter
+
+log = logging.getLogger("picture_reconciler")
+
+# -------------------------
+# Orphaned picture reconciler
+# -------------------------
+# A picture file is referenced by the "picture" field of a pet of this store. Files of failed requests
+# (a download whose pet was never written) and pictures whose delete was deferred (PICTURE_DEFERRED_DELETE=1)
+# are orphans. Every PICTURE_GC_INTERVAL_SECONDS the reconciler lists the picture directory of the store,
+# reads the referenced names from Mongo and deletes the unreferenced files last modified more than
+# PICTURE_GC_GRACE_SECONDS ago - the grace period covers downloads whose pet is not written yet.
+# Only the files directly in the directory are considered, subdirectories (other stores) are skipped.
+
+PICTURES_RECLAIMED = Counter(
+    "pictures_reclaimed_total",
+    "Orphaned picture files deleted by the picture reconciler",
+)
+
+PICTURE_BYTES_RECLAIMED = Counter(
+    "picture_reclaimed_bytes_total",
+    "Disk space freed by the picture reconciler, in bytes",
+)
+
+# Picture names of every pet type, without shipping the pets themselves
+REFERENCES_PIPELINE = [
+    {"$project": {
+        "_id": 0,
+        "pictures": {"$map": {
+            "input": {"$objectToArray": {"$ifNull": ["$_pets", {}]}},
+            "as": "pet",
+            "in": "$$pet.v.picture",
+        }},
+    }},
+]
+
+
+class PictureReconciler:
+    def __init__(self, collection, pictures_dir, grace_seconds=3600, dry_run=False):
+        self.collection = collection
+        self.pictures_dir = pictures_dir
+        self.grace_seconds = grace_seconds
+        self.dry_run = dry_run          # report the orphans without deleting them
+        self.last_run = None            # stats of the latest run
+
+    def referenced(self):
+        names = set()
+        for doc in self.collection.aggregate(REFERENCES_PIPELINE):
+            names.update(name for name in doc.get("pictures") or () if name and name != "NA")
+        return names
+
+    # Files old enough to be deleted if unreferenced: name -> size
+    def candidates(self, now=None):
+        cutoff = (now or time.time()) - self.grace_seconds
+        files = {}
+        try:
+            entries = list(os.scandir(self.pictures_dir))
+        except FileNotFoundError:
+            return files
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime < cutoff:
+                        files[entry.name] = stat.st_size
+            except FileNotFoundError:
+                pass    # deleted meanwhile
+        return files
+
+    # Deletes the orphans once, returns {"scanned", "orphans", "deleted", "bytes"}
+    def run(self, now=None):
+        # Listed before the references are read: a file created in between is too young to be a candidate
+        files = self.candidates(now)
+        orphans = sorted(set(files) - self.referenced()) if files else []
+        deleted = 0
+        reclaimed = 0
+        for name in orphans:
+            if not self.dry_run:
+                try:
+                    os.remove(os.path.join(self.pictures_dir, name))
+                except FileNotFoundError:
+                    continue
+            deleted += 1
+            reclaimed += files[name]
+
+        if not self.dry_run:
+            PICTURES_RECLAIMED.inc(deleted)
+            PICTURE_BYTES_RECLAIMED.inc(reclaimed)
+        self.last_run = {"scanned": len(files), "orphans": len(orphans), "deleted": deleted, "bytes": reclaimed}
+        if orphans:
+            log.warning("%s %d orphaned pictures of %d checked in %s, %d bytes",
+                        "found" if self.dry_run else "deleted", deleted, len(files), self.pictures_dir, reclaimed)
+        return self.last_run
+
+    def start(self, interval):
+        if interval <= 0:
+            return None
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.run()
+                except Exception as e:
+                    log.warning("picture reconciliation failed: %s", e)
+
+        stop = threading.Event()
+        threading.Thread(target=run, name="picture-reconciler", daemon=True).start()
+        return stop
@@ -0,0 +1,159 @@
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, request
+
+# -------------------------
+# Per-request profiling
+# -------------------------
+# A request is profiled when either
+#   - PROFILE_REQUESTS=1 and it is picked with probability PROFILE_SAMPLE_RATE, or
+#   - PROFILE_TOKEN is set and the request carries the header "X-Profile: <PROFILE_TOKEN>".
+# PROFILE_ROUTES (comma separated route templates) restricts both, and PROFILE_MAX_PER_MINUTE caps
+# how many requests are profiled, so the hook cannot eat production throughput.
+# PROFILE_MODE=sampling (default) writes collapsed stacks (<file>.folded) for flamegraph.pl / speedscope / inferno;
+# PROFILE_MODE=deterministic writes cProfile stats (<file>.prof) for snakeviz / flameprof.
+# Files go to PROFILE_DIR; the response names the file in the X-Profile-File header.
+# cProfile hooks the whole interpreter (one sys.monitoring tool on Python 3.12+), so deterministic profiles
+# run one at a time - a request picked while one runs is served without being profiled.
+
+PROFILE_HEADER = "X-Profile"
+
+
+# Samples the stack of one thread every `interval` seconds and counts identical stacks
+class StackSampler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+
+class RequestProfiler:
+    def __init__(self, service_name):
+        self.service_name = service_name
+        self.enabled = os.environ.get("PROFILE_REQUESTS", "0") == "1"
+        self.sample_rate = float(os.environ.get("PROFILE_SAMPLE_RATE", "0.01"))
+        self.token = os.environ.get("PROFILE_TOKEN")
+        self.routes = {r.strip() for r in os.environ.get("PROFILE_ROUTES", "").split(",") if r.strip()}
+        self.max_per_minute = int(os.environ.get("PROFILE_MAX_PER_MINUTE", "10"))
+        self.mode = os.environ.get("PROFILE_MODE", "sampling")
+        self.interval = float(os.environ.get("PROFILE_INTERVAL_MS", "1")) / 1000.0
+        self.directory = os.environ.get("PROFILE_DIR", "/tmp/profiles")
+        self._recent = deque()      # start times of profiles in the last minute
+        self._lock = threading.Lock()
+        self._deterministic = threading.Lock()  # held while a cProfile profile runs
+
+    # Decides whether the current request is profiled
+    def wanted(self):
+        if not self.enabled and not self.token:
+            return False
+        if self.routes and (request.url_rule is None or request.url_rule.rule not in self.routes):
+            return False
+        requested = self.token is not None and request.headers.get(PROFILE_HEADER) == self.token
+        if not requested and not (self.enabled and random.random() < self.sample_rate):
+            return False
+        return self._take_slot()
+
+    def _take_slot(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_per_minute:
+                return False
+            self._recent.append(now)
+            return True
+
+    # Starts a profiler for the current request, None when it cannot be profiled now
+    def start(self):
+        if self.mode == "deterministic":
+            if not self._deterministic.acquire(blocking=False):
+                return None
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # The profiling hook is taken by something else (another profiler, a debugger)
+                self._deterministic.release()
+                return None
+        else:
+            profiler = StackSampler(threading.get_ident(), self.interval)
+            profiler.start()
+        return profiler
+
+    def stop(self, profiler):
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            self._deterministic.release()
+        else:
+            profiler.stop()
+
+    # Stops the profiler and writes its output, returns the file name
+    def finish(self, profiler):
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        name = f"{self.service_name}-{time.time_ns()}-{request.method}-{slug}"
+        self.stop(profiler)
+        os.makedirs(self.directory, exist_ok=True)
+        if isinstance(profiler, cProfile.Profile):
+            name += ".prof"
+            profiler.dump_stats(os.path.join(self.directory, name))
+        else:
+            name += ".folded"
+            with open(os.path.join(self.directory, name), "w", encoding="utf-8") as f:
+                for stack, count in profiler.stacks.items():
+                    f.write(f"{stack} {count}\n")
+        return name
+
+
+def init_profiling(app, service_name):
+    profiler = RequestProfiler(service_name)
+
+    @app.before_request
+    def _start_profile():
+        if profiler.wanted():
+            g.profiler = profiler.start()
+
+    @app.after_request
+    def _finish_profile(response):
+        active = g.pop("profiler", None)
+        if active is not None:
+            response.headers["X-Profile-File"] = profiler.finish(active)
+        return response
+
+    # Requests that never reached after_request must not leave a profiler running
+    @app.teardown_request
+    def _drop_profile(exc):
+        active = g.pop("profiler", None)
+        if active is not None:
+            profiler.stop(active)
+
+    return profiler
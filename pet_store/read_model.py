@@ -0,0 +1,211 @@
+import copy
+import logging
+import sys
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+log = logging.getLogger("read_model")
+
+# -------------------------
+# In-memory read model of the pet types
+# -------------------------
+# Optional (READ_MODEL=1): the pet types of the store are loaded once at startup into compact slotted
+# records, and the GET endpoints are answered from them without touching Mongo.
+# A local write of one pet is applied to the record of its pet type (apply_pet), other local writes reload
+# the pet type (refresh). Writes of other processes are picked up by polling every READ_MODEL_POLL_SECONDS:
+# each write increments the "_rev" field of its pet type, so a poll only compares {id: _rev} and reloads
+# the pet types whose revision moved.
+
+# Fields loaded from Mongo - everything but the document _id
+PROJECTION = {"_id": 0}
+# Internal lowercase copies of the case-insensitive fields, stored in every pet type ("_type": "golden
+# retriever") - the filters on them are equality matches an index serves
+LOWERCASE_FIELDS = {"type": "_type", "family": "_family", "genus": "_genus"}
+
+
+def lowercase_fields(doc):
+    return {key: doc[field].lower() if isinstance(doc.get(field), str) else None
+            for field, key in LOWERCASE_FIELDS.items()}
+
+
+# Mongo query of a filter spec (see parse_pet_type_filters in app.py) - PetTypeRecord.matches() has the
+# same semantics
+def pet_type_query(spec):
+    conditions = []
+    if "all" in spec:
+        conditions.append({"_attributes": {"$all": spec["all"]}})
+    if "any" in spec:
+        conditions.append({"_attributes": {"$in": spec["any"]}})
+    if "id" in spec:
+        conditions.append({"id": spec["id"]})
+    for field, key in LOWERCASE_FIELDS.items():
+        if field in spec:
+            conditions.append({key: spec[field].lower()})
+    if "lifespan" in spec:
+        conditions.append({"lifespan": spec["lifespan"]})
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+class PetRecord:
+    __slots__ = ("name", "birthdate", "picture")
+
+    def __init__(self, pet):
+        self.name = pet.get("name")
+        # Few distinct values ("NA", repeated dates) - share one string object each
+        self.birthdate = sys.intern(pet.get("birthdate", "NA"))
+        picture = pet.get("picture", "NA")
+        self.picture = sys.intern(picture) if picture == "NA" else picture
+
+    def to_dict(self):
+        return {"name": self.name, "birthdate": self.birthdate, "picture": self.picture}
+
+
+class PetTypeRecord:
+    __slots__ = ("id", "type", "family", "genus", "attributes", "lifespan", "names", "pets",
+                 "birthdates", "birthdate_keys", "keys", "tokens", "rev")
+
+    def __init__(self, doc):
+        self.id = doc["id"]
+        self.type = doc["type"]
+        self.family = doc.get("family")
+        self.genus = doc.get("genus")
+        self.attributes = tuple(doc.get("attributes") or ())
+        self.lifespan = doc.get("lifespan")
+        self.names = tuple(doc.get("pets") or ())
+        # Same order as the stored map - the unfiltered pet list is returned in that order
+        self.pets = {key: PetRecord(pet) for key, pet in (doc.get("_pets") or {}).items()}
+        # Birthdate index as parallel tuples: sorted YYYY-MM-DD keys and the pet keys they belong to
+        index = doc.get("_birthdates") or []
+        self.birthdate_keys = tuple(sys.intern(e["d"]) for e in index)
+        self.birthdates = tuple(e["n"] for e in index)
+        # Lowercase values of the case-insensitive filters
+        self.keys = lowercase_fields(doc)
+        self.tokens = frozenset(doc.get("_attributes") or ())
+        self.rev = doc.get("_rev", 0)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "type": self.type,
+            "family": self.family,
+            "genus": self.genus,
+            "attributes": list(self.attributes),
+            "lifespan": self.lifespan,
+            "pets": list(self.names),
+        }
+
+    # Pets born strictly between the bounds (YYYY-MM-DD keys, None = unbounded), by birthdate
+    def pets_born_between(self, gt_key, lt_key):
+        lo = bisect_right(self.birthdate_keys, gt_key) if gt_key else 0
+        hi = bisect_left(self.birthdate_keys, lt_key) if lt_key else len(self.birthdate_keys)
+        return [self.pets[key].to_dict() for key in self.birthdates[lo:hi]]
+
+    # Copy of the record after a write of one pet, at revision `rev`: `old_key` is the key of the pet the
+    # write removed or replaced, `pet` the pet it stored and `birth_key` its birthdate key (None = "NA").
+    # Mirrors the write handlers of app.py - the other pets are shared with this record
+    def with_pet(self, rev, old_key=None, pet=None, birth_key=None):
+        new_key = pet["name"].lower() if pet is not None else None
+        pets = dict(self.pets)
+        names = list(self.names)
+        index = [(d, n) for d, n in zip(self.birthdate_keys, self.birthdates) if n != old_key]
+        if old_key is not None and old_key != new_key:
+            pets.pop(old_key, None)
+            names = [n for n in names if n.lower() != old_key]
+        if pet is not None:
+            pets[new_key] = PetRecord(pet)
+            if old_key != new_key:
+                insort(names, pet["name"])
+            if birth_key:
+                insort(index, (sys.intern(birth_key), new_key))
+
+        record = copy.copy(self)
+        record.pets = pets
+        record.names = tuple(names)
+        record.birthdate_keys = tuple(d for d, _ in index)
+        record.birthdates = tuple(n for _, n in index)
+        record.rev = rev
+        return record
+
+    # Same semantics as the Mongo query of GET /pet-types (see pet_type_query)
+    def matches(self, spec):
+        if "all" in spec and not (spec["all"] and self.tokens.issuperset(spec["all"])):
+            return False
+        if "any" in spec and self.tokens.isdisjoint(spec["any"]):
+            return False
+        if "id" in spec and self.id != spec["id"]:
+            return False
+        for field, key in LOWERCASE_FIELDS.items():
+            if field in spec and self.keys[key] != spec[field].lower():
+                return False
+        if "lifespan" in spec and self.lifespan != spec["lifespan"]:
+            return False
+        return True
+
+
+class ReadModel:
+    def __init__(self, collection, on_change=None):
+        self.collection = collection
+        self.on_change = on_change      # called with the id of every pet type a poll found changed
+        self.types = {}                 # pet type id -> PetTypeRecord, in collection order
+        self._lock = threading.Lock()
+
+    def load(self):
+        self.load_documents(self.collection.find({}, PROJECTION))
+
+    def load_documents(self, docs):
+        self.types = {doc["id"]: PetTypeRecord(doc) for doc in docs}
+
+    # Reloads one pet type after a local write
+    def refresh(self, pet_type_id):
+        doc = self.collection.find_one({"id": pet_type_id}, PROJECTION)
+        with self._lock:
+            if doc is None:
+                self.types.pop(pet_type_id, None)
+                return
+            # Concurrent refreshes may finish out of order - never go back to an older revision
+            current = self.types.get(pet_type_id)
+            if current is None or doc.get("_rev", 0) >= current.rev:
+                self.types[pet_type_id] = PetTypeRecord(doc)
+
+    # Applies a local write of one pet (see PetTypeRecord.with_pet) that moved the pet type to revision `rev`.
+    # When another write came in between, the pet type is reloaded instead
+    def apply_pet(self, pet_type_id, rev, old_key=None, pet=None, birth_key=None):
+        with self._lock:
+            current = self.types.get(pet_type_id)
+            if current is not None and rev == current.rev + 1:
+                self.types[pet_type_id] = current.with_pet(rev, old_key, pet, birth_key)
+                return
+        self.refresh(pet_type_id)
+
+    # Reloads the pet types changed by other processes, returns their ids
+    def poll(self):
+        revs = {doc["id"]: doc.get("_rev", 0) for doc in self.collection.find({}, {"_id": 0, "id": 1, "_rev": 1})}
+        current = dict(self.types)
+        changed = [pid for pid in current if pid not in revs]
+        changed += [pid for pid, rev in revs.items() if pid not in current or current[pid].rev != rev]
+        for pet_type_id in changed:
+            self.refresh(pet_type_id)
+            if self.on_change is not None:
+                self.on_change(pet_type_id)
+        return changed
+
+    def start_polling(self, interval):
+        if interval <= 0:
+            return None
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.poll()
+                except Exception as e:
+                    log.warning("read model poll failed: %s", e)
+
+        stop = threading.Event()
+        threading.Thread(target=run, name="read-model-poll", daemon=True).start()
+        return stop
+
+    def get(self, pet_type_id):
+        return self.types.get(pet_type_id)
+
+    def find(self, spec):
+        return [record.to_dict() for record in list(self.types.values()) if record.matches(spec)]
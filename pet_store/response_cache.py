@@ -0,0 +1,99 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# -------------------------
+# Pre-serialized response cache
+# -------------------------
+
+# Tag of entries that list pet types (invalidated by every write)
+LIST_TAG = "*"
+
+
+# One cached response: the encoded body plus its ETag, and its compressed variants once requested
+class CachedResponse:
+    __slots__ = ("body", "mimetype", "etag", "created", "variants")
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.created = time.monotonic()
+        self.variants = {}          # content encoding -> compressed body
+
+    # Body compressed with `encoding`, compressed by compress(body, encoding) on first use only
+    def variant(self, encoding, compress):
+        body = self.variants.get(encoding)
+        if body is None:
+            body = self.variants[encoding] = compress(self.body, encoding)
+        return body
+
+
+# LRU cache of encoded GET responses, keyed by route and normalized query args.
+# Every entry carries a tag (a pet type id, or LIST_TAG) so writes can drop exactly the entries they affect.
+class ResponseCache:
+    def __init__(self, max_entries=1024, ttl=0):
+        self.max_entries = max_entries
+        self.ttl = ttl              # seconds, 0 = entries live until invalidated
+        self.generation = 0         # bumped by every invalidation
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (tag, CachedResponse)
+        self._tags = {}                 # tag -> set of keys
+        self._lock = threading.Lock()
+
+    # Cache key - same path and same query args (in any order) share an entry
+    @staticmethod
+    def make_key(path, args):
+        return path, tuple(sorted(args.items(multi=True)))
+
+    # Returns the cached response for key, or None
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and self.ttl and time.monotonic() - item[1].created > self.ttl:
+                self._remove(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    # Stores an encoded body, unless an invalidation happened since `generation` was read
+    def put(self, key, tag, body, mimetype, generation):
+        entry = CachedResponse(body, mimetype)
+        with self._lock:
+            if generation != self.generation:
+                return entry
+            self._remove(key)
+            self._entries[key] = (tag, entry)
+            self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    # Drops the entries of one pet type together with every pet type list
+    def invalidate(self, pet_type_id):
+        with self._lock:
+            self.generation += 1
+            for tag in (str(pet_type_id), LIST_TAG):
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            keys = self._tags.get(item[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[item[0]]
@@ -0,0 +1,64 @@
+import os
+import threading
+
+from metrics import SINGLEFLIGHT_CALLS
+
+# -------------------------
+# Request coalescing
+# -------------------------
+# Concurrent calls with the same key share one execution: the first caller runs the function,
+# the others wait for its result (or its exception) instead of repeating the outbound call.
+# Waiters give up after SINGLEFLIGHT_TIMEOUT_SECONDS with SingleFlightTimeout(504).
+
+TIMEOUT = float(os.environ.get("SINGLEFLIGHT_TIMEOUT_SECONDS", "6"))
+
+
+# A waiter gave up on the shared call - args[0] is 504, like the other status errors
+class SingleFlightTimeout(Exception):
+    pass
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = TIMEOUT if timeout is None else timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    # Returns fn(), sharing one execution among concurrent callers with the same key
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            SINGLEFLIGHT_CALLS.labels(self.name, "leader").inc()
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                # Later callers start a fresh call - results are never cached past the flight
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            SINGLEFLIGHT_CALLS.labels(self.name, "shared").inc()
+            if not call.done.wait(self.timeout):
+                SINGLEFLIGHT_CALLS.labels(self.name, "timeout").inc()
+                raise SingleFlightTimeout(504, self.name)
+
+        if call.error is not None:
+            raise call.error
+        return call.result
@@ -0,0 +1,31 @@
+import re
+
+# -------------------------
+# Store selection
+# -------------------------
+# A request picks its store with a /stores/<id> path prefix or the X-Store-Id header. The prefix is
+# moved from PATH_INFO to SCRIPT_NAME before routing, so every route serves every store unchanged
+# (/stores/2/pet-types is routed as /pet-types of store 2).
+
+STORE_HEADER = "X-Store-Id"
+ENVIRON_KEY = "pet_store.store_id"
+PREFIX = re.compile(r"^/stores/([A-Za-z0-9_-]+)(?=/|$)")
+
+
+class StorePrefixMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        match = PREFIX.match(path)
+        if match:
+            environ[ENVIRON_KEY] = match.group(1)
+            environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + match.group(0)
+            environ["PATH_INFO"] = path[match.end():] or "/"
+        return self.wsgi_app(environ, start_response)
+
+
+# Store id the request asked for (path prefix first, then header), None = not specified
+def requested_store_id(request):
+    return request.environ.get(ENVIRON_KEY) or request.headers.get(STORE_HEADER)
@@ -1,5 +1,8 @@
+import argparse
 import json
+import math
 import os
+import threading
 import time
 import requests
 
@@ -66,45 +69,183 @@ def seed_data():
     _post_json(f"{BASE2}/pet-types/{id6}/pets", PET8_TYPE4, 201)
 
 def run_queries(query_file="query.txt", response_file="response.txt"):
+    ops=parse_script(query_file)
+    with open(response_file, "w", encoding="utf-8") as out:
+        for op, arg in ops:
+            if op == "query":
+                base, qstring = arg
+                r=_get(f"{base}/pet-types?{qstring}")
+                expected=200
+            elif arg is None:
+                # payload is not valid JSON
+                out.write("400\nNONE\n;\n")
+                continue
+            else:
+                r=_post_json(f"{ORDER}/purchases", arg)
+                expected=201
+            out.write(f"{r.status_code}\n")
+            if r.status_code==expected:
+                out.write(r.text.rstrip()+"\n")
+            else:
+                out.write("NONE\n")
+            out.write(";\n")
+
+# -------------------------
+# Load generator
+# -------------------------
+
+# Parses query.txt into a list of (operation, argument) pairs, the script of run_queries and run_load:
+# ("query", (base_url, query_string)) or ("purchase", payload dict - None when it is not valid JSON).
+# Entries without the closing ";" are ignored
+def parse_script(query_file="query.txt"):
+    ops=[]
     with open(query_file, "r", encoding="utf-8") as f:
         lines=[ln.strip() for ln in f.readlines() if ln.strip()]
+    for entry in lines:
+        if not entry.endswith(";"):
+            continue
+        entry = entry[:-1].strip()
+        if entry.startswith("query:"):
+            rest=entry[len("query:"):].strip()
+            store_num, qstring = rest.split(",", 1)
+            base = BASE1 if store_num.strip()=="1" else BASE2
+            ops.append(("query", (base, qstring.strip())))
+        elif entry.startswith("purchase:"):
+            try:
+                payload=json.loads(entry[len("purchase:"):].strip())
+            except Exception:
+                payload=None
+            ops.append(("purchase", payload))
+    return ops
 
-    with open(response_file, "w", encoding="utf-8") as out:
-        for entry in lines:
-            if not entry.endswith(";"):
-                # ignore malformed
-                continue
-            entry = entry[:-1].strip()
-
-            if entry.startswith("query:"):
-                rest=entry[len("query:"):].strip()
-                store_num, qstring = rest.split(",", 1)
-                base = BASE1 if store_num.strip()=="1" else BASE2
-                r=_get(f"{base}/pet-types?{qstring.strip()}")
-                out.write(f"{r.status_code}\n")
-                if r.status_code==200:
-                    out.write(r.text.rstrip()+"\n")
-                else:
-                    out.write("NONE\n")
-                out.write(";\n")
-
-            elif entry.startswith("purchase:"):
-                payload_str=entry[len("purchase:"):].strip()
-                try:
-                    payload=json.loads(payload_str)
-                except Exception:
-                    out.write("400\nNONE\n;\n")
-                    continue
-                r=_post_json(f"{ORDER}/purchases", payload)
-                out.write(f"{r.status_code}\n")
-                if r.status_code==201:
-                    out.write(r.text.rstrip()+"\n")
-                else:
-                    out.write("NONE\n")
-                out.write(";\n")
+# Runs one script operation on a session, returns (status code or "error", latency in seconds)
+def _timed_op(session, op, arg):
+    t0=time.perf_counter()
+    try:
+        if op == "query":
+            base, qstring = arg
+            r=session.get(f"{base}/pet-types?{qstring}", timeout=10)
+        else:
+            r=session.post(f"{ORDER}/purchases", json=arg, headers={"Content-Type":"application/json"}, timeout=10)
+        r.content
+        status=r.status_code
+    except Exception:
+        status="error"
+    return status, time.perf_counter()-t0
+
+# Spaces request start times so that all virtual users together stay at `rate` requests/sec (0 = unlimited)
+class _Pacer:
+    def __init__(self, rate):
+        self.interval = 1.0/rate if rate else 0.0
+        self.next = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now=time.perf_counter()
+            start=max(self.next, now)
+            self.next=start+self.interval
+        if start > now:
+            time.sleep(start-now)
+
+# Nearest-rank percentile of a sorted list
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank=max(1, math.ceil(pct/100.0*len(sorted_values)))
+    return sorted_values[rank-1]
+
+def _summary(samples, elapsed):
+    latencies=sorted(lat for _, lat in samples)
+    statuses={}
+    for status, _ in samples:
+        statuses[str(status)]=statuses.get(str(status), 0)+1
+    errors=sum(n for s, n in statuses.items() if not s.isdigit() or int(s) >= 500)
+    ms=lambda v: round(v*1000, 3) if v is not None else None
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples)/elapsed, 3) if elapsed else 0,
+        "status_codes": statuses,
+        "latency_ms": {
+            "p50": ms(_percentile(latencies, 50)),
+            "p95": ms(_percentile(latencies, 95)),
+            "p99": ms(_percentile(latencies, 99)),
+            "mean": ms(sum(latencies)/len(latencies)) if latencies else None,
+            "max": ms(latencies[-1]) if latencies else None,
+        },
+    }
+
+# Replays the script with `users` concurrent virtual users for `duration` seconds,
+# writes throughput and latency percentiles per operation type to results_file
+def run_load(ops, users=1, rate=0.0, duration=30.0, results_file="load_results.json"):
+    # Purchases that are not valid JSON are never sent
+    ops=[(op, arg) for op, arg in ops if arg is not None]
+    if not ops:
+        raise SystemExit("no query:/purchase: operations in script")
+    samples={"query": [], "purchase": []}
+    samples_lock=threading.Lock()
+    pacer=_Pacer(rate)
+    deadline=time.perf_counter()+duration
+
+    def virtual_user(index):
+        session=requests.Session()
+        local={"query": [], "purchase": []}
+        i=index  # users start at different script positions
+        while time.perf_counter() < deadline:
+            pacer.wait()
+            if time.perf_counter() >= deadline:
+                break
+            op, arg = ops[i % len(ops)]
+            local[op].append(_timed_op(session, op, arg))
+            i+=1
+        with samples_lock:
+            for op, values in local.items():
+                samples[op].extend(values)
+
+    t0=time.perf_counter()
+    threads=[threading.Thread(target=virtual_user, args=(n,), daemon=True) for n in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed=time.perf_counter()-t0
+
+    all_samples=samples["query"]+samples["purchase"]
+    results={
+        "config": {"users": users, "rate": rate, "duration_s": duration, "script_operations": len(ops)},
+        "elapsed_s": round(elapsed, 3),
+        "total": _summary(all_samples, elapsed),
+        "operations": {op: _summary(values, elapsed) for op, values in samples.items() if values},
+    }
+    with open(results_file, "w", encoding="utf-8") as out:
+        json.dump(results, out, indent=2)
+    return results
+
+def _parse_args():
+    parser=argparse.ArgumentParser(description="Seed the stores and replay query.txt, optionally as a load test")
+    parser.add_argument("--query-file", default="query.txt")
+    parser.add_argument("--response-file", default="response.txt")
+    parser.add_argument("--no-seed", action="store_true", help="skip seed_data()")
+    parser.add_argument("--load", action="store_true", help="run as a load generator instead of a single ordered replay")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users (--load)")
+    parser.add_argument("--rate", type=float, default=0.0, help="target total requests/sec, 0 = as fast as possible (--load)")
+    parser.add_argument("--duration", type=float, default=30.0, help="test duration in seconds (--load)")
+    parser.add_argument("--results", default="load_results.json", help="machine-readable results file (--load)")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    seed_data()
-    if not os.path.exists("query.txt"):
-        raise SystemExit("query.txt not found in repo root")
-    run_queries("query.txt", "response.txt")
+    args=_parse_args()
+    if not os.path.exists(args.query_file):
+        raise SystemExit(f"{args.query_file} not found in repo root")
+    if not args.no_seed:
+        seed_data()
+    if args.load:
+        results=run_load(parse_script(args.query_file), args.users, args.rate, args.duration, args.results)
+        for op, summary in results["operations"].items():
+            lat=summary["latency_ms"]
+            print(f"{op}: {summary['throughput_rps']} req/s, p50 {lat['p50']} ms, p95 {lat['p95']} ms, p99 {lat['p99']} ms, errors {summary['errors']}")
+    else:
+        run_queries(args.query_file, args.response_file)
@@ -0,0 +1,167 @@
+# - shared setup of the tester pytest files -
+# The services are not packages: in their containers their modules import each other by plain name
+# ("from metrics import ..."). Both service directories are put on sys.path, so the tests import every module
+# the same way ("import read_model", "from ledger import PartitionedLedger"). The helper modules the two
+# services share are identical (see test_shared_modules.py), so it does not matter which copy is found.
+
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICE_DIRS = [os.path.join(ROOT, "pet_store"), os.path.join(ROOT, "pet_order")]
+
+for path in reversed(SERVICE_DIRS):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Answers of the fake api-ninjas, by animal name
+NINJA_ANIMALS = {
+    "Golden Retriever": {"name": "Golden Retriever", "taxonomy": {"family": "Canidae", "genus": "Canis"},
+                         "characteristics": {"temperament": "Loyal, outgoing and friendly", "lifespan": "12-15 years"}},
+    "Abyssinian": {"name": "Abyssinian", "taxonomy": {"family": "Felidae", "genus": "Felis"},
+                   "characteristics": {"temperament": "Intelligent and curious", "lifespan": "13 years"}},
+    "Poodle": {"name": "Poodle", "taxonomy": {"family": "Canidae", "genus": "Canis"},
+               "characteristics": {"temperament": "Intelligent, loyal and calm", "lifespan": "12 years"}},
+}
+PNG = b"\x89PNG\r\n\x1a\n" + b"x" * 100
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None, body=b"", headers=None):
+        self.status_code = status_code
+        self._data = data
+        self._body = body
+        self.headers = headers or {}
+        self.closed = False
+
+    def json(self):
+        return self._data
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self._body), chunk_size):
+            yield self._body[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Stands in for requests.get: api-ninjas knows NINJA_ANIMALS, every URL in `pictures` serves its body
+class FakeInternet:
+    def __init__(self):
+        self.pictures = {}
+        self.urls = []
+
+    def __call__(self, url, params=None, **kwargs):
+        self.urls.append(url)
+        if "ninjas" in url:
+            found = [a for name, a in NINJA_ANIMALS.items() if name.lower() == params["name"].lower()]
+            return FakeResponse(200, data=found)
+        picture = self.pictures.get(url)
+        if picture is None:
+            return FakeResponse(404)
+        return picture if isinstance(picture, FakeResponse) else FakeResponse(200, body=picture)
+
+
+# One mongomock client stands in for every client the services create (db.mongo_client)
+@pytest.fixture(scope="session")
+def mongo():
+    pytest.importorskip("flask")
+    mongomock = pytest.importorskip("mongomock")
+    pytest.importorskip("prometheus_client")
+    import db
+
+    client = mongomock.MongoClient()
+    db.MongoClient = lambda *args, **kwargs: client
+    return client
+
+
+# The pet-store app (pet_store/app.py) against mongomock, serving stores "1" and "2". Imported once per
+# session - its configuration is read at import - and initialized before the first test runs.
+@pytest.fixture(scope="session")
+def pet_store(mongo, tmp_path_factory):
+    os.environ.update(NINJA_API_KEY="test", STORE_ID="1", STORE_IDS="1,2", PICTURE_GC_INTERVAL_SECONDS="0",
+                      PICTURES_DIR=str(tmp_path_factory.mktemp("pictures")))
+    import app
+
+    deadline = time.monotonic() + 10
+    while not app.startup["ready"]:
+        assert time.monotonic() < deadline, app.startup["last_error"]
+        time.sleep(0.01)
+    return app
+
+
+# Empties every store of the pet-store app and routes its outbound calls to a FakeInternet
+@pytest.fixture
+def internet(pet_store, monkeypatch):
+    fake = FakeInternet()
+    monkeypatch.setattr(pet_store.requests, "get", fake)
+    shutil.rmtree(pet_store.PICTURES_DIR)
+    for store in pet_store.STORES.values():
+        store.pet_types.delete_many({})
+        store.last_id = store.image_number = 0
+        store.response_cache.clear()
+        os.makedirs(store.pictures_dir)
+    return fake
+
+
+@pytest.fixture
+def store_client(pet_store, internet):
+    return pet_store.app.test_client()
+
+
+# Runs a test twice: store 1 answering its GET endpoints from Mongo, then from a read model (READ_MODEL=1)
+@pytest.fixture(params=[False, True], ids=["mongo", "read-model"])
+def backend(request, pet_store, internet, monkeypatch):
+    from read_model import ReadModel
+
+    if request.param:
+        store = pet_store.STORES["1"]
+        read_model = ReadModel(store.pet_types, on_change=store.response_cache.invalidate)
+        monkeypatch.setattr(store, "read_model", read_model)
+        read_model.load()
+    return "read-model" if request.param else "mongo"
+
+
+# The pet-order app (pet_order/pet_order.py) against mongomock, imported once per session
+@pytest.fixture(scope="session")
+def pet_order(mongo, tmp_path_factory):
+    os.environ.update(LEDGER_ARCHIVE_DIR=str(tmp_path_factory.mktemp("archive")), LEDGER_ARCHIVE_INTERVAL_SECONDS="0")
+    import pet_order
+    return pet_order
+
+
+# Stands in for the pet-order session to the stores: `routes` maps (method, store URL, path) to a
+# FakeResponse, or to an exception to raise; anything else is a 404
+class FakeStores:
+    def __init__(self):
+        self.routes = {}
+        self.calls = []
+
+    def __call__(self, method, url, params=None, **kwargs):
+        self.calls.append((method, url, params))
+        answer = self.routes.get((method, url))
+        if isinstance(answer, Exception):
+            raise answer
+        return answer or FakeResponse(404, data={"error": "Not found"})
+
+
+# Routes the store calls of pet-order to a FakeStores and gives every test fresh (closed) breakers
+@pytest.fixture
+def stores(pet_order, monkeypatch):
+    from breaker import CircuitBreaker
+
+    fake = FakeStores()
+    monkeypatch.setattr(pet_order.STORE_SESSION, "request", fake)
+    for url, breaker in list(pet_order.STORE_BREAKERS.items()):
+        monkeypatch.setitem(pet_order.STORE_BREAKERS, url, CircuitBreaker(breaker.name))
+    return fake
@@ -0,0 +1,241 @@
+# - tester pytest file for the adaptive admission limiter (pet-store and pet-order) -
+# Drives acquire/release with seeded latency distributions: ordinary jitter, heavy tails and fast rejects
+# must leave the limit alone, while queueing and failures shrink it and an idle limit never grows.
+
+import random
+import threading
+
+import pytest
+
+flask = pytest.importorskip("flask")
+pytest.importorskip("prometheus_client")
+pytest.importorskip("pymongo")
+
+import admission
+from admission import AdaptiveLimiter, init_admission, parse_routes
+
+INITIAL = 20
+
+
+def _limiter(**kwargs):
+    options = dict(initial=INITIAL, min_limit=2, max_limit=200, tolerance=2.0, max_queue=50, queue_timeout=0,
+                   baseline_samples=500, round_samples=10)
+    options.update(kwargs)
+    return AdaptiveLimiter("test", **options)
+
+
+# Runs the latencies as waves of `concurrency` simultaneous requests (None = as many as the limit allows)
+def _drive(limiter, latencies, concurrency=1, status=200):
+    latencies = list(latencies)
+    while latencies:
+        wave = concurrency or max(1, int(limiter.limit))
+        batch, latencies = latencies[:wave], latencies[wave:]
+        for _ in batch:
+            assert limiter.acquire() is None
+        for rtt in batch:
+            limiter.release(rtt, status)
+
+
+def _uniform(rng, n, low, high):
+    return [rng.uniform(low, high) for _ in range(n)]
+
+
+# Lognormal around `median` seconds with occasional stragglers 10x slower
+def _heavy_tailed(rng, n, median=0.03, sigma=0.5, straggler_rate=0.02):
+    return [rng.lognormvariate(0, sigma) * median * (10 if rng.random() < straggler_rate else 1)
+            for _ in range(n)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_jittery_latency_keeps_the_limit(seed):
+    rng = random.Random(seed)
+    limiter = _limiter()
+
+    _drive(limiter, _uniform(rng, 300, 0.020, 0.060))
+    assert limiter.limit == INITIAL
+
+    _drive(limiter, _uniform(rng, 3000, 0.020, 0.060))
+    assert limiter.limit == INITIAL
+    assert 0.030 < limiter.baseline_rtt < 0.050
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("concurrency", [1, 8])
+def test_heavy_tailed_latency_keeps_the_limit(seed, concurrency):
+    limiter = _limiter()
+    _drive(limiter, _heavy_tailed(random.Random(seed), 5000), concurrency)
+    assert limiter.limit >= INITIAL * admission.BACKOFF
+
+
+def test_fast_rejects_are_not_latency_samples():
+    rng = random.Random(1)
+    limiter = _limiter()
+    for _ in range(1000):
+        assert limiter.acquire() is None
+        if rng.random() < 0.4:
+            # Malformed or unsupported requests answered before any work is done
+            limiter.release(rng.uniform(0.0002, 0.001), rng.choice([400, 404, 415]))
+        else:
+            limiter.release(rng.uniform(0.020, 0.060), 201)
+
+    assert limiter.limit == INITIAL
+    assert min(limiter.baseline) >= 0.020
+    assert len(limiter.baseline) + len(limiter._round) < 1000
+
+
+def test_limit_grows_while_used_and_latency_is_flat():
+    rng = random.Random(2)
+    limiter = _limiter()
+    _drive(limiter, _uniform(rng, 3000, 0.025, 0.035), concurrency=None)
+    assert INITIAL + 5 <= limiter.limit <= 200
+
+
+def test_idle_limit_does_not_grow():
+    rng = random.Random(3)
+    limiter = _limiter()
+    _drive(limiter, _uniform(rng, 3000, 0.025, 0.035), concurrency=INITIAL // 2 - 1)
+    assert limiter.limit == INITIAL
+
+
+def test_limit_shrinks_when_latency_climbs():
+    rng = random.Random(4)
+    limiter = _limiter()
+    _drive(limiter, _uniform(rng, 500, 0.025, 0.035), concurrency=None)
+    before = limiter.limit
+
+    # Queueing: every request now takes 5x as long
+    _drive(limiter, _uniform(rng, 200, 0.125, 0.175), concurrency=None)
+    assert limiter.limit < before
+
+
+def test_sustained_overload_keeps_the_limit_down():
+    rng = random.Random(5)
+    limiter = _limiter()
+    _drive(limiter, _uniform(rng, 500, 0.025, 0.035), concurrency=None)
+
+    # Overloaded for three baseline windows - the baseline must not climb to the overloaded latency
+    for _ in range(3):
+        _drive(limiter, _uniform(rng, 500, 0.125, 0.175), concurrency=None)
+        assert limiter.limit == 2
+        assert limiter.baseline_rtt < 0.040
+
+    # Overload over - the limit grows again
+    _drive(limiter, _uniform(rng, 1000, 0.025, 0.035), concurrency=None)
+    assert limiter.limit > 2 + 5
+
+
+def test_lasting_slowdown_is_adopted_slowly():
+    rng = random.Random(6)
+    limiter = _limiter()
+    _drive(limiter, _uniform(rng, 500, 0.025, 0.035), concurrency=None)
+
+    # The dependency stays 5x slower: once enough slow round medians replaced the old samples, the slow
+    # latency is the baseline and the limit grows again
+    _drive(limiter, _uniform(rng, 5000, 0.125, 0.175), concurrency=None)
+    assert limiter.baseline_rtt > 0.100
+    _drive(limiter, _uniform(rng, 1000, 0.125, 0.175), concurrency=None)
+    assert limiter.limit > 2 + 5
+
+
+@pytest.mark.parametrize("status", [500, 503, None])
+def test_failure_burst_backs_off_once_per_round(status):
+    limiter = _limiter()
+    _drive(limiter, [0.03] * 10, status=status)
+    assert limiter.limit == pytest.approx(INITIAL * admission.BACKOFF)
+
+    # The failing round ends with the next successes - later failures back off again
+    _drive(limiter, [0.03] * int(limiter.limit))
+    _drive(limiter, [0.03], status=status)
+    assert limiter.limit == pytest.approx(INITIAL * admission.BACKOFF ** 2)
+
+
+def test_limit_stays_within_bounds():
+    limiter = _limiter()
+    for _ in range(100):
+        _drive(limiter, [0.03], status=500)
+        _drive(limiter, [0.03] * 10)
+    assert limiter.limit == 2
+
+    limiter = _limiter(initial=195)
+    _drive(limiter, [0.03] * 20000, concurrency=None)
+    assert limiter.limit == 200
+
+
+def test_requests_over_the_limit_are_shed():
+    limiter = _limiter(initial=1)
+    assert limiter.acquire() is None
+    assert limiter.acquire() == "timeout"
+
+    limiter.max_queue = 0
+    assert limiter.acquire() == "queue_full"
+    limiter.release(0.03, 200)
+    assert limiter.acquire() is None
+
+
+def test_waiting_request_is_admitted_when_a_slot_frees():
+    limiter = _limiter(initial=1, queue_timeout=5)
+    assert limiter.acquire() is None
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+    waiter.start()
+
+    limiter.release(0.03, 200)
+    waiter.join(5)
+
+    assert results == [None]
+    assert limiter.inflight == 1
+
+
+def test_parse_routes():
+    assert parse_routes("POST /purchases, get /pet-types/<pet_type_id> ,bad") == {
+        ("POST", "/purchases"), ("GET", "/pet-types/<pet_type_id>")}
+    assert parse_routes("") == set()
+
+
+def _app(monkeypatch, routes):
+    monkeypatch.setenv("ADMISSION_ROUTES", routes)
+    app = flask.Flask("admission")
+
+    @app.route("/items", methods=["POST"])
+    def create_item():
+        if flask.request.args.get("fail"):
+            raise RuntimeError("boom")
+        if not flask.request.is_json:
+            return flask.jsonify({"error": "Expected application/json media type"}), 415
+        return flask.jsonify({"id": "1"}), 201
+
+    return app, init_admission(app)
+
+
+def test_off_unless_routes_are_configured(monkeypatch):
+    app, limiters = _app(monkeypatch, "")
+    assert limiters == {}
+    assert app.test_client().post("/items", json={}).status_code == 201
+
+
+def test_routes_release_with_their_status(monkeypatch):
+    app, limiters = _app(monkeypatch, "POST /items")
+    limiter = limiters[("POST", "/items")]
+    client = app.test_client()
+
+    assert client.post("/items", data="x").status_code == 415
+    assert limiter._round == []
+    assert client.post("/items", json={}).status_code == 201
+    assert len(limiter._round) == 1
+    assert client.post("/items?fail=1", json={}).status_code == 500
+    assert limiter.limit == pytest.approx(admission.INITIAL_LIMIT * admission.BACKOFF)
+    assert limiter.inflight == 0
+
+
+def test_shed_requests_get_retry_after(monkeypatch):
+    app, limiters = _app(monkeypatch, "POST /items")
+    limiter = limiters[("POST", "/items")]
+    limiter.queue_timeout = 0
+    limiter.inflight = int(limiter.limit)
+
+    resp = app.test_client().post("/items", json={})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == admission.RETRY_AFTER
+
+    limiter.max_queue = 0
+    assert app.test_client().post("/items", json={}).status_code == 429
@@ -0,0 +1,57 @@
+# - tester pytest file for the filters of GET /pet-types (pet-store) -
+# hasAttribute lists attributes a pet type must all have (AND), hasAnyAttribute attributes of which it needs
+# one (OR), both case-insensitive and served by the multikey "_attributes" index - or by the read model.
+# They combine with the other filters.
+
+import pytest
+
+TYPES = ["Golden Retriever", "Abyssinian", "Poodle"]
+
+
+@pytest.fixture
+def client(backend, store_client):
+    # Golden Retriever: loyal, outgoing, friendly - Abyssinian: intelligent, curious - Poodle: intelligent,
+    # loyal, calm (see NINJA_ANIMALS)
+    for type_name in TYPES:
+        assert store_client.post("/pet-types", json={"type": type_name}).status_code == 201
+    return store_client
+
+
+def _types(client, **query):
+    resp = client.get("/pet-types", query_string=query)
+    assert resp.status_code == 200
+    return [pt["type"] for pt in resp.get_json()]
+
+
+def test_has_attribute_needs_every_attribute(client):
+    assert _types(client, hasAttribute="loyal") == ["Golden Retriever", "Poodle"]
+    assert _types(client, hasAttribute="loyal,intelligent") == ["Poodle"]
+    assert _types(client, hasAttribute="intelligent,loyal,calm") == ["Poodle"]
+    assert _types(client, hasAttribute="loyal,curious") == []
+    assert _types(client, hasAttribute="loyal,unknown") == []
+
+
+def test_has_any_attribute_needs_one(client):
+    assert _types(client, hasAnyAttribute="loyal,curious") == TYPES
+    assert _types(client, hasAnyAttribute="calm,unknown") == ["Poodle"]
+    assert _types(client, hasAnyAttribute="unknown") == []
+
+
+def test_attributes_are_case_insensitive(client):
+    assert _types(client, hasAttribute="Intelligent,CURIOUS") == ["Abyssinian"]
+    assert _types(client, hasAnyAttribute="FRIENDLY") == ["Golden Retriever"]
+
+
+def test_filters_combine(client):
+    assert _types(client, hasAttribute="intelligent", family="canidae") == ["Poodle"]
+    assert _types(client, hasAttribute="loyal", hasAnyAttribute="calm,curious") == ["Poodle"]
+    assert _types(client, hasAnyAttribute="loyal", lifespan="12") == ["Golden Retriever", "Poodle"]
+    assert _types(client, hasAttribute="loyal", genus="Felis") == []
+
+
+def test_filter_follows_writes(client):
+    assert _types(client, hasAttribute="intelligent") == ["Abyssinian", "Poodle"]
+    assert client.delete("/pet-types/2").status_code == 204
+    assert _types(client, hasAttribute="intelligent") == ["Poodle"]
+    assert client.post("/pet-types", json={"type": "Abyssinian"}).status_code == 201
+    assert _types(client, hasAttribute="intelligent") == ["Poodle", "Abyssinian"]
@@ -0,0 +1,75 @@
+# - tester pytest file for the birthdate filters of GET /pet-types/{id}/pets (pet-store) -
+# birthdateGT / birthdateLT are exclusive bounds answered from the sorted "_birthdates" index - by Mongo
+# (an aggregation filtering the index) or by the read model. Pet types stored before the index existed
+# get it from the startup backfill.
+
+import pytest
+
+BIRTHDATES = {"ace": "01-01-2019", "bo": "15-06-2020", "cy": "31-12-2020", "dot": "01-03-2022"}
+
+
+@pytest.fixture
+def pets_url(backend, store_client):
+    pet_type_id = store_client.post("/pet-types", json={"type": "Golden Retriever"}).get_json()["id"]
+    url = f"/pet-types/{pet_type_id}/pets"
+    for name, birthdate in BIRTHDATES.items():
+        assert store_client.post(url, json={"name": name, "birthdate": birthdate}).status_code == 201
+    assert store_client.post(url, json={"name": "nobday"}).status_code == 201
+    return url
+
+
+def _names(client, url, **bounds):
+    resp = client.get(url, query_string=bounds)
+    assert resp.status_code == 200
+    return [pet["name"] for pet in resp.get_json()]
+
+
+def test_bounds_are_exclusive(store_client, pets_url):
+    assert _names(store_client, pets_url, birthdateGT="15-06-2020") == ["cy", "dot"]
+    assert _names(store_client, pets_url, birthdateLT="31-12-2020") == ["ace", "bo"]
+    assert _names(store_client, pets_url, birthdateGT="01-01-2019", birthdateLT="01-03-2022") == ["bo", "cy"]
+    assert _names(store_client, pets_url, birthdateGT="15-06-2020", birthdateLT="31-12-2020") == []
+
+
+def test_open_bounds_and_pets_without_birthdate(store_client, pets_url):
+    assert _names(store_client, pets_url, birthdateGT="01-01-2000") == ["ace", "bo", "cy", "dot"]
+    assert _names(store_client, pets_url, birthdateLT="01-01-2030") == ["ace", "bo", "cy", "dot"]
+    # No bound - every pet, those without a birthdate too
+    assert sorted(_names(store_client, pets_url)) == ["ace", "bo", "cy", "dot", "nobday"]
+
+
+def test_filter_follows_pet_updates(store_client, pets_url):
+    assert store_client.put(pets_url + "/bo", json={"name": "bo", "birthdate": "01-01-2023"}).status_code == 200
+    assert store_client.delete(pets_url + "/cy").status_code == 204
+    assert _names(store_client, pets_url, birthdateGT="01-01-2020") == ["dot", "bo"]
+
+
+def test_invalid_bound_is_400_unknown_type_404(store_client, pets_url):
+    assert store_client.get(pets_url, query_string={"birthdateGT": "2020-01-01"}).status_code == 400
+    assert store_client.get(pets_url, query_string={"birthdateLT": "31-02-2020"}).status_code == 400
+    for query in ({"birthdateGT": "01-01-2020"}, {"birthdateGT": "bad"}):
+        assert store_client.get("/pet-types/999/pets", query_string=query).status_code == 404
+
+
+def test_backfill_builds_the_internal_fields(pet_store, internet):
+    store = pet_store.STORES["1"]
+    # A pet type stored before the index fields existed
+    store.pet_types.insert_one({
+        "id": "7", "type": "Golden Retriever", "family": "Canidae", "genus": "Canis",
+        "attributes": ["Loyal", "friendly", "loyal"], "lifespan": 12, "pets": ["cy", "ace", "bo"],
+        "_pets": {name: {"name": name, "birthdate": BIRTHDATES[name], "picture": "NA"} for name in ("cy", "ace")}
+                 | {"bo": {"name": "bo", "birthdate": "NA", "picture": "NA"}},
+    })
+
+    pet_store.backfill_internal_fields(store.pet_types)
+    pet_store.normalize_pet_order(store.pet_types)
+
+    doc = store.pet_types.find_one({"id": "7"})
+    assert doc["_birthdates"] == [{"d": "2019-01-01", "n": "ace"}, {"d": "2020-12-31", "n": "cy"}]
+    assert doc["_attributes"] == ["friendly", "loyal"]
+    assert (doc["_type"], doc["_family"], doc["_genus"]) == ("golden retriever", "canidae", "canis")
+    assert doc["pets"] == ["ace", "bo", "cy"]
+    assert doc["_rev"] == 2
+
+    assert [p["name"] for p in pet_store.pets_born_between(store.pet_types, "7", "2019-01-01", None)] == ["cy"]
+    assert pet_store.pets_born_between(store.pet_types, "8", None, None) is None
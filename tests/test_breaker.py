@@ -0,0 +1,123 @@
+# - tester pytest file for the circuit breakers (pet-store and pet-order) -
+# Walks a breaker through closed -> open -> half-open -> closed, checks the cap on half-open trial calls,
+# and that a purchase skips a store whose breaker is open instead of calling it.
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+import breaker
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from conftest import FakeResponse
+from prometheus_client import REGISTRY
+
+
+def _state_value(b):
+    return REGISTRY.get_sample_value("circuit_breaker_state", {"dependency": b.name})
+
+
+# Lets the reset timeout of an open breaker run out
+def _expire(b):
+    b.opened_at -= b.reset_seconds
+
+
+def test_closed_open_half_open_closed():
+    b = CircuitBreaker("test-cycle", failure_threshold=3, reset_seconds=60, half_open_calls=1)
+
+    # A success resets the count - only consecutive failures open the breaker
+    for ok in (False, False, True, False, False):
+        assert b.allow()
+        b.record(ok)
+    assert b.state == CLOSED
+
+    assert b.allow()
+    b.record(False)
+    assert b.state == OPEN
+    assert _state_value(b) == breaker.STATE_VALUES[OPEN]
+    with pytest.raises(CircuitOpenError) as raised:
+        b.check()
+    assert raised.value.args == (503, "test-cycle")
+
+    _expire(b)
+    assert b.allow()
+    assert b.state == HALF_OPEN
+    assert _state_value(b) == breaker.STATE_VALUES[HALF_OPEN]
+
+    b.record(True)
+    assert b.state == CLOSED
+    assert _state_value(b) == breaker.STATE_VALUES[CLOSED]
+    assert all(b.allow() for _ in range(10))
+
+
+def test_failed_trial_reopens():
+    b = CircuitBreaker("test-reopen", failure_threshold=1, reset_seconds=60, half_open_calls=1)
+    b.record(False)
+    _expire(b)
+    assert b.allow()
+
+    b.record(False)
+    assert b.state == OPEN
+    # Open for another full reset timeout
+    assert not b.allow()
+
+
+def test_half_open_admits_only_its_trial_calls():
+    b = CircuitBreaker("test-trials", failure_threshold=1, reset_seconds=60, half_open_calls=2)
+    b.record(False)
+    _expire(b)
+
+    assert b.allow()
+    assert b.allow()
+    assert not b.allow()
+    assert b.state == HALF_OPEN
+
+    b.record(True)
+    assert b.state == CLOSED
+    assert b.allow()
+
+
+def _purchase(pet_order, **fields):
+    return pet_order.app.test_client().post("/purchases", json={"purchaser": "dana", "pet-type": "Poodle", **fields})
+
+
+def _offer_pet(stores, base_url, name):
+    stores.routes["GET", base_url + "/random-pet"] = FakeResponse(
+        200, data={"pet-type-id": "1", "pet": {"name": name, "birthdate": "NA", "picture": "NA"}})
+    stores.routes["DELETE", f"{base_url}/pet-types/1/pets/{name}"] = FakeResponse(204)
+
+
+def test_purchase_skips_a_store_whose_breaker_is_open(pet_order, stores):
+    store1, store2 = pet_order.STORE1_URL, pet_order.STORE2_URL
+    stores.routes["GET", store1 + "/random-pet"] = ConnectionError("store 1 is down")
+    _offer_pet(stores, store2, "fifi")
+
+    # Store 1 fails every purchase until its breaker opens...
+    for _ in range(breaker.FAILURE_THRESHOLD):
+        resp = _purchase(pet_order)
+        assert resp.status_code == 201
+        assert resp.get_json()["store"] == 2
+    assert pet_order.STORE_BREAKERS[store1].state == OPEN
+
+    # ...then purchases go straight to store 2
+    stores.calls.clear()
+    resp = _purchase(pet_order)
+    assert resp.status_code == 201
+    assert resp.get_json()["store"] == 2
+    assert [url for _, url, _ in stores.calls] == [store2 + "/random-pet", store2 + "/pet-types/1/pets/fifi"]
+
+
+def test_purchase_from_a_store_whose_breaker_is_open_is_refused(pet_order, stores):
+    store1 = pet_order.STORE1_URL
+    _offer_pet(stores, store1, "rex")
+    b = pet_order.STORE_BREAKERS[store1]
+    for _ in range(b.failure_threshold):
+        b.record(False)
+
+    assert _purchase(pet_order, store=1).status_code == 400
+    assert stores.calls == []
+
+    # Once the reset timeout has passed the trial call goes out and closes the breaker
+    _expire(b)
+    resp = _purchase(pet_order, store=1)
+    assert resp.status_code == 201
+    assert b.state == CLOSED
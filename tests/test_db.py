@@ -0,0 +1,36 @@
+# - tester pytest file for the Mongo configuration read from the environment (pet-store and pet-order) -
+# MONGO_LIST_READ_PREFERENCE accepts the read preference names in any case; an unknown name is logged and
+# the lists are read from the primary instead of failing at import.
+
+import logging
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from pymongo import ReadPreference
+
+from db import list_read_preference
+
+
+@pytest.mark.parametrize("name, preference", [
+    ("primary", ReadPreference.PRIMARY),
+    ("secondaryPreferred", ReadPreference.SECONDARY_PREFERRED),
+    (" NEAREST ", ReadPreference.NEAREST),
+])
+def test_read_preference_names(monkeypatch, name, preference):
+    monkeypatch.setenv("MONGO_LIST_READ_PREFERENCE", name)
+    assert list_read_preference() == preference
+
+
+def test_default_is_primary(monkeypatch):
+    monkeypatch.delenv("MONGO_LIST_READ_PREFERENCE", raising=False)
+    assert list_read_preference() == ReadPreference.PRIMARY
+
+
+@pytest.mark.parametrize("name", ["secondary-preferred", "replica", ""])
+def test_unknown_name_falls_back_to_primary(monkeypatch, caplog, name):
+    monkeypatch.setenv("MONGO_LIST_READ_PREFERENCE", name)
+    with caplog.at_level(logging.WARNING, logger="db"):
+        assert list_read_preference() == ReadPreference.PRIMARY
+    assert "MONGO_LIST_READ_PREFERENCE" in caplog.text
@@ -0,0 +1,189 @@
+# - tester pytest file for the group commit writer of pet-order -
+# Checks that concurrent purchases share insert_many batches, that group mode answers a purchase only
+# once its batch is written (with the batch's error), and that close() flushes what is still buffered.
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+pytest.importorskip("pymongo")
+
+from group_commit import GroupCommitWriter, writer_from_env
+
+
+class FakeCollection:
+    def __init__(self, fail=False, delay=0.0):
+        self.batches = []
+        self.single = []
+        self.fail = fail
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def insert_many(self, docs, ordered=True):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("write failed")
+        with self._lock:
+            self.batches.append(list(docs))
+
+    def insert_one(self, doc):
+        with self._lock:
+            self.single.append(doc)
+
+    def written(self):
+        return [doc for batch in self.batches for doc in batch] + self.single
+
+
+def _insert_concurrently(writer, count):
+    errors = []
+
+    def insert(i):
+        try:
+            writer.insert({"purchase-id": str(i)})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=insert, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return errors
+
+
+def test_concurrent_inserts_share_batches():
+    collection = FakeCollection()
+    writer = GroupCommitWriter(collection, batch_size=10, flush_ms=50)
+
+    assert _insert_concurrently(writer, 40) == []
+    writer.close()
+
+    assert sorted(int(doc["purchase-id"]) for doc in collection.written()) == list(range(40))
+    assert len(collection.batches) < 40
+    assert max(len(batch) for batch in collection.batches) <= 10
+
+
+def test_group_mode_returns_once_the_batch_is_written():
+    collection = FakeCollection(delay=0.05)
+    writer = GroupCommitWriter(collection, batch_size=100, flush_ms=1)
+
+    writer.insert({"purchase-id": "1"})
+
+    assert collection.written() == [{"purchase-id": "1"}]
+    writer.close()
+
+
+def test_batch_is_written_after_flush_interval_when_not_full():
+    collection = FakeCollection()
+    writer = GroupCommitWriter(collection, batch_size=100, flush_ms=20)
+
+    start = time.monotonic()
+    writer.insert({"purchase-id": "1"})
+
+    assert time.monotonic() - start < 5
+    assert collection.batches == [[{"purchase-id": "1"}]]
+    writer.close()
+
+
+def test_group_mode_raises_the_batch_error():
+    writer = GroupCommitWriter(FakeCollection(fail=True), batch_size=5, flush_ms=20)
+
+    errors = _insert_concurrently(writer, 5)
+    writer.close()
+
+    assert len(errors) == 5
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+
+def test_async_mode_returns_before_the_write_and_close_flushes():
+    collection = FakeCollection(delay=0.1)
+    writer = GroupCommitWriter(collection, batch_size=100, flush_ms=1000, wait=False)
+
+    for i in range(5):
+        writer.insert({"purchase-id": str(i)})
+    assert collection.written() == []
+
+    writer.close()
+    assert [doc["purchase-id"] for doc in collection.written()] == ["0", "1", "2", "3", "4"]
+    assert not writer._thread.is_alive()
+
+
+def test_inserts_after_close_are_written_through():
+    collection = FakeCollection()
+    writer = GroupCommitWriter(collection)
+    writer.close()
+
+    writer.insert({"purchase-id": "1"})
+
+    assert collection.single == [{"purchase-id": "1"}]
+    assert collection.batches == []
+
+
+@pytest.mark.parametrize("mode, wait", [("group", True), ("async", False)])
+def test_writer_from_env(monkeypatch, mode, wait):
+    monkeypatch.setenv("LEDGER_MODE", mode)
+    monkeypatch.setenv("LEDGER_BATCH_SIZE", "7")
+    monkeypatch.setenv("LEDGER_FLUSH_MS", "3")
+    writer = writer_from_env(FakeCollection())
+    try:
+        assert (writer.batch_size, writer.flush_interval, writer.wait) == (7, 0.003, wait)
+    finally:
+        writer.close()
+
+
+def test_sync_mode_has_no_writer(monkeypatch):
+    monkeypatch.delenv("LEDGER_MODE", raising=False)
+    assert writer_from_env(FakeCollection()) is None
+
+
+# Serves like pet_order.py without the reloader, with two purchases buffered (flushed only on shutdown)
+SERVER_SCRIPT = '''
+import json, socket, sys
+from flask import Flask
+from group_commit import writer_from_env
+
+class FileCollection:
+    def insert_many(self, docs, ordered=True):
+        with open(sys.argv[1], "a") as f:
+            f.writelines(json.dumps(doc) + "\\n" for doc in docs)
+    insert_one = None
+
+writer = writer_from_env(FileCollection())
+writer.insert({"purchase-id": "1"})
+writer.insert({"purchase-id": "2"})
+sock = socket.socket()
+sock.bind(("127.0.0.1", 0))
+port = sock.getsockname()[1]
+sock.close()
+print("serving", flush=True)
+Flask("pet-order").run(host="127.0.0.1", port=port, debug=True, use_reloader=False)
+'''
+
+
+def test_sigterm_flushes_buffered_purchases(tmp_path):
+    pytest.importorskip("flask")
+    script = tmp_path / "server.py"
+    script.write_text(SERVER_SCRIPT)
+    out = tmp_path / "transactions.ndjson"
+    env = dict(os.environ, LEDGER_MODE="async", LEDGER_FLUSH_MS="60000",
+               PYTHONPATH=os.pathsep.join(sys.path))
+    proc = subprocess.Popen([sys.executable, str(script), str(out)], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        assert proc.stdout.readline().strip() == "serving"
+        time.sleep(0.5)
+        assert not out.exists()
+
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(10) == 0
+    finally:
+        proc.kill()
+
+    assert [json.loads(line)["purchase-id"] for line in out.read_text().splitlines()] == ["1", "2"]
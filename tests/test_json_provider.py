@@ -0,0 +1,76 @@
+# - tester pytest file for the JSON provider of pet-store and pet-order -
+# Checks that FastJSONProvider responses are byte-for-byte what Flask's default jsonify returns.
+
+import pytest
+
+flask = pytest.importorskip("flask")
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+from json_provider import FastJSONProvider
+
+PET_TYPE = {
+    "id": "1",
+    "type": "Golden Retriever",
+    "family": "Canidae",
+    "genus": "Canis",
+    "attributes": ["Loyal", "outgoing", "and", "friendly"],
+    "lifespan": 12,
+    "pets": ["lander", "lanky"],
+}
+
+TRANSACTION = {
+    "purchaser": "Customer_01",
+    "pet-type": "Golden Retriever",
+    "store": 1,
+    "pet-name": "lander",
+    "purchase-id": "1",
+}
+
+PAYLOADS = [
+    [],
+    {},
+    PET_TYPE,
+    [PET_TYPE, {**PET_TYPE, "id": "2", "lifespan": None, "pets": []}],
+    {"error": "Malformed data"},
+    {"name": "Zoë", "birthdate": "NA", "picture": "NA"},   # non-ASCII is escaped
+    {1: "non-string key"},
+    [2 ** 70],
+    [dict(TRANSACTION, **{"purchase-id": str(i)}) for i in range(2500)],   # streamed
+    [[{"a": [1, {"b": []}]}, []] for _ in range(1200)],                    # streamed, nested
+    [0.5, -0.0, 1e15, 1e16, 1.5e300, 1e-4, 1e-5, 1e-7, 5e-324],             # floats orjson formats its own way
+    {"nan": float("nan"), "inf": [float("inf"), float("-inf")], "none": None},
+    {"lifespan": None, "ratio": 0.25, "name": "item 2e5 0.00001"},
+    [{"x": i / 7} for i in range(1500)] + [{"x": 1e-7}],                   # streamed, one mismatch
+]
+
+
+def _body(app, payload):
+    with app.app_context():
+        return app.json.response(payload).get_data()
+
+
+@pytest.mark.parametrize("debug", [False, True])
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_responses_match_default_provider(monkeypatch, debug, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(json_provider, "orjson", None)
+    reference = flask.Flask("reference")
+    reference.json = DefaultJSONProvider(reference)
+    fast = flask.Flask("fast")
+    fast.json = FastJSONProvider(fast)
+    reference.debug = fast.debug = debug
+
+    for payload in PAYLOADS:
+        assert _body(fast, payload) == _body(reference, payload)
+
+
+def test_large_arrays_are_streamed():
+    app = flask.Flask("fast")
+    app.json = FastJSONProvider(app)
+    items = [TRANSACTION] * (app.json.stream_threshold + 1)
+
+    with app.app_context():
+        assert app.json.response(items).is_streamed
+        assert not app.json.response(items[:1]).is_streamed
+
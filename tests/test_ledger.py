@@ -0,0 +1,237 @@
+# - tester pytest file for the partitioned transaction ledger of pet-order -
+# Checks that transactions land in the bucket of their purchase time, that old buckets move to archive
+# files without changing what find() returns, and that time ranges skip the buckets outside them.
+
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+pytest.importorskip("prometheus_client")
+
+from ledger import PartitionedLedger, parse_time
+
+
+def _ts(year, month, day, hour=0):
+    return datetime(year, month, day, hour, tzinfo=timezone.utc)
+
+
+def _purchase(purchase_id, ts, pet_type="Golden Retriever", store=1):
+    return {"purchaser": "Customer_01", "pet-type": pet_type, "store": store,
+            "pet-name": f"pet{purchase_id}", "purchase-id": str(purchase_id), "_ts": ts}
+
+
+PURCHASES = [
+    _purchase(1, _ts(2026, 6, 30, 23)),
+    _purchase(2, _ts(2026, 7, 1, 0), pet_type="Abyssinian", store=2),
+    _purchase(3, _ts(2026, 8, 15)),
+    _purchase(4, _ts(2026, 9, 2), pet_type="Abyssinian", store=2),
+    _purchase(5, _ts(2026, 10, 19)),
+]
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def ledger(db, tmp_path):
+    ledger = PartitionedLedger(db, "transactions", archive_dir=str(tmp_path), hot_buckets=2,
+                               indexed_fields=["pet-type", "store"])
+    ledger.insert_many([dict(doc) for doc in PURCHASES])
+    return ledger
+
+
+def _ids(docs):
+    return sorted(int(doc["purchase-id"]) for doc in docs)
+
+
+def test_transactions_land_in_the_bucket_of_their_month(db, ledger):
+    assert ledger.hot_keys() == {"202606", "202607", "202608", "202609", "202610"}
+    assert db["transactions_202606"].count_documents({}) == 1
+    assert db["transactions_202607"].find_one({}, {"_id": 0, "_ts": 0})["purchase-id"] == "2"
+    assert "transactions" not in db.list_collection_names()
+
+
+def test_day_partition(db):
+    ledger = PartitionedLedger(db, "transactions", partition="day")
+    ledger.insert_one(_purchase(1, _ts(2026, 10, 19, 23)))
+    ledger.insert_one(_purchase(2, _ts(2026, 10, 20, 0)))
+    assert ledger.hot_keys() == {"20261019", "20261020"}
+    assert _ids(ledger.find({}, since=_ts(2026, 10, 20, 0))) == [2]
+
+
+def test_unpartitioned_ledger_uses_the_base_collection(db):
+    ledger = PartitionedLedger(db, "transactions", partition="none")
+    ledger.insert_many([dict(doc) for doc in PURCHASES])
+    assert db.list_collection_names() == ["transactions"]
+    assert _ids(ledger.find({"store": 2})) == [2, 4]
+
+
+def test_buckets_are_indexed_on_the_filter_fields(db, ledger):
+    for key in ledger.hot_keys():
+        index_keys = [info["key"] for info in db[f"transactions_{key}"].index_information().values()]
+        assert [("_ts", 1)] in index_keys
+        assert [("pet-type", 1), ("_ts", 1)] in index_keys
+        assert [("store", 1), ("_ts", 1)] in index_keys
+    assert ledger.check_indexes([["pet-type"], ["store"]]) == []
+
+
+def test_new_document_is_stamped(ledger):
+    doc = {"purchaser": "Customer_02", "pet-type": "Poodle", "store": 1, "pet-name": "rex", "purchase-id": "6"}
+    ledger.insert_one(doc)
+    assert doc["_ts"].tzinfo is not None
+    assert ledger.bucket_key(doc["_ts"]) in ledger.hot_keys()
+
+
+def test_find_filters_by_field_and_hides_internal_fields(ledger):
+    docs = ledger.find({"pet-type": "Abyssinian"})
+    assert _ids(docs) == [2, 4]
+    assert all("_ts" not in doc and "_id" not in doc for doc in docs)
+
+
+@pytest.mark.parametrize("since, until, expected", [
+    (None, None, [1, 2, 3, 4, 5]),
+    (_ts(2026, 7, 1, 0), None, [2, 3, 4, 5]),
+    (None, _ts(2026, 7, 1, 0), [1]),
+    (_ts(2026, 8, 1), _ts(2026, 10, 1), [3, 4]),
+    (_ts(2026, 11, 1), None, []),
+])
+def test_find_by_time_range(ledger, since, until, expected):
+    assert _ids(ledger.find({}, since, until)) == expected
+
+
+def test_ranges_skip_the_buckets_outside_them(db, ledger):
+    queried = []
+    original = ledger._collection
+
+    def collection(name, critical):
+        if not critical:
+            queried.append(name)
+        return original(name, critical)
+
+    ledger._collection = collection
+    ledger.find({}, since=_ts(2026, 8, 1), until=_ts(2026, 9, 1))
+    assert queried == ["transactions_202608"]
+
+
+def test_archive_moves_old_buckets_to_files(db, ledger, tmp_path):
+    archived = ledger.archive_old(now=_ts(2026, 10, 19))
+
+    assert archived == ["202606", "202607", "202608"]
+    assert ledger.hot_keys() == {"202609", "202610"}
+    assert ledger.archived() == {"202606", "202607", "202608"}
+    assert sorted(n for n in db.list_collection_names() if n.startswith("transactions_")) == \
+        ["transactions_202609", "transactions_202610"]
+    assert sorted(os.listdir(tmp_path)) == [f"transactions_{key}.ndjson.gz" for key in archived]
+
+    with gzip.open(ledger.archive_path("202607"), "rt", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == [{**{k: v for k, v in PURCHASES[1].items() if k != "_ts"},
+                      "_ts": "2026-07-01T00:00:00+00:00"}]
+
+
+def test_archived_buckets_are_still_found(ledger):
+    before = {(since, until): ledger.find({"store": 1}, since, until)
+              for since, until in [(None, None), (_ts(2026, 6, 30), _ts(2026, 8, 16)), (_ts(2026, 8, 16), None)]}
+    ledger.archive_old(now=_ts(2026, 10, 19))
+
+    for (since, until), docs in before.items():
+        assert sorted(ledger.find({"store": 1}, since, until), key=lambda d: d["purchase-id"]) == \
+            sorted(docs, key=lambda d: d["purchase-id"])
+    # An archived bucket outside the range is not even opened
+    with open(ledger.archive_path("202606"), "wb") as f:
+        f.write(b"not gzip")
+    assert _ids(ledger.find({}, since=_ts(2026, 7, 1, 0))) == [2, 3, 4, 5]
+
+
+def test_archive_keeps_the_current_bucket(db, tmp_path):
+    ledger = PartitionedLedger(db, "transactions", archive_dir=str(tmp_path), hot_buckets=0)
+    ledger.insert_many([dict(doc) for doc in PURCHASES])
+    assert ledger.archive_old(now=_ts(2026, 10, 19)) == ["202606", "202607", "202608", "202609"]
+    assert ledger.hot_keys() == {"202610"}
+
+
+def test_archive_leaves_no_temp_files_and_keeps_a_finished_archive(db, ledger, tmp_path):
+    # Another process archived the bucket already
+    with gzip.open(ledger.archive_path("202606"), "wt", encoding="utf-8") as f:
+        f.write(json.dumps({**{k: v for k, v in PURCHASES[0].items() if k != "_ts"},
+                            "_ts": PURCHASES[0]["_ts"].isoformat()}) + "\n")
+    ledger.archive_old(now=_ts(2026, 10, 19))
+
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+    assert _ids(ledger.find({}, until=_ts(2026, 7, 1, 0))) == [1]
+
+
+def test_existing_buckets_are_found_at_startup(db, ledger, tmp_path):
+    ledger.archive_old(now=_ts(2026, 10, 19))
+    restarted = PartitionedLedger(db, "transactions", archive_dir=str(tmp_path), hot_buckets=2)
+    assert restarted.hot_keys() == {"202609", "202610"}
+    assert _ids(restarted.find({})) == [1, 2, 3, 4, 5]
+
+
+def test_nothing_is_read_before_the_ledger_is_used(tmp_path):
+    class Unreachable:
+        def list_collection_names(self):
+            raise AssertionError("listed at construction")
+
+    PartitionedLedger(Unreachable(), "transactions", archive_dir=str(tmp_path / "archive"))
+    assert not os.path.exists(tmp_path / "archive")
+
+
+def test_buckets_of_other_processes_are_found(db, tmp_path):
+    reader = PartitionedLedger(db, "transactions", archive_dir=str(tmp_path), discovery_ttl=0)
+    assert reader.find({}) == []
+
+    writer = PartitionedLedger(db, "transactions", archive_dir=str(tmp_path))
+    writer.insert_many([dict(doc) for doc in PURCHASES])
+    assert _ids(reader.find({})) == [1, 2, 3, 4, 5]
+
+
+def test_buckets_archived_by_other_processes_are_read_from_the_file(db, ledger, tmp_path):
+    reader = PartitionedLedger(db, "transactions", archive_dir=str(tmp_path), discovery_ttl=3600)
+    assert reader.hot_keys() == {"202606", "202607", "202608", "202609", "202610"}
+
+    ledger.archive_old(now=_ts(2026, 10, 19))
+    # The reader's listing is stale, the archived collections are gone
+    assert _ids(reader.find({})) == [1, 2, 3, 4, 5]
+    assert _ids(reader.find({"store": 2}, until=_ts(2026, 8, 1))) == [2]
+
+
+def test_bucket_being_archived_is_not_read_twice(db, ledger):
+    ledger.archive_old(now=_ts(2026, 10, 19))
+    # File written, collection not dropped yet
+    db["transactions_202607"].insert_one(dict(PURCHASES[1]))
+
+    assert _ids(ledger.find({})) == [1, 2, 3, 4, 5]
+    assert _ids(ledger.find({"pet-type": "Abyssinian"}, until=_ts(2026, 8, 1))) == [2]
+
+
+def test_writes_after_archival_are_merged_into_the_archive(db, ledger):
+    ledger.archive_old(now=_ts(2026, 10, 19))
+    late = _purchase(6, _ts(2026, 7, 20))
+    ledger.insert_one(dict(late))
+    assert _ids(ledger.find({})) == [1, 2, 3, 4, 5, 6]
+
+    assert ledger.archive_old(now=_ts(2026, 10, 19)) == ["202607"]
+    assert "transactions_202607" not in db.list_collection_names()
+    with gzip.open(ledger.archive_path("202607"), "rt", encoding="utf-8") as f:
+        assert [json.loads(line)["purchase-id"] for line in f] == ["2", "6"]
+    assert _ids(ledger.find({})) == [1, 2, 3, 4, 5, 6]
+
+
+def test_documents_written_before_partitioning_are_read_by_unbounded_queries(db, ledger):
+    db["transactions"].insert_one({k: v for k, v in _purchase(0, None).items() if k != "_ts"})
+    assert _ids(ledger.find({})) == [0, 1, 2, 3, 4, 5]
+    assert _ids(ledger.find({}, since=_ts(2026, 1, 1))) == [1, 2, 3, 4, 5]
+    assert ledger.collection_names()[0] == "transactions"
+
+
+def test_parse_time():
+    assert parse_time("2026-10-19") == _ts(2026, 10, 19, 0)
+    assert parse_time("2026-10-19T14:00:00+02:00") == _ts(2026, 10, 19, 12)
+    assert parse_time("19-10-2026") is None
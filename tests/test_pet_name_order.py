@@ -0,0 +1,58 @@
+# - tester pytest file for the "pets" name list of a pet type (pet-store) -
+# The list is kept sorted at write time - by create, rename and delete - so it is served as stored.
+# Pet types stored before that are sorted once at startup by normalize_pet_order.
+
+import pytest
+
+
+@pytest.fixture
+def pet_type_url(backend, store_client):
+    pet_type_id = store_client.post("/pet-types", json={"type": "Poodle"}).get_json()["id"]
+    return f"/pet-types/{pet_type_id}"
+
+
+def _pets(client, url):
+    names = client.get(url).get_json()["pets"]
+    assert names == sorted(names)
+    return names
+
+
+def test_pets_stay_sorted_across_writes(pet_store, store_client, pet_type_url):
+    for name in ["max", "bo", "zed", "ace", "lu"]:
+        assert store_client.post(pet_type_url + "/pets", json={"name": name}).status_code == 201
+        _pets(store_client, pet_type_url)
+    assert _pets(store_client, pet_type_url) == ["ace", "bo", "lu", "max", "zed"]
+
+    # Renames move the name - kept as given, so "Alpha" sorts before the lowercase names
+    assert store_client.put(pet_type_url + "/pets/zed", json={"name": "abe"}).status_code == 200
+    assert store_client.put(pet_type_url + "/pets/bo", json={"name": "Alpha"}).status_code == 200
+    resp = store_client.put(pet_type_url + "/pets/lu", json={"name": "lu", "birthdate": "01-01-2020"})
+    assert resp.status_code == 200
+    assert _pets(store_client, pet_type_url) == ["Alpha", "abe", "ace", "lu", "max"]
+
+    assert store_client.delete(pet_type_url + "/pets/ace").status_code == 204
+    assert store_client.delete(pet_type_url + "/pets/alpha").status_code == 204
+    assert _pets(store_client, pet_type_url) == ["abe", "lu", "max"]
+
+    # Served as stored
+    doc = pet_store.STORES["1"].pet_types.find_one({"id": pet_type_url.rsplit("/", 1)[1]})
+    assert doc["pets"] == ["abe", "lu", "max"]
+    assert [pt["pets"] for pt in store_client.get("/pet-types").get_json()] == [["abe", "lu", "max"]]
+
+
+def test_normalize_sorts_legacy_lists(pet_store, internet):
+    collection = pet_store.STORES["1"].pet_types
+    collection.insert_many([
+        {"id": "1", "pets": ["max", "Bo", "ace"], "_rev": 4},
+        {"id": "2", "pets": ["ace", "bo"], "_rev": 1},
+        {"id": "3", "pets": []},
+    ])
+
+    pet_store.normalize_pet_order(collection)
+
+    docs = {doc["id"]: doc for doc in collection.find({}, {"_id": 0})}
+    assert docs["1"]["pets"] == ["Bo", "ace", "max"]
+    # Changed documents get a new revision (the read models reload them), sorted ones are left alone
+    assert docs["1"]["_rev"] == 5
+    assert docs["2"] == {"id": "2", "pets": ["ace", "bo"], "_rev": 1}
+    assert docs["3"] == {"id": "3", "pets": []}
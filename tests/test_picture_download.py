@@ -0,0 +1,107 @@
+# - tester pytest file for the picture downloads of pet-store -
+# A picture is accepted by its first bytes (JPEG/PNG signature) whatever its Content-Type, refused once
+# it is larger than PICTURE_MAX_BYTES, and a refused or broken download leaves no file behind.
+
+import os
+
+import pytest
+
+from conftest import PNG, FakeResponse
+
+JPEG = b"\xff\xd8\xff\xe0" + b"y" * 100
+URL = "http://pictures.example/pic"
+
+
+@pytest.fixture
+def pets_url(store_client):
+    pet_type_id = store_client.post("/pet-types", json={"type": "Golden Retriever"}).get_json()["id"]
+    return f"/pet-types/{pet_type_id}/pets"
+
+
+def _create(client, pets_url, url=URL):
+    return client.post(pets_url, json={"name": "rex", "picture-url": url})
+
+
+# Files in the picture directory of store 1 (which holds the directories of the other stores)
+def _files(pet_store):
+    pictures_dir = pet_store.STORES["1"].pictures_dir
+    return sorted(name for name in os.listdir(pictures_dir) if os.path.isfile(os.path.join(pictures_dir, name)))
+
+
+@pytest.mark.parametrize("body, content_type, filename", [
+    (PNG, "image/png", "image1.png"),
+    (JPEG, "image/jpeg", "image1.jpg"),
+    # Mislabelled pictures - the signature decides
+    (PNG, "application/octet-stream", "image1.png"),
+    (JPEG, None, "image1.jpg"),
+], ids=["png", "jpeg", "png-as-octet-stream", "jpeg-untyped"])
+def test_picture_is_typed_by_its_signature(pet_store, store_client, internet, pets_url, body, content_type,
+                                           filename):
+    headers = {"Content-Type": content_type} if content_type else {}
+    internet.pictures[URL] = FakeResponse(body=body, headers=headers)
+
+    resp = _create(store_client, pets_url)
+    assert resp.status_code == 201
+    assert resp.get_json()["picture"] == filename
+    assert _files(pet_store) == [filename]
+
+    picture = store_client.get("/pictures/" + filename)
+    assert picture.data == body
+    assert picture.mimetype == ("image/png" if filename.endswith(".png") else "image/jpeg")
+
+
+@pytest.mark.parametrize("body", [b"<html>not a picture</html>", PNG[:4], b""], ids=["html", "short", "empty"])
+def test_body_without_signature_is_refused(pet_store, store_client, internet, pets_url, body):
+    internet.pictures[URL] = FakeResponse(body=body, headers={"Content-Type": "image/png"})
+
+    assert _create(store_client, pets_url).status_code == 400
+    assert _files(pet_store) == []
+    assert store_client.get(pets_url).get_json() == []
+
+
+def test_declared_size_over_the_cap_is_refused_before_reading(pet_store, store_client, internet, pets_url,
+                                                               monkeypatch):
+    monkeypatch.setattr(pet_store, "PICTURE_MAX_BYTES", 64)
+    read = []
+
+    class Declared(FakeResponse):
+        def iter_content(self, chunk_size):
+            read.append(chunk_size)
+            return super().iter_content(chunk_size)
+
+    internet.pictures[URL] = Declared(body=PNG, headers={"Content-Length": str(len(PNG))})
+
+    assert _create(store_client, pets_url).status_code == 400
+    assert read == []
+    assert internet.pictures[URL].closed
+    assert _files(pet_store) == []
+
+
+def test_streamed_size_over_the_cap_is_refused(pet_store, store_client, internet, pets_url, monkeypatch):
+    monkeypatch.setattr(pet_store, "PICTURE_MAX_BYTES", 64)
+    # No Content-Length (chunked) - the running byte count trips the cap
+    internet.pictures[URL] = FakeResponse(body=PNG[:8] + b"x" * 20000)
+
+    assert _create(store_client, pets_url).status_code == 400
+    assert _files(pet_store) == []
+
+    internet.pictures[URL] = FakeResponse(body=PNG[:64])
+    assert _create(store_client, pets_url).status_code == 201
+
+
+def test_broken_download_removes_the_temp_file(pet_store, store_client, internet, pets_url):
+    class Broken(FakeResponse):
+        def iter_content(self, chunk_size):
+            yield PNG
+            assert _files(pet_store)[0].startswith(pet_store.PICTURE_TMP_PREFIX)
+            raise ConnectionError("connection reset")
+
+    internet.pictures[URL] = Broken()
+
+    assert _create(store_client, pets_url).status_code == 400
+    assert _files(pet_store) == []
+
+
+def test_failed_download_is_refused(pet_store, store_client, internet, pets_url):
+    assert _create(store_client, pets_url, "http://pictures.example/missing").status_code == 400
+    assert _files(pet_store) == []
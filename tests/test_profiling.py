@@ -0,0 +1,93 @@
+# - tester pytest file for the per-request profiler (pet-store and pet-order) -
+# Checks that requests carrying the profile token get a profile file, that only one deterministic
+# (cProfile) profile runs at a time, and that a profiler which cannot start never fails the request.
+
+import cProfile
+import os
+import threading
+
+import pytest
+
+flask = pytest.importorskip("flask")
+
+import profiling
+from profiling import init_profiling
+
+TOKEN = "secret"
+
+
+def _app(monkeypatch, tmp_path, mode, view=None):
+    monkeypatch.setenv("PROFILE_TOKEN", TOKEN)
+    monkeypatch.setenv("PROFILE_MODE", mode)
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILE_MAX_PER_MINUTE", "100")
+    app = flask.Flask("profiling")
+
+    @app.route("/pets")
+    def pets():
+        if view is not None:
+            view()
+        return flask.jsonify([])
+
+    return app, init_profiling(app, "test")
+
+
+def _get(app, profiled=True):
+    headers = {profiling.PROFILE_HEADER: TOKEN} if profiled else {}
+    return app.test_client().get("/pets", headers=headers)
+
+
+@pytest.mark.parametrize("mode, suffix", [("deterministic", ".prof"), ("sampling", ".folded")])
+def test_requested_profile_is_written(monkeypatch, tmp_path, mode, suffix):
+    app, _ = _app(monkeypatch, tmp_path, mode)
+
+    resp = _get(app)
+    assert resp.status_code == 200
+    name = resp.headers["X-Profile-File"]
+    assert name.startswith("test-") and name.endswith("-GET-pets" + suffix)
+    assert os.path.exists(tmp_path / name)
+
+    assert "X-Profile-File" not in _get(app, profiled=False).headers
+
+
+def test_one_deterministic_profile_at_a_time(monkeypatch, tmp_path):
+    inside, release = threading.Event(), threading.Event()
+    first = []
+
+    def view():
+        if not first:
+            first.append(True)
+            inside.set()
+            release.wait(5)
+
+    app, _ = _app(monkeypatch, tmp_path, "deterministic", view)
+    results = []
+    slow = threading.Thread(target=lambda: results.append(_get(app)))
+    slow.start()
+    assert inside.wait(5)
+
+    # The first profile still runs - this request is served unprofiled
+    resp = _get(app)
+    assert resp.status_code == 200
+    assert "X-Profile-File" not in resp.headers
+
+    release.set()
+    slow.join(5)
+    assert "X-Profile-File" in results[0].headers
+    # The profiler is free again
+    assert "X-Profile-File" in _get(app).headers
+
+
+def test_profiler_that_cannot_start_does_not_fail_the_request(monkeypatch, tmp_path):
+    class TakenProfile(cProfile.Profile):
+        def enable(self, *args, **kwargs):
+            raise ValueError("Another profiling tool is already active")
+
+    app, _ = _app(monkeypatch, tmp_path, "deterministic")
+    monkeypatch.setattr(cProfile, "Profile", TakenProfile)
+    resp = _get(app)
+    assert resp.status_code == 200
+    assert "X-Profile-File" not in resp.headers
+
+    monkeypatch.undo()
+    assert "X-Profile-File" in _get(app).headers
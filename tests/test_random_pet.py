@@ -0,0 +1,127 @@
+# - tester pytest file for GET /random-pet (pet-store) and the purchases that use it (pet-order) -
+# The store resolves the type by name (case-insensitively) and returns one random pet with its type id,
+# so a purchase without a pet name costs one small request to a store and never lists its pets.
+
+import random
+from urllib.parse import urlparse
+
+import pytest
+
+from conftest import FakeResponse
+
+pytest.importorskip("flask")
+
+from store_routing import STORE_HEADER
+
+NAMES = ["ace", "bo", "cy"]
+
+
+# mongomock has no $rand - each aggregation gets a random number in its place
+def _with_rand(value):
+    if value == {"$rand": {}}:
+        return random.random()
+    if isinstance(value, dict):
+        return {k: _with_rand(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_with_rand(v) for v in value]
+    return value
+
+
+@pytest.fixture(autouse=True)
+def rand(pet_store, monkeypatch):
+    for store in pet_store.STORES.values():
+        aggregate = store.pet_types.aggregate
+        monkeypatch.setattr(store.pet_types, "aggregate",
+                            lambda pipeline, aggregate=aggregate, **kwargs: aggregate(_with_rand(pipeline), **kwargs))
+
+
+def _add_pets(client, type_name, names, store="1"):
+    headers = {STORE_HEADER: store}
+    pet_type_id = client.post("/pet-types", json={"type": type_name}, headers=headers).get_json()["id"]
+    for name in names:
+        assert client.post(f"/pet-types/{pet_type_id}/pets", json={"name": name}, headers=headers).status_code == 201
+    return pet_type_id
+
+
+def test_type_is_resolved_by_name(store_client):
+    _add_pets(store_client, "Abyssinian", ["zed"])
+    pet_type_id = _add_pets(store_client, "Golden Retriever", NAMES)
+
+    picked = set()
+    for type_name in ["Golden Retriever", "golden retriever", "GOLDEN RETRIEVER"] * 20:
+        resp = store_client.get("/random-pet", query_string={"type": type_name})
+        assert resp.status_code == 200
+        body = resp.get_json()
+        assert body["pet-type-id"] == pet_type_id
+        assert body["pet"] == {"name": body["pet"]["name"], "birthdate": "NA", "picture": "NA"}
+        picked.add(body["pet"]["name"])
+    # Random - every pet comes up sooner or later (all but certain in 60 draws)
+    assert picked == set(NAMES)
+
+
+def test_no_pet_is_404(store_client):
+    _add_pets(store_client, "Golden Retriever", [])
+    assert store_client.get("/random-pet", query_string={"type": "Golden Retriever"}).status_code == 404
+    assert store_client.get("/random-pet", query_string={"type": "Poodle"}).status_code == 404
+    assert store_client.get("/random-pet").status_code == 400
+
+    # Sold out
+    pet_type_id = _add_pets(store_client, "Abyssinian", ["zed"])
+    assert store_client.delete(f"/pet-types/{pet_type_id}/pets/zed").status_code == 204
+    assert store_client.get("/random-pet", query_string={"type": "Abyssinian"}).status_code == 404
+
+
+# Sends the store calls of pet-order to the pet-store app: STORE1_URL is store "1", STORE2_URL store "2"
+@pytest.fixture
+def connected(pet_order, pet_store, store_client, stores, monkeypatch):
+    stores_by_url = {pet_order.STORE1_URL: "1", pet_order.STORE2_URL: "2"}
+    sent = []
+
+    def request(method, url, params=None, headers=None, **kwargs):
+        base = next(base for base in stores_by_url if url.startswith(base))
+        path = urlparse(url).path
+        sent.append((stores_by_url[base], method, path))
+        resp = store_client.open(path, method=method, query_string=params,
+                                 headers={STORE_HEADER: stores_by_url[base]})
+        return FakeResponse(resp.status_code, data=resp.get_json(silent=True))
+
+    monkeypatch.setattr(pet_order.STORE_SESSION, "request", request)
+    return sent
+
+
+def _purchase(pet_order, **fields):
+    return pet_order.app.test_client().post("/purchases", json={"purchaser": "dana", **fields})
+
+
+def test_purchase_takes_a_random_pet_without_listing_pets(pet_order, store_client, connected):
+    _add_pets(store_client, "Poodle", NAMES, store="2")
+
+    resp = _purchase(pet_order, **{"pet-type": "poodle"})
+    assert resp.status_code == 201
+    bought = resp.get_json()
+    assert bought["store"] == 2 and bought["pet-name"] in NAMES
+
+    # Store 1 has no poodle, store 2 hands out one - then it is deleted
+    assert connected == [("1", "GET", "/random-pet"), ("2", "GET", "/random-pet"),
+                         ("2", "DELETE", f"/pet-types/1/pets/{bought['pet-name']}")]
+    remaining = store_client.get("/pet-types/1/pets", headers={STORE_HEADER: "2"}).get_json()
+    assert sorted(p["name"] for p in remaining) == sorted(set(NAMES) - {bought["pet-name"]})
+
+
+def test_purchase_of_a_named_pet_looks_up_that_pet_only(pet_order, store_client, connected):
+    _add_pets(store_client, "Poodle", NAMES)
+
+    resp = _purchase(pet_order, **{"pet-type": "Poodle", "store": 1, "pet-name": "bo"})
+    assert resp.status_code == 201
+    assert connected == [("1", "GET", "/pet-types"), ("1", "GET", "/pet-types/1/pets/bo"),
+                         ("1", "DELETE", "/pet-types/1/pets/bo")]
+
+    connected.clear()
+    assert _purchase(pet_order, **{"pet-type": "Poodle", "store": 1, "pet-name": "bo"}).status_code == 400
+    assert ("1", "DELETE", "/pet-types/1/pets/bo") not in connected
+
+
+def test_purchase_with_no_pet_anywhere_is_400(pet_order, store_client, connected):
+    _add_pets(store_client, "Poodle", [])
+    assert _purchase(pet_order, **{"pet-type": "Poodle"}).status_code == 400
+    assert [path for _, _, path in connected] == ["/random-pet", "/random-pet"]
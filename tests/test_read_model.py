@@ -0,0 +1,243 @@
+# - tester pytest file for the read model of pet-store -
+# Checks that the in-memory filters answer GET /pet-types exactly like the Mongo query they replace,
+# and that refreshes and polls keep the records in step with the collection.
+
+import itertools
+from bisect import insort
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+from pymongo import ReturnDocument
+
+from read_model import PetTypeRecord, ReadModel, lowercase_fields, pet_type_query
+
+
+def _pet_type(type_id, type_name, family, genus, attributes, lifespan, pets=()):
+    doc = {
+        "id": type_id,
+        "type": type_name,
+        "family": family,
+        "genus": genus,
+        "attributes": attributes,
+        "lifespan": lifespan,
+        "pets": sorted(pets),
+        "_pets": {name: {"name": name, "birthdate": "NA", "picture": "NA"} for name in pets},
+        "_birthdates": [],
+        "_attributes": sorted({a.lower() for a in attributes}),
+        "_rev": 0,
+    }
+    doc.update(lowercase_fields(doc))
+    return doc
+
+
+PET_TYPES = [
+    _pet_type("1", "Golden Retriever", "Canidae", "Canis", ["Loyal", "outgoing", "friendly"], 12, ["lander"]),
+    _pet_type("2", "Abyssinian", "Felidae", "Felis", ["Intelligent", "curious"], 13),
+    _pet_type("3", "Bulldog", "Canidae", "Canis", ["Friendly", "calm"], None, ["lanky", "max"]),
+    _pet_type("4", "Siamese (Seal Point)", "Felidae", "Felis", [], 15),
+    _pet_type("10", "Poodle", "Canidae", "Canis", ["intelligent", "Active"], 12),
+]
+
+SPECS = [
+    {},
+    {"all": ["friendly"]},
+    {"all": ["friendly", "calm"]},
+    {"all": ["friendly", "curious"]},
+    {"any": ["curious", "calm"]},
+    {"any": ["unknown"]},
+    {"any": []},
+    {"id": "1"},
+    {"id": "10"},
+    {"type": "golden retriever"},
+    {"type": "GOLDEN"},
+    {"type": "siamese (seal point)"},       # regex metacharacters are matched literally
+    {"type": "Siamese .Seal Point."},
+    {"family": "canidae"},
+    {"genus": "FELIS"},
+    {"lifespan": 12},
+    {"lifespan": 14},
+    {"family": "Canidae", "lifespan": 12, "all": ["intelligent"]},
+    {"genus": "canis", "any": ["loyal", "calm"]},
+    {"family": "Felidae", "all": ["friendly"]},
+]
+
+
+@pytest.fixture
+def collection():
+    col = mongomock.MongoClient().db.pet_store1
+    col.insert_many([dict(doc) for doc in PET_TYPES])
+    return col
+
+
+def _mongo_ids(collection, spec):
+    query = pet_type_query(spec) if spec else {}
+    return [doc["id"] for doc in collection.find(query)]
+
+
+@pytest.mark.parametrize("spec", SPECS, ids=[str(spec) for spec in SPECS])
+def test_filters_match_the_mongo_query(collection, spec):
+    model = ReadModel(collection)
+    model.load()
+    assert [pt["id"] for pt in model.find(spec)] == _mongo_ids(collection, spec)
+
+
+def test_combined_filters_match_the_mongo_query(collection):
+    model = ReadModel(collection)
+    model.load()
+    single = [spec for spec in SPECS if len(spec) == 1]
+    for first, second in itertools.combinations(single, 2):
+        if first.keys() == second.keys():
+            continue
+        spec = {**first, **second}
+        assert [pt["id"] for pt in model.find(spec)] == _mongo_ids(collection, spec), spec
+
+
+# MongoDB's {"$all": []} matches no document (mongomock matches every one, so it is checked here alone)
+def test_empty_attribute_list_matches_nothing(collection):
+    model = ReadModel(collection)
+    model.load()
+    assert model.find({"all": []}) == []
+    assert model.find({"all": [], "any": ["curious"]}) == []
+
+
+def test_records_serialize_like_the_api(collection):
+    model = ReadModel(collection)
+    model.load()
+    assert model.get("1").to_dict() == {
+        "id": "1", "type": "Golden Retriever", "family": "Canidae", "genus": "Canis",
+        "attributes": ["Loyal", "outgoing", "friendly"], "lifespan": 12, "pets": ["lander"],
+    }
+
+
+def test_refresh_reloads_a_written_pet_type(collection):
+    model = ReadModel(collection)
+    model.load()
+    collection.update_one({"id": "2"}, {"$set": {"pets": ["tom"]}, "$inc": {"_rev": 1}})
+
+    model.refresh("2")
+
+    assert model.get("2").names == ("tom",)
+    collection.delete_one({"id": "2"})
+    model.refresh("2")
+    assert model.get("2") is None
+
+
+def test_refresh_never_goes_back_to_an_older_revision(collection):
+    model = ReadModel(collection)
+    model.load()
+    stale = collection.find_one({"id": "1"}, {"_id": 0})
+    collection.update_one({"id": "1"}, {"$set": {"pets": ["lander", "rex"]}, "$inc": {"_rev": 1}})
+    model.refresh("1")
+
+    # A refresh that read the document before the write finishes last
+    model.collection = mongomock.MongoClient().db.stale
+    model.collection.insert_one(stale)
+    model.refresh("1")
+
+    assert model.get("1").names == ("lander", "rex")
+
+
+def test_poll_picks_up_writes_of_other_processes(collection):
+    changed = []
+    model = ReadModel(collection, on_change=changed.append)
+    model.load()
+    collection.update_one({"id": "3"}, {"$set": {"lifespan": 11}, "$inc": {"_rev": 1}})
+    collection.delete_one({"id": "4"})
+    collection.insert_one(_pet_type("11", "Beagle", "Canidae", "Canis", ["curious"], 13))
+
+    assert sorted(model.poll()) == ["11", "3", "4"]
+    assert sorted(changed) == ["11", "3", "4"]
+    assert model.get("3").lifespan == 11
+    assert model.get("4") is None
+    assert [pt["id"] for pt in model.find({"any": ["curious"]})] == _mongo_ids(collection, {"any": ["curious"]})
+    assert model.poll() == []
+
+
+# The pet writes of app.py on pet type "3": (revision produced, change passed to apply_pet)
+def _write(collection, update):
+    doc = collection.find_one_and_update({"id": "3"}, update, projection={"_id": 0, "_rev": 1},
+                                         return_document=ReturnDocument.AFTER)
+    return doc["_rev"]
+
+
+def _create_pet(collection, name, birth_key=None):
+    pet = {"name": name, "birthdate": birth_key or "NA", "picture": "NA"}
+    push = {"pets": {"$each": [name], "$sort": 1}}
+    if birth_key:
+        push["_birthdates"] = {"$each": [{"d": birth_key, "n": name}], "$sort": {"d": 1, "n": 1}}
+    rev = _write(collection, {"$set": {f"_pets.{name}": pet}, "$push": push, "$inc": {"_rev": 1}})
+    return rev, {"pet": pet, "birth_key": birth_key}
+
+
+def _update_pet(collection, old_key, new_name, birth_key=None):
+    pt = collection.find_one({"id": "3"}, {"_id": 0})
+    new_key = new_name.lower()
+    pet = pt["_pets"][old_key]
+    if new_key != old_key:
+        del pt["_pets"][old_key]
+        pt["_pets"][new_key] = pet
+        pt["pets"] = [n for n in pt["pets"] if n.lower() != old_key]
+        insort(pt["pets"], new_name)
+    pet.update(name=new_name, birthdate=birth_key or "NA", picture="NA")
+    index = [e for e in pt["_birthdates"] if e["n"] != old_key]
+    if birth_key:
+        insort(index, {"d": birth_key, "n": new_key}, key=lambda e: (e["d"], e["n"]))
+    pt["_birthdates"] = index
+    del pt["_rev"]
+    rev = _write(collection, {"$set": pt, "$inc": {"_rev": 1}})
+    return rev, {"old_key": old_key, "pet": pet, "birth_key": birth_key}
+
+
+def _delete_pet(collection, key):
+    pt = collection.find_one({"id": "3"}, {"_id": 0})
+    del pt["_pets"][key]
+    names = [n for n in pt["pets"] if n.lower() != key]
+    rev = _write(collection, {"$set": {"_pets": pt["_pets"], "pets": names},
+                              "$pull": {"_birthdates": {"n": key}}, "$inc": {"_rev": 1}})
+    return rev, {"old_key": key}
+
+
+def _state(record):
+    return (record.to_dict(), [(key, pet.to_dict()) for key, pet in record.pets.items()],
+            record.birthdate_keys, record.birthdates, record.rev)
+
+
+def test_pet_writes_are_applied_without_reloading(collection):
+    model = ReadModel(collection)
+    model.load()
+    model.refresh = lambda pet_type_id: pytest.fail("reloaded")
+
+    # mongomock's $push $sort orders by one (random) key of {"d": 1, "n": 1} - names follow the birthdates
+    writes = [
+        lambda: _create_pet(collection, "rex", "2020-05-14"),
+        lambda: _create_pet(collection, "abe"),
+        lambda: _create_pet(collection, "bo", "2020-03-01"),
+        lambda: _update_pet(collection, "rex", "Rex", "2019-01-01"),     # same key
+        lambda: _update_pet(collection, "lanky", "Alpha", "2000-01-01"),  # renamed
+        lambda: _update_pet(collection, "bo", "bo"),                      # birthdate dropped
+        lambda: _delete_pet(collection, "max"),
+        lambda: _delete_pet(collection, "rex"),
+    ]
+    for write in writes:
+        before = model.get("3")
+        rev, change = write()
+        model.apply_pet("3", rev, **change)
+
+        assert _state(model.get("3")) == _state(PetTypeRecord(collection.find_one({"id": "3"}, {"_id": 0})))
+        assert _state(before) != _state(model.get("3"))   # the old record is left untouched
+    assert model.get("3").pets_born_between(None, None) == [
+        {"name": "Alpha", "birthdate": "2000-01-01", "picture": "NA"}]
+
+
+def test_pet_write_after_an_unseen_write_reloads(collection):
+    model = ReadModel(collection)
+    model.load()
+    # Another process wrote first - the record misses a revision
+    _create_pet(collection, "rex")
+    rev, change = _create_pet(collection, "abe")
+
+    model.apply_pet("3", rev, **change)
+
+    assert model.get("3").names == ("abe", "lanky", "max", "rex")
+    assert model.get("3").rev == rev
@@ -0,0 +1,128 @@
+# - tester pytest file for the response cache of pet-store -
+# Checks that writes drop exactly the entries they affect and that a response read before a write
+# is never cached after it.
+
+import pytest
+
+werkzeug = pytest.importorskip("werkzeug")
+from werkzeug.datastructures import MultiDict
+
+import response_cache
+from response_cache import LIST_TAG, ResponseCache
+
+
+def _put(cache, path, tag, body=b"[]", args=None):
+    key = cache.make_key(path, MultiDict(args or {}))
+    cache.put(key, tag, body, "application/json", cache.generation)
+    return key
+
+
+def test_keys_ignore_query_arg_order():
+    first = ResponseCache.make_key("/pet-types", MultiDict([("family", "Canidae"), ("genus", "Canis")]))
+    second = ResponseCache.make_key("/pet-types", MultiDict([("genus", "Canis"), ("family", "Canidae")]))
+    assert first == second
+    assert first != ResponseCache.make_key("/pet-types", MultiDict([("family", "Felidae")]))
+
+
+def test_hit_returns_body_and_etag():
+    cache = ResponseCache()
+    key = _put(cache, "/pet-types/1", "1", b'{"id":"1"}')
+
+    entry = cache.get(key)
+    assert entry.body == b'{"id":"1"}'
+    assert entry.etag == cache.get(key).etag
+    assert (cache.hits, cache.misses) == (2, 0)
+    assert cache.get(cache.make_key("/pet-types/2", MultiDict())) is None
+    assert cache.misses == 1
+
+
+def test_invalidate_drops_the_pet_type_and_every_list():
+    cache = ResponseCache()
+    one = _put(cache, "/pet-types/1", "1")
+    one_pets = _put(cache, "/pet-types/1/pets", "1")
+    two = _put(cache, "/pet-types/2", "2")
+    everything = _put(cache, "/pet-types", LIST_TAG)
+    filtered = _put(cache, "/pet-types", LIST_TAG, args={"family": "Canidae"})
+
+    cache.invalidate("1")
+
+    assert cache.get(one) is None
+    assert cache.get(one_pets) is None
+    assert cache.get(everything) is None
+    assert cache.get(filtered) is None
+    assert cache.get(two) is not None
+
+
+def test_invalidate_accepts_integer_ids():
+    cache = ResponseCache()
+    key = _put(cache, "/pet-types/7", "7")
+    cache.invalidate(7)
+    assert cache.get(key) is None
+
+
+def test_put_after_invalidation_is_not_cached():
+    cache = ResponseCache()
+    key = cache.make_key("/pet-types/1", MultiDict())
+    generation = cache.generation       # read before the database query
+    cache.invalidate("1")               # a write lands while the response is built
+
+    entry = cache.put(key, "1", b'{"stale":true}', "application/json", generation)
+    assert entry.body == b'{"stale":true}'      # still served to its own request
+    assert cache.get(key) is None
+
+    cache.put(key, "1", b'{"fresh":true}', "application/json", cache.generation)
+    assert cache.get(key).body == b'{"fresh":true}'
+
+
+def test_clear_drops_everything_and_bumps_the_generation():
+    cache = ResponseCache()
+    keys = [_put(cache, f"/pet-types/{i}", str(i)) for i in range(3)]
+    generation = cache.generation
+
+    cache.clear()
+
+    assert cache.generation == generation + 1
+    assert all(cache.get(key) is None for key in keys)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    first = _put(cache, "/pet-types/1", "1")
+    second = _put(cache, "/pet-types/2", "2")
+    cache.get(first)                    # second is now the least recently used
+    third = _put(cache, "/pet-types/3", "3")
+
+    assert cache.get(second) is None
+    assert cache.get(first) is not None
+    assert cache.get(third) is not None
+    # The evicted key left its tag too - invalidating it touches nothing else
+    cache.invalidate("2")
+    assert cache.get(first) is not None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(ttl=5)
+    key = _put(cache, "/pet-types", LIST_TAG)
+
+    now[0] += 4
+    assert cache.get(key) is not None
+    now[0] += 2
+    assert cache.get(key) is None
+
+
+def test_compressed_variants_are_computed_once():
+    cache = ResponseCache()
+    key = _put(cache, "/pet-types", LIST_TAG, b"[1,2,3]")
+    calls = []
+
+    def compress(body, encoding):
+        calls.append(encoding)
+        return encoding.encode() + body
+
+    entry = cache.get(key)
+    assert entry.variant("gzip", compress) == b"gzip[1,2,3]"
+    assert entry.variant("gzip", compress) == b"gzip[1,2,3]"
+    assert entry.variant("br", compress) == b"br[1,2,3]"
+    assert calls == ["gzip", "br"]
@@ -0,0 +1,38 @@
+# - tester pytest file for the helper modules both services ship -
+# pet-store and pet-order are built from their own directories, so the helper modules they share are
+# copied into both. Checks that every copy is identical (line endings aside) - edit both or neither.
+
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ["pet_store", "pet_order"]
+SHARED_MODULES = [
+    "admission.py",
+    "breaker.py",
+    "compression.py",
+    "db.py",
+    "json_provider.py",
+    "metrics.py",
+    "profiling.py",
+    "singleflight.py",
+    "tracing.py",
+]
+
+
+def _source(service, name):
+    with open(os.path.join(ROOT, service, name), "rb") as f:
+        return f.read().replace(b"\r\n", b"\n")
+
+
+@pytest.mark.parametrize("name", SHARED_MODULES)
+def test_shared_module_is_identical_in_both_services(name):
+    assert _source(SERVICES[0], name) == _source(SERVICES[1], name)
+
+
+# A module found in both service directories must be listed above (and so kept identical)
+def test_every_module_of_both_services_is_listed():
+    modules = [{name for name in os.listdir(os.path.join(ROOT, service)) if name.endswith(".py")}
+               for service in SERVICES]
+    assert modules[0] & modules[1] == set(SHARED_MODULES)
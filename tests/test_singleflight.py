@@ -0,0 +1,137 @@
+# - tester pytest file for request coalescing (pet-store and pet-order) -
+# Concurrent callers with the same key share one execution and its result or exception, a waiter gives up
+# after the timeout, and pet-order's type lookups are keyed case-insensitively.
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from prometheus_client import REGISTRY
+from singleflight import SingleFlight, SingleFlightTimeout
+
+
+def _calls(name, role):
+    return REGISTRY.get_sample_value("singleflight_calls_total", {"lookup": name, "role": role}) or 0
+
+
+# Waits until `count` callers wait for the call of `name`
+def _wait_for_waiters(name, count):
+    deadline = time.monotonic() + 5
+    while _calls(name, "shared") < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+# Runs flight.do(key, fn) on `count` threads: the leader blocks in fn until all the others wait for it.
+# Returns what every caller got (result or exception)
+def _call_concurrently(flight, key, fn, count):
+    release = threading.Event()
+    outcomes = []
+    lock = threading.Lock()
+
+    def blocked():
+        release.wait(5)
+        return fn()
+
+    def call():
+        try:
+            outcome = flight.do(key, blocked)
+        except Exception as e:
+            outcome = e
+        with lock:
+            outcomes.append(outcome)
+
+    shared = _calls(flight.name, "shared")
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for t in threads:
+        t.start()
+    _wait_for_waiters(flight.name, shared + count - 1)
+    release.set()
+    for t in threads:
+        t.join(5)
+    return outcomes
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight("test-share")
+    executions = []
+
+    outcomes = _call_concurrently(flight, "poodle", lambda: executions.append(1) or "10", 8)
+
+    assert executions == [1]
+    assert outcomes == ["10"] * 8
+    # The flight is over - the next call runs again
+    assert flight.do("poodle", lambda: "11") == "11"
+
+
+def test_different_keys_do_not_share():
+    flight = SingleFlight("test-keys")
+
+    # Were "beagle" waiting for the "poodle" call, this would deadlock
+    assert flight.do("poodle", lambda: flight.do("beagle", lambda: "b") + "a") == "ba"
+
+
+def test_leader_exception_reaches_every_waiter():
+    flight = SingleFlight("test-error")
+    error = ConnectionError("store down")
+
+    def fail():
+        raise error
+
+    outcomes = _call_concurrently(flight, "poodle", fail, 5)
+
+    assert outcomes == [error] * 5
+    assert flight.do("poodle", lambda: "10") == "10"
+
+
+def test_waiter_gives_up_after_the_timeout():
+    flight = SingleFlight("test-timeout", timeout=0.05)
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=("poodle", lambda: release.wait(5)))
+    leader.start()
+    while "poodle" not in flight._calls:
+        time.sleep(0.001)
+
+    with pytest.raises(SingleFlightTimeout) as raised:
+        flight.do("poodle", lambda: pytest.fail("ran twice"))
+    assert raised.value.args == (504, "test-timeout")
+    assert _calls("test-timeout", "timeout") == 1
+
+    release.set()
+    leader.join(5)
+
+
+def test_type_lookups_ignore_the_case_of_the_type(pet_order, monkeypatch):
+    release = threading.Event()
+    lookups = []
+
+    def lookup(base_url, pet_type):
+        release.wait(5)
+        lookups.append((base_url, pet_type))
+        return "3"
+
+    monkeypatch.setattr(pet_order, "lookup_type_id", lookup)
+    flight = pet_order.TYPE_LOOKUPS
+    base_url = pet_order.STORE1_URL
+    names = ["Poodle", "POODLE", "poodle", "pOODLE"]
+
+    # Every spelling waits for the same lookup
+    results = []
+    shared = _calls(flight.name, "shared")
+    threads = [threading.Thread(target=lambda n=n: results.append(pet_order.find_type_id(base_url, n)))
+               for n in names]
+    for t in threads:
+        t.start()
+    _wait_for_waiters(flight.name, shared + len(names) - 1)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert results == ["3"] * len(names)
+    assert len(lookups) == 1
+    # ...but the stores do not share lookups
+    assert pet_order.find_type_id(pet_order.STORE2_URL, "Poodle") == "3"
+    assert lookups[1] == (pet_order.STORE2_URL, "Poodle")
@@ -0,0 +1,105 @@
+# - tester pytest file for the stores of one pet-store process -
+# A request selects its store by the /stores/<id> path prefix or the X-Store-Id header (default STORE_ID).
+# Unknown stores are 404, and the stores share nothing: collections, ID counters, picture directories and
+# response caches are their own.
+
+import os
+
+import pytest
+
+from conftest import PNG
+
+pytest.importorskip("flask")
+
+from store_routing import STORE_HEADER
+
+PICTURE_URL = "http://pictures.example/rex.png"
+
+
+def _create_type(client, store, type_name, via="header"):
+    if via == "header":
+        resp = client.post("/pet-types", json={"type": type_name}, headers={STORE_HEADER: store})
+    else:
+        resp = client.post(f"/stores/{store}/pet-types", json={"type": type_name})
+    assert resp.status_code == 201
+    return resp.get_json()
+
+
+def _types(client, path="/pet-types", **headers):
+    resp = client.get(path, headers=headers)
+    assert resp.status_code == 200
+    return [pt["type"] for pt in resp.get_json()]
+
+
+@pytest.mark.parametrize("via", ["header", "prefix"])
+def test_header_and_prefix_select_the_store(store_client, via):
+    assert _create_type(store_client, "2", "Poodle", via)["id"] == "1"
+    assert _create_type(store_client, "1", "Abyssinian", via)["id"] == "1"
+
+    assert _types(store_client, "/stores/2/pet-types") == ["Poodle"]
+    assert _types(store_client, **{STORE_HEADER: "2"}) == ["Poodle"]
+    # No store named - STORE_ID
+    assert _types(store_client) == ["Abyssinian"]
+    assert _types(store_client, "/stores/1/pet-types") == ["Abyssinian"]
+    # The prefix wins over the header
+    assert _types(store_client, "/stores/1/pet-types", **{STORE_HEADER: "2"}) == ["Abyssinian"]
+
+    assert store_client.get("/stores/2/pet-types/1").get_json()["type"] == "Poodle"
+    assert store_client.delete("/stores/2/pet-types/1").status_code == 204
+    assert _types(store_client, "/stores/2/pet-types") == []
+    assert _types(store_client) == ["Abyssinian"]
+
+
+@pytest.mark.parametrize("path, headers", [
+    ("/stores/9/pet-types", {}),
+    ("/pet-types", {STORE_HEADER: "9"}),
+    ("/stores/9/pictures/image1.png", {}),
+], ids=["prefix", "header", "picture"])
+def test_unknown_store_is_404(pet_store, store_client, path, headers):
+    assert store_client.get(path, headers=headers).status_code == 404
+    assert store_client.post(path, json={"type": "Poodle"}, headers=headers).status_code in (404, 405)
+    assert all(store.pet_types.count_documents({}) == 0 for store in pet_store.STORES.values())
+
+
+def test_stores_keep_their_pictures(pet_store, store_client, internet):
+    internet.pictures[PICTURE_URL] = PNG
+    for store in ("1", "2"):
+        _create_type(store_client, store, "Poodle")
+        resp = store_client.post(f"/stores/{store}/pet-types/1/pets", json={"name": "rex", "picture-url": PICTURE_URL})
+        # The image counters are per store too
+        assert resp.get_json()["picture"] == "image1.png"
+
+    store1, store2 = pet_store.STORES["1"], pet_store.STORES["2"]
+    assert store1.pictures_dir != store2.pictures_dir
+    for store in (store1, store2):
+        assert os.path.isfile(os.path.join(store.pictures_dir, "image1.png"))
+
+    # Deleting the pet of store 2 removes its picture only
+    assert store_client.delete("/stores/2/pet-types/1/pets/rex").status_code == 204
+    assert store_client.get("/stores/2/pictures/image1.png").status_code == 404
+    assert store_client.get("/stores/1/pictures/image1.png").data == PNG
+    # A store does not serve the directories of the others
+    assert store_client.get("/pictures/store2").status_code == 404
+
+
+def test_stores_keep_their_caches(pet_store, store_client):
+    store1, store2 = pet_store.STORES["1"], pet_store.STORES["2"]
+    _create_type(store_client, "1", "Poodle")
+    first = store_client.get("/pet-types")
+    generation, hits = store1.response_cache.generation, store1.response_cache.hits
+
+    # A write to store 2 leaves the cached responses of store 1 alone
+    _create_type(store_client, "2", "Abyssinian")
+    again = store_client.get("/pet-types")
+    assert again.headers["ETag"] == first.headers["ETag"]
+    assert store1.response_cache.generation == generation
+    assert store1.response_cache.hits == hits + 1
+    assert _types(store_client, "/stores/2/pet-types") == ["Abyssinian"]
+
+    # ...and the same the other way round
+    store_client.get("/stores/2/pet-types")
+    hits = store2.response_cache.hits
+    _create_type(store_client, "1", "Abyssinian")
+    assert _types(store_client) == ["Poodle", "Abyssinian"]
+    assert _types(store_client, "/stores/2/pet-types") == ["Abyssinian"]
+    assert store2.response_cache.hits == hits + 1